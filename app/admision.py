@@ -0,0 +1,287 @@
+# app/admision.py
+# Proteccion ante clientes abusivos y sobrecarga.
+# - Limite de tasa: una cubeta de tokens por usuario y otra por IP. Cada peticion
+#   consume un token de cada una; sin tokens se responde 429 con Retry-After.
+# - Control de admision: un maximo de peticiones atendidas a la vez y una cola
+#   acotada para las demas. Si la cola esta llena, si la espera en la cola viene
+#   superando el objetivo o si una peticion espera demasiado, se responde 503 en
+#   lugar de acumular trabajo: la latencia de las peticiones admitidas se mantiene acotada.
+# Las peticiones reenviadas entre shards ya pasaron por estos controles en el
+# shard que las recibio y no vuelven a pasar; se reconocen por el puerto interno
+# por el que llegan, no solo por la cabecera, que cualquier cliente puede enviar.
+import asyncio
+import itertools
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from app.config import (
+    ESPERA_MAXIMA_SEGUNDOS,
+    ESPERA_OBJETIVO_SEGUNDOS,
+    MAX_COLA,
+    MAX_CONCURRENTES,
+    RAFAGA_POR_IP,
+    RAFAGA_POR_USUARIO,
+    TASA_POR_IP,
+    TASA_POR_USUARIO,
+)
+from app.db.database import carritos_db
+from app.metricas import Contador, Medidor
+from app.shards import CABECERA_LOCAL, es_reenvio_interno, leer_cuerpo, receive_con_cuerpo, sin_cabecera_local
+from app.utils import completar_futuro, en_almacen
+
+# Rutas de monitoreo, diagnostico y documentacion: no se limitan
+RUTAS_EXENTAS = ("/metrics", "/debug", "/docs", "/redoc", "/openapi.json")
+# Streams de eventos: conexiones que duran mucho y casi no trabajan. Pasan por el
+# limite de tasa, pero no ocupan un lugar del control de admision
+RUTAS_STREAM = ("/eventos",)
+
+peticiones_rechazadas = Contador("peticiones_rechazadas_total", "Peticiones rechazadas por limite de tasa o sobrecarga, por motivo.", ("motivo",))
+
+
+class Sobrecarga(Exception):
+    """
+    La peticion no se admitio: la cola esta llena o la espera supero el limite.
+    """
+
+    def __init__(self, motivo):
+        super().__init__(motivo)
+        self.motivo = motivo
+
+
+class CubetasTokens:
+    """
+    Una cubeta de tokens por clave, con `tasa` tokens por segundo y hasta `rafaga`.
+    Las cubetas se recargan al consultarlas (O(1), sin temporizadores) y se
+    guardan en orden de uso: las que llevan inactivas el tiempo de recargarse por
+    completo son iguales a una cubeta nueva y se descartan desde el frente.
+    """
+
+    def __init__(self, tasa, rafaga):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.inactividad = rafaga / tasa if tasa > 0 else 0
+        # clave -> [tokens, ultimo_ts]
+        self._cubetas = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def activa(self):
+        return self.tasa > 0
+
+    def consumir(self, clave, ahora=None):
+        """
+        Consume un token de la cubeta de `clave`. Devuelve 0 si habia tokens o,
+        si no, los segundos que faltan para el proximo.
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            self._descartar_inactivas(ahora)
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                cubeta = self._cubetas[clave] = [self.rafaga, ahora]
+            else:
+                self._cubetas.move_to_end(clave)
+                cubeta[0] = min(self.rafaga, cubeta[0] + (ahora - cubeta[1]) * self.tasa)
+                cubeta[1] = ahora
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                return 0
+            return (1 - cubeta[0]) / self.tasa
+
+    def _descartar_inactivas(self, ahora):
+        # Cada cubeta se descarta una sola vez: O(1) amortizado por consulta
+        while self._cubetas:
+            clave, (_, ultimo_ts) = next(iter(self._cubetas.items()))
+            if ahora - ultimo_ts < self.inactividad:
+                break
+            del self._cubetas[clave]
+
+    def clear(self):
+        with self._lock:
+            self._cubetas.clear()
+
+    def __len__(self):
+        return len(self._cubetas)
+
+
+class ControlAdmision:
+    """
+    Limite global de peticiones en curso, con una cola FIFO acotada.
+    Es seguro entre hilos y entre event loops: quien espera lo hace sobre un
+    futuro de su propio loop, y al liberarse un lugar se le entrega directamente.
+    """
+
+    def __init__(self, max_concurrentes=MAX_CONCURRENTES, max_cola=MAX_COLA,
+                 espera_maxima=ESPERA_MAXIMA_SEGUNDOS, espera_objetivo=ESPERA_OBJETIVO_SEGUNDOS):
+        self.max_concurrentes = max_concurrentes
+        self.max_cola = max_cola
+        self.espera_maxima = espera_maxima
+        self.espera_objetivo = espera_objetivo
+        self.en_curso = 0
+        # Media movil de la espera en la cola de las ultimas peticiones admitidas
+        self.espera_media = 0.0
+        # turno -> [loop, futuro, admitida], en orden de llegada
+        self._cola = OrderedDict()
+        self._turnos = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self.max_concurrentes > 0
+
+    @property
+    def en_cola(self):
+        return len(self._cola)
+
+    async def entrar(self):
+        """
+        Espera un lugar. Lanza Sobrecarga si no se admite la peticion.
+        """
+        with self._lock:
+            if self.en_curso < self.max_concurrentes and not self._cola:
+                self.en_curso += 1
+                self.espera_media = 0.0
+                return
+            if len(self._cola) >= self.max_cola:
+                raise Sobrecarga("cola_llena")
+            if self.espera_media > self.espera_objetivo:
+                raise Sobrecarga("espera")
+            loop = asyncio.get_running_loop()
+            turno = next(self._turnos)
+            entrada = self._cola[turno] = [loop, loop.create_future(), False]
+
+        inicio = time.monotonic()
+        try:
+            await asyncio.wait_for(entrada[1], self.espera_maxima)
+        except BaseException as error:
+            with self._lock:
+                admitida = entrada[2]
+                if not admitida:
+                    del self._cola[turno]
+            if isinstance(error, asyncio.TimeoutError):
+                # Si se le entrego un lugar justo al vencer la espera, se lo queda
+                if not admitida:
+                    raise Sobrecarga("espera")
+            else:
+                # Peticion cancelada: si ya tenia lugar, lo libera
+                if admitida:
+                    self.salir()
+                raise
+        espera = time.monotonic() - inicio
+        with self._lock:
+            self.espera_media = 0.8 * self.espera_media + 0.2 * espera
+
+    def salir(self):
+        """
+        Libera el lugar de una peticion terminada: pasa al primero de la cola o queda libre.
+        """
+        with self._lock:
+            if self._cola:
+                _, entrada = self._cola.popitem(last=False)
+                entrada[2] = True
+                completar_futuro(entrada[0], entrada[1])
+            else:
+                self.en_curso -= 1
+
+
+async def _responder(send, status_code, detalle, reintentar_en):
+    cuerpo = json.dumps({"detail": detalle}).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(cuerpo)).encode()),
+        (b"retry-after", str(max(1, math.ceil(reintentar_en))).encode()),
+    ]
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def usuario_de_peticion(scope, cuerpo=None):
+    """
+    user_id de la peticion: el del cuerpo al crear un carrito (POST /carritos),
+    el dueño del carrito de la ruta (/carritos/{id}, /pago/{id}) o el parametro user_id.
+    La busqueda del carrito se hace con en_almacen: con SQLite no frena el event loop.
+    """
+    partes = scope["path"].strip("/").split("/")
+    if cuerpo is not None:
+        try:
+            user_id = json.loads(cuerpo).get("user_id")
+        except (ValueError, AttributeError):
+            user_id = None
+        if isinstance(user_id, str):
+            return user_id
+    elif partes[0] in ("carritos", "pago") and len(partes) >= 2:
+        carrito = await en_almacen(carritos_db.get, partes[1])
+        if carrito is not None:
+            return carrito.user_id
+    query = scope.get("query_string", b"")
+    if b"user_id=" in query:
+        user_id = parse_qs(query.decode()).get("user_id")
+        if user_id:
+            return user_id[0]
+    return None
+
+
+class AdmisionMiddleware:
+    """
+    Middleware ASGI con el limite de tasa por usuario y por IP (429) y el
+    control de admision global (503).
+    """
+
+    def __init__(self, app, por_usuario=None, por_ip=None, control=None):
+        self.app = app
+        self.por_usuario = limite_usuarios if por_usuario is None else por_usuario
+        self.por_ip = limite_ips if por_ip is None else por_ip
+        self.control = control_admision if control is None else control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(RUTAS_EXENTAS) or es_reenvio_interno(scope):
+            await self.app(scope, receive, send)
+            return
+        if any(k == CABECERA_LOCAL for k, _ in scope["headers"]):
+            # Un cliente no puede hacerse pasar por un reenvio entre shards
+            scope = sin_cabecera_local(scope)
+
+        ahora = time.monotonic()
+        if self.por_ip.activa and scope.get("client"):
+            espera = self.por_ip.consumir(scope["client"][0], ahora)
+            if espera:
+                peticiones_rechazadas.inc("tasa_ip")
+                await _responder(send, 429, "Demasiadas peticiones desde esta IP", espera)
+                return
+        if self.por_usuario.activa:
+            cuerpo = None
+            if scope["method"] == "POST" and scope["path"].rstrip("/") == "/carritos":
+                # El user_id viene en el cuerpo: se lee y se vuelve a entregar a la app
+                cuerpo = await leer_cuerpo(receive)
+                receive = receive_con_cuerpo(cuerpo, receive)
+            user_id = await usuario_de_peticion(scope, cuerpo)
+            espera = self.por_usuario.consumir(user_id, ahora) if user_id is not None else 0
+            if espera:
+                peticiones_rechazadas.inc("tasa_usuario")
+                await _responder(send, 429, "Demasiadas peticiones para este usuario", espera)
+                return
+
+        if not self.control.activo or scope["path"].startswith(RUTAS_STREAM):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.control.entrar()
+        except Sobrecarga as error:
+            peticiones_rechazadas.inc(error.motivo)
+            await _responder(send, 503, "Servicio sobrecargado, reintente más tarde", 1)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.salir()
+
+
+limite_usuarios = CubetasTokens(TASA_POR_USUARIO, RAFAGA_POR_USUARIO)
+limite_ips = CubetasTokens(TASA_POR_IP, RAFAGA_POR_IP)
+control_admision = ControlAdmision()
+
+Medidor("admision_en_cola", "Peticiones esperando turno en el control de admision.", funcion=lambda: [((), control_admision.en_cola)])
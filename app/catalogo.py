@@ -0,0 +1,59 @@
+# app/catalogo.py
+# Cache del catalogo de productos ya serializado.
+# El catalogo solo cambia cuando se modifica el stock o las reservas, pero la tienda
+# lo consulta constantemente: se serializa una vez por version y se reutiliza el mismo cuerpo.
+import hashlib
+import threading
+
+from app.db.database import productos_db
+from app.reservas import reservas
+from app.serializacion import catalogo_a_json
+
+
+class CatalogoCache:
+    """
+    Guarda el JSON del catalogo junto con su ETag y la version de la tabla de
+    productos con la que se genero. Se regenera cuando la version cambia.
+    Con un libro de reservas, el stock publicado es el disponible y la cache
+    tambien se regenera cuando cambian las reservas.
+    """
+
+    def __init__(self, productos, reservas=None):
+        self.productos = productos
+        self.reservas = reservas
+        self._version = None
+        self._etag = None
+        self._cuerpo = None
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        """
+        Devuelve (etag, cuerpo_json) del catalogo vigente.
+        """
+        if self._version == self._version_vigente():
+            return self._etag, self._cuerpo
+        with self._lock:
+            # Otro hilo pudo regenerarlo mientras esperabamos el lock
+            version = self._version_vigente()
+            if self._version != version:
+                # La version se lee antes que los productos: el cuerpo nunca es mas viejo que ella
+                productos = self.productos
+                if self.reservas is not None:
+                    productos = [self.reservas.con_disponible(producto) for producto in productos]
+                cuerpo = catalogo_a_json(productos)
+                self._etag, self._cuerpo = _etag_fuerte(cuerpo), cuerpo
+                self._version = version
+            return self._etag, self._cuerpo
+
+    def _version_vigente(self):
+        if self.reservas is None:
+            return self.productos.version
+        return self.productos.version, self.reservas.version
+
+
+def _etag_fuerte(cuerpo):
+    # Derivado del contenido: sigue siendo valido tras reiniciar o entre workers
+    return '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+
+
+catalogo = CatalogoCache(productos_db, reservas)
@@ -0,0 +1,104 @@
+# app/cluster.py
+# Lanzador del modo shards: N procesos, cada uno con su propio event loop y su
+# parte de los carritos, escuchando todos en el mismo puerto publico (SO_REUSEPORT,
+# el kernel reparte las conexiones) y cada uno en un puerto interno propio para
+# las peticiones que le reenvian los demas (solo alli se atienden sin rutear).
+# El stock vive en memoria compartida.
+#
+# Uso:
+#     python -m app.cluster --shards 4 --puerto 8000 --puerto-interno 9000
+#
+# Este modulo no importa la aplicacion a nivel de modulo: cada proceso hijo la
+# importa despues de configurar su shard en las variables de entorno.
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import tempfile
+
+
+def _socket_publico(host, puerto):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, puerto))
+    return sock
+
+
+def _socket_interno(puerto):
+    # Los shards reconocen los reenvios por este listener (app.shards.es_reenvio_interno):
+    # la cabecera local que llega por el puerto publico se descarta
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", puerto))
+    return sock
+
+
+def ejecutar_shard(indice, shards, host, puerto, puerto_interno, ruta_stock):
+    """
+    Proceso de un shard: configura el entorno, importa la aplicacion y la sirve
+    con uvicorn en el puerto publico compartido y en su puerto interno.
+    """
+    os.environ.update({
+        "CARRITO_BACKEND": "memoria",
+        "CARRITO_SHARDS": str(shards),
+        "CARRITO_SHARD": str(indice),
+        "CARRITO_SHARD_PUERTO_BASE": str(puerto_interno),
+        "CARRITO_STOCK_COMPARTIDO": ruta_stock,
+    })
+    import uvicorn
+
+    sockets = [_socket_publico(host, puerto), _socket_interno(puerto_interno + indice)]
+    config = uvicorn.Config("app.main:app", log_level="warning", access_log=False)
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de carritos repartida en varios procesos")
+    parser.add_argument("--shards", type=int, default=os.cpu_count())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8000)
+    parser.add_argument("--puerto-interno", type=int, default=9000, help="puerto interno del shard 0 (el shard i usa este + i)")
+    args = parser.parse_args()
+
+    from app.db.database import PRODUCTOS_INICIALES
+    from app.db.stock_compartido import crear_stock_compartido
+
+    directorio = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    ruta_stock = os.path.join(directorio, f"carrito-stock-{os.getpid()}")
+    crear_stock_compartido(ruta_stock, PRODUCTOS_INICIALES)
+
+    # spawn: cada shard arranca un interprete limpio y lee su configuracion al importar la app
+    contexto = multiprocessing.get_context("spawn")
+    procesos = [
+        contexto.Process(
+            target=ejecutar_shard,
+            args=(indice, args.shards, args.host, args.puerto, args.puerto_interno, ruta_stock),
+            name=f"shard-{indice}",
+        )
+        for indice in range(args.shards)
+    ]
+
+    def detener(*_):
+        for proceso in procesos:
+            if proceso.is_alive():
+                proceso.terminate()
+
+    signal.signal(signal.SIGTERM, detener)
+    try:
+        for proceso in procesos:
+            proceso.start()
+        print(f"{args.shards} shards escuchando en http://{args.host}:{args.puerto}", flush=True)
+        for proceso in procesos:
+            proceso.join()
+    except KeyboardInterrupt:
+        detener()
+        for proceso in procesos:
+            proceso.join()
+    finally:
+        os.remove(ruta_stock)
+
+
+if __name__ == "__main__":
+    main()
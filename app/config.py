@@ -0,0 +1,103 @@
+# app/config.py
+# Configuracion de la aplicacion, leida desde variables de entorno.
+import os
+
+# Backend de almacenamiento: "memoria" (por defecto) o "sqlite".
+# Con "sqlite" varios workers de uvicorn comparten carritos y stock.
+BACKEND_DB = os.environ.get("CARRITO_BACKEND", "memoria")
+
+# Ruta del archivo de base de datos para el backend SQLite
+SQLITE_PATH = os.environ.get("CARRITO_SQLITE_PATH", "carritos.db")
+
+# Minutos de inactividad tras los cuales un carrito expira
+TTL_CARRITO_MINUTOS = float(os.environ.get("CARRITO_TTL_MINUTOS", "1"))
+
+# Cada cuantos segundos el barredor elimina los carritos expirados
+INTERVALO_BARRIDO_SEGUNDOS = float(os.environ.get("CARRITO_INTERVALO_BARRIDO", "5"))
+
+# Respuestas rapidas: los carritos y el catalogo se serializan directo a JSON con
+# orjson, sin volver a validarlos con Pydantic. Requiere orjson instalado.
+RESPUESTA_RAPIDA = os.environ.get("CARRITO_RESPUESTA_RAPIDA", "0") == "1"
+
+# Reglas de fraude: maximo de unidades por carrito y por producto
+MAX_UNIDADES_CARRITO = int(os.environ.get("CARRITO_MAX_UNIDADES", "15"))
+MAX_UNIDADES_POR_PRODUCTO = int(os.environ.get("CARRITO_MAX_UNIDADES_POR_PRODUCTO", "10"))
+
+# Pagos idempotentes: cuantos resultados se recuerdan y por cuantos segundos
+IDEMPOTENCIA_CAPACIDAD = int(os.environ.get("CARRITO_IDEMPOTENCIA_CAPACIDAD", "10000"))
+IDEMPOTENCIA_TTL_SEGUNDOS = float(os.environ.get("CARRITO_IDEMPOTENCIA_TTL", "86400"))
+
+# Persistencia del backend en memoria: directorio del diario de eventos y los
+# snapshots (vacio = sin persistencia), cada cuantos milisegundos se hace fsync
+# del diario y cada cuantos segundos se escribe un snapshot
+DIARIO_DIR = os.environ.get("CARRITO_DIARIO_DIR", "")
+DIARIO_FSYNC_MS = float(os.environ.get("CARRITO_DIARIO_FSYNC_MS", "10"))
+SNAPSHOT_INTERVALO_SEGUNDOS = float(os.environ.get("CARRITO_SNAPSHOT_INTERVALO", "300"))
+
+# Modo shards: cantidad de procesos entre los que se reparten los carritos, indice
+# de este proceso y puerto interno del shard 0 (el shard i escucha en base + i).
+# Lo configura `python -m app.cluster`; con 1 shard la app funciona como siempre.
+SHARDS = int(os.environ.get("CARRITO_SHARDS", "1"))
+SHARD = int(os.environ.get("CARRITO_SHARD", "0"))
+SHARD_PUERTO_BASE = int(os.environ.get("CARRITO_SHARD_PUERTO_BASE", "9000"))
+
+# Archivo en memoria compartida con el stock de los productos, comun a todos los shards
+STOCK_COMPARTIDO = os.environ.get("CARRITO_STOCK_COMPARTIDO", "")
+
+# Reservas de stock: las unidades de un carrito quedan reservadas hasta que se paga,
+# se elimina o expira (app/reservas.py). El libro vive en la memoria del proceso:
+# en modo shards cada shard solo conoce sus carritos, y con SQLite los workers no
+# ven las bajas de los demas (una reserva liberada por otro worker nunca se
+# soltaria). En esos casos las reservas se desactivan y el stock se comprueba al pagar.
+RESERVAS_STOCK = os.environ.get("CARRITO_RESERVAS", "1") == "1" and SHARDS <= 1 and BACKEND_DB != "sqlite"
+
+# Pagos en micro-lotes: los descuentos de stock que llegan juntos se aplican en
+# una sola pasada. Un lote se cierra a los CARRITO_LOTE_PAGO_VENTANA_MS
+# milisegundos o al reunir CARRITO_LOTE_PAGO_MAXIMO pagos. Sin configurar la
+# ventana, solo se agrupan los backends en que cada descuento tiene un costo fijo
+# alto (SQLite y el stock compartido de los shards), con 2 ms; 0 = sin lotes.
+_ventana_lote = os.environ.get("CARRITO_LOTE_PAGO_VENTANA_MS", "")
+LOTE_PAGO_VENTANA_MS = float(_ventana_lote) if _ventana_lote else None
+LOTE_PAGO_MAXIMO = int(os.environ.get("CARRITO_LOTE_PAGO_MAXIMO", "64"))
+
+# Limite de peticiones por usuario y por IP (cubeta de tokens): tokens por segundo
+# y tamaño de la rafaga. Una tasa de 0 desactiva el limite correspondiente.
+TASA_POR_USUARIO = float(os.environ.get("CARRITO_TASA_POR_USUARIO", "0"))
+RAFAGA_POR_USUARIO = float(os.environ.get("CARRITO_RAFAGA_POR_USUARIO", "20"))
+TASA_POR_IP = float(os.environ.get("CARRITO_TASA_POR_IP", "0"))
+RAFAGA_POR_IP = float(os.environ.get("CARRITO_RAFAGA_POR_IP", "100"))
+
+# Control de admision: peticiones atendidas a la vez, cuantas pueden esperar
+# turno, cuantos segundos como maximo, y la espera media (en segundos) a partir
+# de la cual se rechazan las nuevas en lugar de encolarlas. 0 concurrentes = sin limite.
+MAX_CONCURRENTES = int(os.environ.get("CARRITO_MAX_CONCURRENTES", "256"))
+MAX_COLA = int(os.environ.get("CARRITO_MAX_COLA", "1024"))
+ESPERA_MAXIMA_SEGUNDOS = float(os.environ.get("CARRITO_ESPERA_MAXIMA", "2"))
+ESPERA_OBJETIVO_SEGUNDOS = float(os.environ.get("CARRITO_ESPERA_OBJETIVO", "0.5"))
+
+# Eventos en vivo (SSE y WebSocket, app/eventos.py): ventana en milisegundos en la
+# que se agrupan los cambios de stock de un mismo producto, eventos pendientes por
+# suscriptor antes de cortar a un cliente que no los lee, y segundos entre
+# mensajes de keepalive de una conexion sin eventos.
+EVENTOS_VENTANA_STOCK_MS = float(os.environ.get("CARRITO_EVENTOS_VENTANA_STOCK_MS", "100"))
+EVENTOS_MAX_PENDIENTES = int(os.environ.get("CARRITO_EVENTOS_MAX_PENDIENTES", "1000"))
+EVENTOS_KEEPALIVE_SEGUNDOS = float(os.environ.get("CARRITO_EVENTOS_KEEPALIVE", "15"))
+# En modo shards, cada cuanto el repartidor de cada shard mira si otro shard cambio el stock compartido
+EVENTOS_SONDEO_STOCK_MS = float(os.environ.get("CARRITO_EVENTOS_SONDEO_STOCK_MS", "100"))
+
+# Trazas de peticiones lentas (app/perfilado.py): tiempo por fase dentro de los
+# handlers (busqueda, validacion, mutacion, serializacion). Se activan aqui o en
+# tiempo de ejecucion con PUT /debug/trazas. Las peticiones que superan el umbral
+# (en milisegundos) quedan en un buffer circular consultable en GET /debug/slow.
+# Las rutas /debug exigen la cabecera X-Admin-Token con el valor de CARRITO_ADMIN_TOKEN;
+# sin token configurado responden 404 (las trazas por entorno siguen funcionando).
+TRAZAS = os.environ.get("CARRITO_TRAZAS", "0") == "1"
+TRAZAS_UMBRAL_MS = float(os.environ.get("CARRITO_TRAZAS_UMBRAL_MS", "250"))
+TRAZAS_MAXIMO = int(os.environ.get("CARRITO_TRAZAS_MAXIMO", "200"))
+ADMIN_TOKEN = os.environ.get("CARRITO_ADMIN_TOKEN", "")
+
+# Arranque rapido, para workers de vida corta (autoescalado): el esquema OpenAPI
+# se lee del archivo generado al empaquetar (python -m app.openapi_estatico) en
+# lugar de generarse, y el recolector de basura no corre durante la importacion.
+ARRANQUE_RAPIDO = os.environ.get("CARRITO_ARRANQUE_RAPIDO", "0") == "1"
+OPENAPI_PRECALCULADO = os.environ.get("CARRITO_OPENAPI", os.path.join(os.path.dirname(__file__), "openapi.json"))
@@ -1,11 +1,380 @@
-# --- Simulación de la tabla de Productos ---
-productos_db = [
+import bisect
+import heapq
+import itertools
+import threading
+
+from app.config import BACKEND_DB, DIARIO_DIR, SHARDS, SQLITE_PATH, STOCK_COMPARTIDO
+from app.db.repository import CartRepository, OrderRepository, ProductRepository
+
+# --- Almacenes indexados en memoria ---
+# Los productos y carritos se guardan en diccionarios indexados (por ID, y los
+# carritos tambien por user_id) para que buscar, crear, eliminar y comprobar
+# que un usuario no tenga dos carritos sea O(1) en lugar de recorrer una lista.
+
+
+class ProductStore(ProductRepository):
+    """
+    Tabla de productos indexada por ID.
+    Conserva la interfaz de lista que usan los tests (append, clear, len, indice).
+    """
+
+    # Un descuento en memoria cuesta menos que esperar y agrupar los pagos
+    agrupar_descuentos = False
+
+    def __init__(self, productos=()):
+        self._por_id = {}
+        # Un lock por producto: los pagos de productos distintos no se bloquean entre si
+        self._locks = {}
+        # Version del catalogo: cambia con cada modificacion de productos o stock
+        self._contador_version = itertools.count()
+        self._version = next(self._contador_version)
+        self._version_catalogo = self._version
+        for producto in productos:
+            self.append(producto)
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def version_catalogo(self):
+        return self._version_catalogo
+
+    def _nueva_version(self):
+        # next() sobre itertools.count es atomico, no hace falta un lock global
+        self._version = next(self._contador_version)
+
+    def get(self, producto_id):
+        return self._por_id.get(producto_id)
+
+    def append(self, producto):
+        self._por_id[producto["id"]] = producto
+        self._locks.setdefault(producto["id"], threading.Lock())
+        self._nueva_version()
+        self._version_catalogo = self._version
+
+    def descontar_stock(self, cantidades):
+        # Los locks se toman en orden de ID para que dos pagos no se bloqueen mutuamente
+        pids = sorted(cantidades)
+        locks = [self._locks[pid] for pid in pids]
+        for lock in locks:
+            lock.acquire()
+        try:
+            productos = [(self._por_id[pid], cantidades[pid]) for pid in pids]
+            for producto, cantidad in productos:
+                if producto["stock"] < cantidad:
+                    return producto
+            for producto, cantidad in productos:
+                producto["stock"] -= cantidad
+            self._stock_descontado([producto for producto, _ in productos])
+            self._nueva_version()
+            return None
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def descontar_stock_lote(self, lista_cantidades):
+        # Una sola toma de locks (los de todos los productos del lote, en orden de ID)
+        # y los descuentos en el orden recibido, cada uno todo o nada
+        pids = sorted(set().union(*lista_cantidades))
+        locks = [self._locks[pid] for pid in pids]
+        for lock in locks:
+            lock.acquire()
+        try:
+            resultados = []
+            descontados = {}
+            lote = [[(self._por_id[pid], cantidad) for pid, cantidad in cantidades.items()] for cantidades in lista_cantidades]
+            for productos in lote:
+                sin_stock = next((producto for producto, cantidad in productos if producto["stock"] < cantidad), None)
+                if sin_stock is None:
+                    for producto, cantidad in productos:
+                        producto["stock"] -= cantidad
+                        descontados[producto["id"]] = producto
+                resultados.append(sin_stock)
+            if descontados:
+                self._stock_descontado(list(descontados.values()))
+                self._nueva_version()
+            return resultados
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _stock_descontado(self, productos):
+        # Se llama con los locks de los productos tomados; lo usa el diario de eventos
+        pass
+
+    def clear(self):
+        self._por_id.clear()
+        self._locks.clear()
+        self._nueva_version()
+        self._version_catalogo = self._version
+
+    def __iter__(self):
+        return iter(list(self._por_id.values()))
+
+    def __len__(self):
+        return len(self._por_id)
+
+    def __getitem__(self, indice):
+        return list(self._por_id.values())[indice]
+
+
+class CartStore(CartRepository):
+    """
+    Tabla de carritos (CarritoCompacto) indexada por ID de carrito y por user_id.
+    El indice por usuario garantiza un unico carrito activo por usuario.
+    Ademas mantiene un min-heap por actualizado_en para expirar carritos
+    inactivos sin recorrer la tabla, y el orden de alta para paginar por cursor.
+    """
+
+    def __init__(self):
+        self._por_id = {}
+        self._por_usuario = {}
+        # Entradas (actualizado_ts, carrito_id). Al modificar un carrito se agrega una
+        # entrada nueva y la anterior queda obsoleta: se descarta al salir del heap.
+        self._por_actualizacion = []
+        # Entradas (secuencia, carrito) en orden de alta; el cursor de paginacion es la secuencia
+        self._orden = []
+        self._secuencia_por_id = {}
+        self._secuencia = itertools.count()
+        self._lock_indices = threading.Lock()
+
+    def _indexar_actualizacion(self, carrito):
+        with self._lock_indices:
+            heapq.heappush(self._por_actualizacion, (carrito.actualizado_ts, carrito.id))
+            # Compactar cuando las entradas obsoletas superan a las vigentes (O(1) amortizado)
+            if len(self._por_actualizacion) > 2 * len(self._por_id) + 64:
+                self._por_actualizacion = [(c.actualizado_ts, c.id) for c in list(self._por_id.values())]
+                heapq.heapify(self._por_actualizacion)
+
+    def _indexar_alta(self, carrito):
+        with self._lock_indices:
+            secuencia = next(self._secuencia)
+            self._secuencia_por_id[carrito.id] = secuencia
+            self._orden.append((secuencia, carrito))
+            # Las secuencias se conservan al compactar, asi que los cursores siguen siendo validos
+            if len(self._orden) > 2 * len(self._por_id) + 64:
+                self._orden = [entrada for entrada in self._orden if self._entrada_vigente(entrada)]
+
+    def _entrada_vigente(self, entrada):
+        secuencia, carrito = entrada
+        return self._secuencia_por_id.get(carrito.id) == secuencia
+
+    def get(self, carrito_id):
+        return self._por_id.get(carrito_id)
+
+    def get_por_usuario(self, user_id):
+        return self._por_usuario.get(user_id)
+
+    def add(self, carrito):
+        """
+        Agrega un carrito. Devuelve False si el usuario ya tiene uno activo.
+        """
+        # setdefault es atomico: dos altas simultaneas del mismo usuario no pueden ganar ambas
+        if self._por_usuario.setdefault(carrito.user_id, carrito) is not carrito:
+            return False
+        self._por_id[carrito.id] = carrito
+        self._indexar_alta(carrito)
+        self._indexar_actualizacion(carrito)
+        return True
+
+    def cargar(self, carritos):
+        """
+        Alta masiva, por ejemplo al recuperar un snapshot: los indices se arman
+        una sola vez al final. Se omiten los carritos de usuarios que ya tienen uno.
+        """
+        with self._lock_indices:
+            for carrito in carritos:
+                if self._por_usuario.setdefault(carrito.user_id, carrito) is not carrito:
+                    continue
+                self._por_id[carrito.id] = carrito
+                secuencia = next(self._secuencia)
+                self._secuencia_por_id[carrito.id] = secuencia
+                self._orden.append((secuencia, carrito))
+                self._por_actualizacion.append((carrito.actualizado_ts, carrito.id))
+            heapq.heapify(self._por_actualizacion)
+
+    def save(self, carrito):
+        # En memoria el carrito se modifica en el lugar: solo se reindexa su actualizado_en
+        self._indexar_actualizacion(carrito)
+
+    def expirar(self, limite):
+        limite_ts = limite.timestamp()
+        expirados = []
+        with self._lock_indices:
+            heap = self._por_actualizacion
+            while heap and heap[0][0] < limite_ts:
+                actualizado_ts, carrito_id = heapq.heappop(heap)
+                carrito = self._por_id.get(carrito_id)
+                # Entrada obsoleta: el carrito ya no existe o se modifico despues
+                if carrito is None or carrito.actualizado_ts != actualizado_ts:
+                    continue
+                if self.remove(carrito):
+                    expirados.append(carrito)
+        return expirados
+
+    def remove(self, carrito):
+        """
+        Elimina un carrito. Devuelve False si ya no estaba en la tabla.
+        """
+        if self._por_id.pop(carrito.id, None) is None:
+            return False
+        if self._por_usuario.get(carrito.user_id) is carrito:
+            del self._por_usuario[carrito.user_id]
+        self._secuencia_por_id.pop(carrito.id, None)
+        self._carritos_quitados((carrito,))
+        return True
+
+    def paginar(self, cursor=None, limite=100, user_id=None, actualizado_desde=None):
+        if user_id is not None:
+            # Un usuario tiene a lo sumo un carrito: se resuelve con el indice por usuario
+            carrito = self._por_usuario.get(user_id)
+            if carrito is None or cursor is not None:
+                return [], None
+            if actualizado_desde is not None and carrito.actualizado_ts < actualizado_desde.timestamp():
+                return [], None
+            return [carrito], None
+
+        desde = -1 if cursor is None else int(cursor)
+        desde_ts = None if actualizado_desde is None else actualizado_desde.timestamp()
+        pagina = []
+        with self._lock_indices:
+            orden = self._orden
+            # Busqueda binaria del cursor: las secuencias estan ordenadas
+            i = bisect.bisect_right(orden, desde, key=lambda entrada: entrada[0])
+            while i < len(orden) and len(pagina) < limite:
+                entrada = orden[i]
+                i += 1
+                if not self._entrada_vigente(entrada):
+                    continue
+                if desde_ts is not None and entrada[1].actualizado_ts < desde_ts:
+                    continue
+                pagina.append(entrada)
+        siguiente = str(pagina[-1][0]) if len(pagina) == limite else None
+        return [carrito for _, carrito in pagina], siguiente
+
+    def clear(self):
+        self._carritos_quitados(list(self._por_id.values()))
+        self._por_id.clear()
+        self._por_usuario.clear()
+        with self._lock_indices:
+            self._por_actualizacion.clear()
+            self._orden.clear()
+            self._secuencia_por_id.clear()
+
+    def __iter__(self):
+        return iter(list(self._por_id.values()))
+
+    def __len__(self):
+        return len(self._por_id)
+
+
+def _clave_orden(pedido):
+    return pedido.clave_orden
+
+
+class OrderStore(OrderRepository):
+    """
+    Historial de pedidos indexado por numero de seguimiento y por user_id.
+    Solo se agregan pedidos, asi que cada usuario tiene una lista ordenada por
+    (creado_en, secuencia) a la que casi siempre se agrega al final. Buscar un
+    pedido es O(1) y una pagina del historial de un usuario, con o sin rango de
+    fechas, O(log n + pagina) por busqueda binaria.
+    """
+
+    def __init__(self):
+        self._por_numero = {}
+        self._por_usuario = {}
+        self._secuencia = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self, numero):
+        return self._por_numero.get(numero)
+
+    def add(self, pedido):
+        with self._lock:
+            if pedido.numero in self._por_numero:
+                return False
+            pedido.secuencia = next(self._secuencia)
+            self._por_numero[pedido.numero] = pedido
+            historial = self._por_usuario.setdefault(pedido.user_id, [])
+            if not historial or historial[-1].clave_orden <= pedido.clave_orden:
+                historial.append(pedido)
+            else:
+                # Pedido con un timestamp anterior al ultimo (reloj ajustado, recuperacion)
+                bisect.insort(historial, pedido, key=_clave_orden)
+            return True
+
+    def por_usuario(self, user_id, cursor=None, limite=50, desde=None, hasta=None):
+        historial = self._por_usuario.get(user_id, ())
+        # Rango [inicio, fin) de la lista ordenada, recorrido de atras para adelante
+        inicio = 0 if desde is None else bisect.bisect_left(historial, (desde.timestamp(), -1), key=_clave_orden)
+        fin = len(historial) if hasta is None else bisect.bisect_left(historial, (hasta.timestamp(), -1), key=_clave_orden)
+        if cursor is not None:
+            anterior = self._por_numero.get(cursor)
+            if anterior is None or anterior.user_id != user_id:
+                raise ValueError(cursor)
+            fin = min(fin, bisect.bisect_left(historial, anterior.clave_orden, key=_clave_orden))
+        pagina = historial[max(inicio, fin - limite):fin][::-1]
+        siguiente = pagina[-1].numero if fin - inicio > limite else None
+        return pagina, siguiente
+
+    def clear(self):
+        with self._lock:
+            self._por_numero.clear()
+            self._por_usuario.clear()
+
+    def __iter__(self):
+        return iter(list(self._por_numero.values()))
+
+    def __len__(self):
+        return len(self._por_numero)
+
+
+# --- Productos iniciales del catalogo ---
+PRODUCTOS_INICIALES = [
     {"id": 1, "nombre": "Laptop Pro 15", "precio": 1200.50, "stock": 15},
     {"id": 2, "nombre": "Mouse Inalámbrico", "precio": 25.00, "stock": 50},
     {"id": 3, "nombre": "Teclado Mecánico RGB", "precio": 89.99, "stock": 30},
     {"id": 4, "nombre": "Monitor 4K 27\"", "precio": 350.00, "stock": 20},
 ]
 
-# --- Simulación de la tabla de Carritos ---
-# Esta lista crecerá y se modificará en tiempo de ejecución.
-carritos_db = []
\ No newline at end of file
+# --- Seleccion del backend segun la configuracion ---
+# Diario de eventos y snapshots del backend en memoria (None si no esta activado)
+persistencia = None
+
+if BACKEND_DB == "sqlite":
+    from app.db.sqlite import SQLitePool, SQLiteCartStore, SQLiteOrderStore, SQLiteProductStore
+
+    _pool = SQLitePool(SQLITE_PATH)
+    productos_db = SQLiteProductStore(_pool, PRODUCTOS_INICIALES)
+    carritos_db = SQLiteCartStore(_pool)
+    pedidos_db = SQLiteOrderStore(_pool)
+elif BACKEND_DB == "memoria" and SHARDS > 1:
+    # Modo shards: carritos propios de este proceso y stock en memoria compartida
+    if DIARIO_DIR:
+        raise ValueError("El diario de eventos no se puede combinar con el modo shards")
+    from app.db.stock_compartido import SharedProductStore
+
+    productos_db = SharedProductStore(STOCK_COMPARTIDO, PRODUCTOS_INICIALES)
+    carritos_db = CartStore()
+    # Cada shard guarda los pedidos de sus carritos (los de los usuarios que le tocan)
+    pedidos_db = OrderStore()
+elif BACKEND_DB == "memoria" and DIARIO_DIR:
+    # Estado en memoria recuperado desde el ultimo snapshot y el diario
+    from app.db.diario import recuperar
+
+    persistencia = recuperar(DIARIO_DIR, PRODUCTOS_INICIALES)
+    productos_db = persistencia.productos
+    carritos_db = persistencia.carritos
+    pedidos_db = persistencia.pedidos
+elif BACKEND_DB == "memoria":
+    # --- Simulación de la tabla de Productos ---
+    productos_db = ProductStore([dict(producto) for producto in PRODUCTOS_INICIALES])
+    # --- Simulación de la tabla de Carritos ---
+    # Esta tabla crecerá y se modificará en tiempo de ejecución.
+    carritos_db = CartStore()
+    # --- Historial de pedidos pagados ---
+    pedidos_db = OrderStore()
+else:
+    raise ValueError(f"Backend de base de datos desconocido: {BACKEND_DB}")
@@ -0,0 +1,522 @@
+# app/db/diario.py
+# Persistencia del backend en memoria: diario de eventos (write-ahead log) y snapshots.
+# Cada cambio de carritos, stock o pedidos se agrega a un archivo de solo escritura al final;
+# los registros se acumulan y un hilo los escribe y hace fsync en grupo cada pocos
+# milisegundos, asi que una peticion nunca espera al disco. Periodicamente se
+# escribe un snapshot binario del estado completo y se descartan los diarios viejos.
+# Al arrancar se carga el ultimo snapshot y se reaplica la cola del diario.
+#
+# Los eventos guardan valores absolutos (el carrito completo, el stock resultante),
+# por lo que reaplicarlos es idempotente. Eso permite tomar el snapshot sin frenar
+# las escrituras: se rota el diario y el estado se copia mientras sigue cambiando;
+# al recuperar, los eventos del diario nuevo corrigen lo que el snapshot vio a medias.
+import asyncio
+import gc
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from array import array
+
+from app.config import DIARIO_FSYNC_MS, SNAPSHOT_INTERVALO_SEGUNDOS
+from app.db.database import CartStore, OrderStore, ProductStore
+from app.db.modelos import CarritoCompacto, Pedido
+
+# --- Formato de los registros ---
+# Cabecera: tipo, longitud del contenido y CRC32 del contenido. Un registro cortado
+# por una caida (o con el CRC incorrecto) marca el final valido del archivo.
+_CABECERA = struct.Struct("<BII")
+# creado_ts, actualizado_ts, subtotal_centavos, bytes del id, bytes del user_id, cantidad de items
+_CARRITO = struct.Struct("<ddqHHH")
+# id, precio, stock, bytes del nombre
+_PRODUCTO = struct.Struct("<qdqH")
+# creado_ts, total_centavos, bytes del numero, del user_id y del carrito_id, cantidad de items
+_PEDIDO = struct.Struct("<dqHHHH")
+
+EV_CARRITO = 1
+EV_CARRITO_ELIMINADO = 2
+EV_CARRITOS_VACIADOS = 3
+EV_PRODUCTO = 4
+EV_STOCK = 5
+EV_PRODUCTOS_VACIADOS = 6
+EV_PEDIDO = 7
+EV_PEDIDOS_VACIADOS = 8
+
+MAGIA_SNAPSHOT = b"CRTSNAP1"
+_TAMANIO_ENTERO = array("i").itemsize
+_TAMANIO_PRECIO = array("q").itemsize
+
+_NOMBRE_DIARIO = re.compile(r"diario-(\d+)\.log$")
+_NOMBRE_SNAPSHOT = re.compile(r"snapshot-(\d+)\.bin$")
+
+
+def _registro(tipo, contenido=b""):
+    return _CABECERA.pack(tipo, len(contenido), zlib.crc32(contenido)) + contenido
+
+
+def _codificar_carrito(carrito):
+    id_bytes = carrito.id.encode()
+    user_bytes = carrito.user_id.encode()
+    productos, cantidades = carrito.productos, carrito.cantidades
+    # En un snapshot el carrito puede estar cambiando: se toma el largo comun de ambos arrays
+    n = min(len(productos), len(cantidades))
+    return b"".join((
+        _CARRITO.pack(carrito.creado_ts, carrito.actualizado_ts, carrito.subtotal_centavos, len(id_bytes), len(user_bytes), n),
+        id_bytes,
+        user_bytes,
+        productos[:n].tobytes(),
+        cantidades[:n].tobytes(),
+    ))
+
+
+def _decodificar_carrito(contenido):
+    creado_ts, actualizado_ts, subtotal, largo_id, largo_user, n = _CARRITO.unpack_from(contenido)
+    pos = _CARRITO.size
+    carrito_id = bytes(contenido[pos:pos + largo_id]).decode()
+    pos += largo_id
+    user_id = bytes(contenido[pos:pos + largo_user]).decode()
+    pos += largo_user
+    productos = array("i")
+    productos.frombytes(contenido[pos:pos + n * _TAMANIO_ENTERO])
+    pos += n * _TAMANIO_ENTERO
+    cantidades = array("i")
+    cantidades.frombytes(contenido[pos:pos + n * _TAMANIO_ENTERO])
+    # Los arrays ya vienen agrupados por producto: se asignan sin pasar por agregar()
+    carrito = CarritoCompacto(carrito_id, user_id, creado_ts, actualizado_ts, subtotal_centavos=subtotal)
+    carrito.productos = productos
+    carrito.cantidades = cantidades
+    carrito.unidades = sum(cantidades)
+    return carrito
+
+
+def _codificar_producto(producto):
+    nombre = producto["nombre"].encode()
+    return _PRODUCTO.pack(producto["id"], producto["precio"], producto["stock"], len(nombre)) + nombre
+
+
+def _decodificar_producto(contenido):
+    producto_id, precio, stock, largo_nombre = _PRODUCTO.unpack_from(contenido)
+    nombre = bytes(contenido[_PRODUCTO.size:_PRODUCTO.size + largo_nombre]).decode()
+    return {"id": producto_id, "nombre": nombre, "precio": precio, "stock": stock}
+
+
+def _codificar_pedido(pedido):
+    textos = [texto.encode() for texto in (pedido.numero, pedido.user_id, pedido.carrito_id)]
+    return b"".join((
+        _PEDIDO.pack(pedido.creado_ts, pedido.total_centavos, *(len(texto) for texto in textos), len(pedido.productos)),
+        *textos,
+        pedido.productos.tobytes(),
+        pedido.cantidades.tobytes(),
+        pedido.precios_centavos.tobytes(),
+    ))
+
+
+def _decodificar_pedido(contenido):
+    creado_ts, total, *largos, n = _PEDIDO.unpack_from(contenido)
+    pos = _PEDIDO.size
+    textos = []
+    for largo in largos:
+        textos.append(bytes(contenido[pos:pos + largo]).decode())
+        pos += largo
+    pedido = Pedido(*textos, creado_ts=creado_ts)
+    pedido.productos.frombytes(contenido[pos:pos + n * _TAMANIO_ENTERO])
+    pos += n * _TAMANIO_ENTERO
+    pedido.cantidades.frombytes(contenido[pos:pos + n * _TAMANIO_ENTERO])
+    pos += n * _TAMANIO_ENTERO
+    pedido.precios_centavos.frombytes(contenido[pos:pos + n * _TAMANIO_PRECIO])
+    pedido.total_centavos = total
+    return pedido
+
+
+def _codificar_stock(productos):
+    # Pares (producto_id, stock resultante)
+    return array("q", [valor for producto in productos for valor in (producto["id"], producto["stock"])]).tobytes()
+
+
+def leer_registros(ruta, inicio=0):
+    """
+    Recorre los registros validos de un archivo con mmap, sin copiarlo a memoria.
+    Genera (tipo, contenido, fin) donde fin es la posicion siguiente al registro;
+    se detiene en el primer registro incompleto o corrupto.
+    """
+    with open(ruta, "rb") as archivo:
+        if os.fstat(archivo.fileno()).st_size <= inicio:
+            return
+        with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+            vista = memoryview(datos)
+            try:
+                pos, total = inicio, len(datos)
+                while pos + _CABECERA.size <= total:
+                    tipo, largo, crc = _CABECERA.unpack_from(datos, pos)
+                    fin = pos + _CABECERA.size + largo
+                    if fin > total:
+                        return
+                    contenido = vista[pos + _CABECERA.size:fin]
+                    if zlib.crc32(contenido) != crc:
+                        contenido.release()
+                        return
+                    yield tipo, contenido, fin
+                    # La vista no puede sobrevivir al mmap: quien la necesite debe copiarla
+                    contenido.release()
+                    pos = fin
+            finally:
+                vista.release()
+
+
+def aplicar_evento(tipo, contenido, productos, carritos, pedidos=None):
+    """
+    Aplica un evento sobre los almacenes. Los eventos son absolutos: aplicarlos
+    sobre un estado que ya los incluye deja el mismo resultado.
+    """
+    if tipo == EV_CARRITO:
+        carrito = _decodificar_carrito(contenido)
+        for anterior in (carritos.get(carrito.id), carritos.get_por_usuario(carrito.user_id)):
+            if anterior is not None:
+                carritos.remove(anterior)
+        carritos.add(carrito)
+    elif tipo == EV_CARRITO_ELIMINADO:
+        carrito = carritos.get(bytes(contenido).decode())
+        if carrito is not None:
+            carritos.remove(carrito)
+    elif tipo == EV_CARRITOS_VACIADOS:
+        carritos.clear()
+    elif tipo == EV_PRODUCTO:
+        productos.append(_decodificar_producto(contenido))
+    elif tipo == EV_STOCK:
+        pares = array("q")
+        pares.frombytes(contenido)
+        for producto_id, stock in zip(pares[::2], pares[1::2]):
+            producto = productos.get(producto_id)
+            if producto is not None:
+                producto["stock"] = stock
+    elif tipo == EV_PRODUCTOS_VACIADOS:
+        productos.clear()
+    elif tipo == EV_PEDIDO:
+        # Un pedido que ya esta (snapshot tomado despues de registrarlo) se ignora
+        if pedidos is not None:
+            pedidos.add(_decodificar_pedido(contenido))
+    elif tipo == EV_PEDIDOS_VACIADOS:
+        if pedidos is not None:
+            pedidos.clear()
+    else:
+        raise ValueError(f"Tipo de evento desconocido en el diario: {tipo}")
+
+
+class Diario:
+    """
+    Archivo de eventos de solo agregado, dividido en segmentos numerados.
+    registrar() solo agrega el registro a un buffer; un hilo lo escribe y hace
+    fsync cada `intervalo_fsync` segundos (commit en grupo). Ante una caida se
+    pierden a lo sumo los eventos de ese intervalo.
+    """
+
+    def __init__(self, directorio, segmento, intervalo_fsync=DIARIO_FSYNC_MS / 1000):
+        self.directorio = directorio
+        self.segmento = segmento
+        self.intervalo_fsync = intervalo_fsync
+        self._archivo = open(ruta_diario(directorio, segmento), "ab", buffering=0)
+        self._pendiente = bytearray()
+        # _lock protege el buffer; _lock_escritura ordena las escrituras al archivo
+        self._lock = threading.Lock()
+        self._lock_escritura = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._vaciar_periodicamente, name="diario-fsync", daemon=True)
+        self._hilo.start()
+
+    def registrar(self, tipo, contenido=b""):
+        registro = _registro(tipo, contenido)
+        with self._lock:
+            self._pendiente += registro
+
+    def _vaciar_periodicamente(self):
+        while not self._detener.wait(self.intervalo_fsync):
+            self.vaciar()
+
+    def vaciar(self):
+        """
+        Escribe los registros pendientes y hace fsync.
+        """
+        with self._lock_escritura:
+            with self._lock:
+                datos = bytes(self._pendiente)
+                self._pendiente.clear()
+            if datos:
+                self._archivo.write(datos)
+                os.fsync(self._archivo.fileno())
+
+    def rotar(self):
+        """
+        Cierra el segmento actual y empieza uno nuevo. Devuelve el numero del nuevo
+        segmento: todo evento posterior a la rotacion queda en el.
+        """
+        with self._lock_escritura:
+            with self._lock:
+                datos = bytes(self._pendiente)
+                self._pendiente.clear()
+                anterior = self._archivo
+                self.segmento += 1
+                self._archivo = open(ruta_diario(self.directorio, self.segmento), "ab", buffering=0)
+            if datos:
+                anterior.write(datos)
+            os.fsync(anterior.fileno())
+            anterior.close()
+            return self.segmento
+
+    def cerrar(self):
+        self._detener.set()
+        self._hilo.join()
+        self.vaciar()
+        self._archivo.close()
+
+
+class ProductStoreDiario(ProductStore):
+    """
+    ProductStore que registra en el diario cada alta de producto y cada descuento de stock.
+    """
+
+    def __init__(self, productos=(), diario=None):
+        self.diario = diario
+        super().__init__(productos)
+
+    def append(self, producto):
+        super().append(producto)
+        if self.diario:
+            self.diario.registrar(EV_PRODUCTO, _codificar_producto(producto))
+
+    def _stock_descontado(self, productos):
+        # Con los locks de los productos tomados: el orden en el diario es el de los descuentos
+        if self.diario:
+            self.diario.registrar(EV_STOCK, _codificar_stock(productos))
+
+    def clear(self):
+        super().clear()
+        if self.diario:
+            self.diario.registrar(EV_PRODUCTOS_VACIADOS)
+
+
+class CartStoreDiario(CartStore):
+    """
+    CartStore que registra en el diario el estado de cada carrito guardado y cada baja.
+    El cambio y su registro se hacen bajo un mismo lock para que el orden del
+    diario coincida con el de los cambios.
+    """
+
+    def __init__(self, diario=None):
+        super().__init__()
+        self.diario = diario
+        self._lock_escritura = threading.RLock()
+
+    def add(self, carrito):
+        with self._lock_escritura:
+            agregado = super().add(carrito)
+            if agregado and self.diario:
+                self.diario.registrar(EV_CARRITO, _codificar_carrito(carrito))
+            return agregado
+
+    def save(self, carrito):
+        with self._lock_escritura:
+            super().save(carrito)
+            if self.diario:
+                self.diario.registrar(EV_CARRITO, _codificar_carrito(carrito))
+
+    def remove(self, carrito):
+        with self._lock_escritura:
+            eliminado = super().remove(carrito)
+            if eliminado and self.diario:
+                self.diario.registrar(EV_CARRITO_ELIMINADO, carrito.id.encode())
+            return eliminado
+
+    def expirar(self, limite):
+        # Mismo orden de locks que add/save: primero el de escritura, despues el de indices
+        with self._lock_escritura:
+            return super().expirar(limite)
+
+    def clear(self):
+        with self._lock_escritura:
+            super().clear()
+            if self.diario:
+                self.diario.registrar(EV_CARRITOS_VACIADOS)
+
+
+class OrderStoreDiario(OrderStore):
+    """
+    OrderStore que registra en el diario cada pedido agregado, en el mismo orden que las altas.
+    """
+
+    def __init__(self, diario=None):
+        super().__init__()
+        self.diario = diario
+        self._lock_escritura = threading.Lock()
+
+    def add(self, pedido):
+        with self._lock_escritura:
+            agregado = super().add(pedido)
+            if agregado and self.diario:
+                self.diario.registrar(EV_PEDIDO, _codificar_pedido(pedido))
+            return agregado
+
+    def clear(self):
+        with self._lock_escritura:
+            super().clear()
+            if self.diario:
+                self.diario.registrar(EV_PEDIDOS_VACIADOS)
+
+
+def ruta_diario(directorio, segmento):
+    return os.path.join(directorio, f"diario-{segmento:08d}.log")
+
+
+def ruta_snapshot(directorio, segmento):
+    return os.path.join(directorio, f"snapshot-{segmento:08d}.bin")
+
+
+def _numerados(directorio, patron):
+    numeros = []
+    for nombre in os.listdir(directorio):
+        coincidencia = patron.match(nombre)
+        if coincidencia:
+            numeros.append(int(coincidencia.group(1)))
+    return sorted(numeros)
+
+
+class Persistencia:
+    """
+    Une los almacenes en memoria con su diario y escribe los snapshots.
+    Se crea con recuperar().
+    """
+
+    def __init__(self, directorio, productos, carritos, pedidos, diario, intervalo_snapshot=SNAPSHOT_INTERVALO_SEGUNDOS):
+        self.directorio = directorio
+        self.productos = productos
+        self.carritos = carritos
+        self.pedidos = pedidos
+        self.diario = diario
+        self.intervalo_snapshot = intervalo_snapshot
+        self._lock_snapshot = threading.Lock()
+        # Metricas de la recuperacion y de los snapshots
+        self.duracion_recuperacion = 0.0
+        self.eventos_reaplicados = 0
+        self.duracion_ultimo_snapshot = 0.0
+
+    def tomar_snapshot(self):
+        """
+        Rota el diario, escribe el estado completo en un snapshot y borra los
+        snapshots y segmentos del diario que este reemplaza.
+        """
+        with self._lock_snapshot:
+            inicio = time.perf_counter()
+            segmento = self.diario.rotar()
+            ruta = ruta_snapshot(self.directorio, segmento)
+            temporal = ruta + ".tmp"
+            with open(temporal, "wb") as archivo:
+                archivo.write(MAGIA_SNAPSHOT)
+                for producto in self.productos:
+                    archivo.write(_registro(EV_PRODUCTO, _codificar_producto(producto)))
+                for carrito in self.carritos:
+                    archivo.write(_registro(EV_CARRITO, _codificar_carrito(carrito)))
+                for pedido in self.pedidos:
+                    archivo.write(_registro(EV_PEDIDO, _codificar_pedido(pedido)))
+                archivo.flush()
+                os.fsync(archivo.fileno())
+            os.replace(temporal, ruta)
+            _fsync_directorio(self.directorio)
+            for viejo in _numerados(self.directorio, _NOMBRE_SNAPSHOT):
+                if viejo < segmento:
+                    os.remove(ruta_snapshot(self.directorio, viejo))
+            for viejo in _numerados(self.directorio, _NOMBRE_DIARIO):
+                if viejo < segmento:
+                    os.remove(ruta_diario(self.directorio, viejo))
+            self.duracion_ultimo_snapshot = time.perf_counter() - inicio
+            return segmento
+
+    async def ejecutar(self):
+        """
+        Bucle de snapshots periodicos. Se lanza como tarea en el lifespan de la aplicacion.
+        """
+        while True:
+            await asyncio.sleep(self.intervalo_snapshot)
+            await asyncio.to_thread(self.tomar_snapshot)
+
+    def cerrar(self):
+        self.diario.cerrar()
+
+
+def _fsync_directorio(directorio):
+    fd = os.open(directorio, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def recuperar(directorio, productos_iniciales=(), intervalo_fsync=DIARIO_FSYNC_MS / 1000, intervalo_snapshot=SNAPSHOT_INTERVALO_SEGUNDOS):
+    """
+    Reconstruye los almacenes desde el ultimo snapshot y la cola del diario, y
+    devuelve una Persistencia lista para seguir registrando eventos.
+    Si el directorio esta vacio se cargan los productos iniciales.
+    """
+    inicio = time.perf_counter()
+    # La recuperacion crea millones de objetos sin ciclos: el recolector solo la frenaria
+    recolector_activo = gc.isenabled()
+    gc.disable()
+    try:
+        return _recuperar(directorio, productos_iniciales, intervalo_fsync, intervalo_snapshot, inicio)
+    finally:
+        if recolector_activo:
+            gc.enable()
+
+
+def _recuperar(directorio, productos_iniciales, intervalo_fsync, intervalo_snapshot, inicio):
+    os.makedirs(directorio, exist_ok=True)
+    productos = ProductStoreDiario()
+    carritos = CartStoreDiario()
+    pedidos = OrderStoreDiario()
+    eventos = 0
+
+    snapshots = _numerados(directorio, _NOMBRE_SNAPSHOT)
+    segmento = snapshots[-1] if snapshots else 0
+    if snapshots:
+        ruta = ruta_snapshot(directorio, segmento)
+        with open(ruta, "rb") as archivo:
+            if archivo.read(len(MAGIA_SNAPSHOT)) != MAGIA_SNAPSHOT:
+                raise ValueError(f"Snapshot invalido: {ruta}")
+        # En un snapshot cada carrito aparece una sola vez, asi que se cargan en bloque.
+        # Si un usuario aparece con dos carritos (snapshot tomado durante un cambio),
+        # el diario posterior deja el que corresponde.
+        leidos = []
+        for tipo, contenido, _ in leer_registros(ruta, len(MAGIA_SNAPSHOT)):
+            if tipo == EV_CARRITO:
+                leidos.append(_decodificar_carrito(contenido))
+            else:
+                aplicar_evento(tipo, contenido, productos, carritos, pedidos)
+        carritos.cargar(leidos)
+        del leidos
+
+    segmentos = [s for s in _numerados(directorio, _NOMBRE_DIARIO) if s >= segmento]
+    for numero in segmentos:
+        ruta = ruta_diario(directorio, numero)
+        fin_valido = 0
+        for tipo, contenido, fin_valido in leer_registros(ruta):
+            aplicar_evento(tipo, contenido, productos, carritos, pedidos)
+            eventos += 1
+        # Un registro cortado al final (caida durante la escritura) se descarta,
+        # para que los eventos nuevos no queden detras de el
+        if os.path.getsize(ruta) > fin_valido:
+            os.truncate(ruta, fin_valido)
+        segmento = numero
+
+    diario = Diario(directorio, segmento, intervalo_fsync)
+    productos.diario = diario
+    carritos.diario = diario
+    pedidos.diario = diario
+    if not snapshots and not segmentos:
+        for producto in productos_iniciales:
+            productos.append(dict(producto))
+
+    persistencia = Persistencia(directorio, productos, carritos, pedidos, diario, intervalo_snapshot)
+    persistencia.duracion_recuperacion = time.perf_counter() - inicio
+    persistencia.eventos_reaplicados = eventos
+    return persistencia
@@ -0,0 +1,150 @@
+# app/db/modelos.py
+# Representacion interna compacta de un carrito.
+# Un carrito como diccionario (con una lista de diccionarios por item y dos
+# datetime) ocupa varias veces mas memoria que sus datos. Con __slots__, los
+# items en dos arrays de enteros y los timestamps como float de epoch, el costo
+# por carrito baja mucho cuando hay cientos de miles de carritos vivos.
+# El esquema Carrito de la API solo se arma al responder (a_dict). Los pedidos
+# (carritos pagados) usan la misma representacion.
+# El carrito mantiene ademas contadores (unidades y subtotal) que se actualizan
+# con cada cambio, para validar las reglas de fraude sin recorrer sus items.
+import time
+from array import array
+from datetime import datetime, timezone
+
+
+class CarritoCompacto:
+    """
+    Carrito con items en arrays paralelos: productos[i] tiene cantidades[i] unidades.
+    Los timestamps son segundos desde epoch (UTC) y el subtotal se lleva en centavos
+    para que las sumas incrementales sean exactas.
+    """
+
+    __slots__ = ("id", "user_id", "productos", "cantidades", "creado_ts", "actualizado_ts", "unidades", "subtotal_centavos")
+
+    def __init__(self, id, user_id, creado_ts=None, actualizado_ts=None, items=(), subtotal_centavos=0):
+        ahora = time.time()
+        self.id = id
+        self.user_id = user_id
+        self.creado_ts = ahora if creado_ts is None else creado_ts
+        self.actualizado_ts = self.creado_ts if actualizado_ts is None else actualizado_ts
+        self.productos = array("i")
+        self.cantidades = array("i")
+        self.unidades = 0
+        self.subtotal_centavos = 0
+        for producto_id, cantidad in items:
+            self.agregar(producto_id, cantidad)
+        self.subtotal_centavos = subtotal_centavos
+
+    def tocar(self):
+        """Marca el carrito como modificado ahora."""
+        self.actualizado_ts = time.time()
+
+    def cantidad(self, producto_id):
+        try:
+            return self.cantidades[self.productos.index(producto_id)]
+        except ValueError:
+            return 0
+
+    def agregar(self, producto_id, cantidad, precio=0.0):
+        """Suma unidades de un producto, agregandolo si no estaba, y actualiza los contadores."""
+        try:
+            self.cantidades[self.productos.index(producto_id)] += cantidad
+        except ValueError:
+            self.productos.append(producto_id)
+            self.cantidades.append(cantidad)
+        self.unidades += cantidad
+        self.subtotal_centavos += cantidad * a_centavos(precio)
+
+    def reemplazar_items(self, items):
+        """Reemplaza todos los items por las ternas (producto_id, cantidad, precio) indicadas."""
+        self.productos = array("i")
+        self.cantidades = array("i")
+        self.unidades = 0
+        self.subtotal_centavos = 0
+        for producto_id, cantidad, precio in items:
+            self.agregar(producto_id, cantidad, precio)
+
+    @property
+    def total(self):
+        return self.subtotal_centavos / 100
+
+    def items(self):
+        """Pares (producto_id, cantidad) del carrito."""
+        return zip(self.productos, self.cantidades)
+
+    @property
+    def creado_en(self):
+        return datetime.fromtimestamp(self.creado_ts, timezone.utc)
+
+    @property
+    def actualizado_en(self):
+        return datetime.fromtimestamp(self.actualizado_ts, timezone.utc)
+
+    def a_dict(self):
+        """Representacion con la forma del esquema Carrito, para las respuestas."""
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "items": [{"producto_id": pid, "cantidad": cantidad} for pid, cantidad in self.items()],
+            "creado_en": self.creado_en,
+            "actualizado_en": self.actualizado_en,
+            "total": self.total,
+        }
+
+
+def a_centavos(precio):
+    return round(precio * 100)
+
+
+class Pedido:
+    """
+    Carrito pagado: sus items con el precio cobrado (en centavos) y el momento
+    del pago. Se guarda con la misma representacion compacta que los carritos,
+    porque el historial de pedidos crece sin limite.
+    La secuencia la asigna el almacen: ordena los pedidos pagados en el mismo instante.
+    """
+
+    __slots__ = ("numero", "user_id", "carrito_id", "creado_ts", "productos", "cantidades", "precios_centavos", "total_centavos", "secuencia")
+
+    def __init__(self, numero, user_id, carrito_id, items=(), creado_ts=None):
+        self.numero = numero
+        self.user_id = user_id
+        self.carrito_id = carrito_id
+        self.creado_ts = time.time() if creado_ts is None else creado_ts
+        self.productos = array("i")
+        self.cantidades = array("i")
+        self.precios_centavos = array("q")
+        self.total_centavos = 0
+        self.secuencia = None
+        for producto_id, cantidad, precio_centavos in items:
+            self.productos.append(producto_id)
+            self.cantidades.append(cantidad)
+            self.precios_centavos.append(precio_centavos)
+            self.total_centavos += cantidad * precio_centavos
+
+    @property
+    def clave_orden(self):
+        return (self.creado_ts, self.secuencia)
+
+    def items(self):
+        """Ternas (producto_id, cantidad, precio_centavos) del pedido."""
+        return zip(self.productos, self.cantidades, self.precios_centavos)
+
+    @property
+    def creado_en(self):
+        return datetime.fromtimestamp(self.creado_ts, timezone.utc)
+
+    def a_dict(self):
+        """Representacion con la forma del esquema Pedido, para las respuestas."""
+        return {
+            "numero_seguimiento": self.numero,
+            "user_id": self.user_id,
+            "carrito_id": self.carrito_id,
+            "items": [
+                {"producto_id": pid, "cantidad": cantidad, "precio": precio / 100}
+                for pid, cantidad, precio in self.items()
+            ],
+            "total": self.total_centavos / 100,
+            "creado_en": self.creado_en,
+        }
@@ -0,0 +1,183 @@
+# app/db/repository.py
+# Interfaces de los repositorios de productos, carritos y pedidos.
+# Cada backend (memoria, SQLite) implementa estas mismas operaciones.
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+
+
+class ProductRepository(ABC):
+    """
+    Operaciones sobre la tabla de productos.
+    """
+
+    # Si conviene agrupar los descuentos de stock en micro-lotes (app/lotes_pago.py):
+    # cuando cada descuento paga un costo fijo alto, como un commit o un lock entre procesos
+    agrupar_descuentos = True
+
+    @property
+    @abstractmethod
+    def version(self):
+        """
+        Version del catalogo. Cambia cada vez que se agrega, elimina o
+        descuenta stock de un producto; sirve para invalidar caches.
+        """
+
+    @property
+    def version_catalogo(self):
+        """
+        Version de los nombres y precios del catalogo (sin contar el stock).
+        Por defecto es la version completa, lo que solo regenera los indices mas seguido.
+        """
+        return self.version
+
+    @abstractmethod
+    def get(self, producto_id):
+        """Devuelve el producto con ese ID o None."""
+
+    @abstractmethod
+    def append(self, producto):
+        """Agrega (o reemplaza) un producto."""
+
+    @abstractmethod
+    def descontar_stock(self, cantidades):
+        """
+        Resta del stock las cantidades indicadas ({producto_id: cantidad}).
+        Es todo o nada: si algun producto no alcanza no se modifica ninguno y
+        se devuelve ese producto. Devuelve None si el descuento se aplico.
+        """
+
+    def descontar_stock_lote(self, lista_cantidades):
+        """
+        Aplica varios descuentos en orden, cada uno todo o nada como en
+        descontar_stock, y devuelve un resultado por descuento.
+        Los backends pueden redefinirlo para aplicar el lote en una sola pasada.
+        """
+        return [self.descontar_stock(cantidades) for cantidades in lista_cantidades]
+
+    @abstractmethod
+    def clear(self):
+        """Elimina todos los productos."""
+
+    @abstractmethod
+    def __iter__(self):
+        """Itera sobre una copia de los productos."""
+
+    @abstractmethod
+    def __len__(self):
+        """Cantidad de productos."""
+
+    def __getitem__(self, indice):
+        return list(self)[indice]
+
+
+class CartRepository(ABC):
+    """
+    Operaciones sobre la tabla de carritos.
+    """
+
+    # Funciones que se llaman con los carritos que salen de la tabla
+    _oyentes_bajas = ()
+
+    def al_quitar(self, funcion):
+        """
+        Registra funcion(carritos), que se llama con los carritos que salen de la
+        tabla por baja, expiracion o vaciado (la usa el libro de reservas).
+        """
+        self._oyentes_bajas = self._oyentes_bajas + (funcion,)
+
+    def _carritos_quitados(self, carritos):
+        for funcion in self._oyentes_bajas:
+            funcion(carritos)
+
+    @abstractmethod
+    def get(self, carrito_id):
+        """Devuelve el carrito con ese ID o None."""
+
+    @abstractmethod
+    def get_por_usuario(self, user_id):
+        """Devuelve el carrito activo del usuario o None."""
+
+    @abstractmethod
+    def add(self, carrito):
+        """Agrega un carrito. Devuelve False si el usuario ya tiene uno activo."""
+
+    @abstractmethod
+    def save(self, carrito):
+        """Persiste los cambios (items, actualizado_en) de un carrito existente."""
+
+    def edicion(self):
+        """
+        Contexto para leer, modificar y guardar (save) un carrito sin que otro hilo
+        o worker lo modifique en el medio. Lo ya escrito no se deshace si la
+        operacion termina con una excepcion. Por defecto no hace nada: en memoria
+        la operacion corre en el event loop sin awaits intermedios.
+        """
+        return nullcontext()
+
+    @abstractmethod
+    def remove(self, carrito):
+        """Elimina un carrito. Devuelve False si ya no estaba en la tabla."""
+
+    @abstractmethod
+    def paginar(self, cursor=None, limite=100, user_id=None, actualizado_desde=None):
+        """
+        Devuelve (carritos, siguiente_cursor) en orden de alta, a partir del cursor.
+        Filtra opcionalmente por usuario y por actualizado_en >= actualizado_desde.
+        siguiente_cursor es None cuando no quedan mas paginas.
+        Lanza ValueError si el cursor no es valido.
+        """
+
+    @abstractmethod
+    def expirar(self, limite):
+        """Elimina los carritos con actualizado_en anterior a limite y los devuelve."""
+
+    @abstractmethod
+    def clear(self):
+        """Elimina todos los carritos."""
+
+    @abstractmethod
+    def __iter__(self):
+        """Itera sobre una copia de los carritos."""
+
+    @abstractmethod
+    def __len__(self):
+        """Cantidad de carritos."""
+
+
+class OrderRepository(ABC):
+    """
+    Historial de pedidos pagados. Solo se agregan pedidos: nunca se modifican.
+    """
+
+    @abstractmethod
+    def get(self, numero):
+        """Devuelve el pedido con ese numero de seguimiento o None."""
+
+    @abstractmethod
+    def add(self, pedido):
+        """
+        Agrega un pedido y le asigna su secuencia.
+        Devuelve False si ya hay un pedido con ese numero de seguimiento.
+        """
+
+    @abstractmethod
+    def por_usuario(self, user_id, cursor=None, limite=50, desde=None, hasta=None):
+        """
+        Devuelve (pedidos, siguiente_cursor) del usuario, del mas nuevo al mas viejo.
+        Filtra opcionalmente por creado_en >= desde y creado_en < hasta.
+        El cursor es el numero del ultimo pedido de la pagina anterior;
+        siguiente_cursor es None cuando no quedan mas paginas.
+        Lanza ValueError si el cursor no es un pedido del usuario.
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Elimina todos los pedidos."""
+
+    @abstractmethod
+    def __iter__(self):
+        """Itera sobre una copia de los pedidos, en orden de alta."""
+
+    @abstractmethod
+    def __len__(self):
+        """Cantidad de pedidos."""
@@ -0,0 +1,394 @@
+# app/db/sqlite.py
+# Backend persistente sobre SQLite en modo WAL.
+# Permite reiniciar el servicio sin perder carritos ni stock y que varios
+# workers de uvicorn compartan el mismo estado.
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from app.db.modelos import CarritoCompacto, Pedido
+from app.db.repository import CartRepository, OrderRepository, ProductRepository
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS productos (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    precio REAL NOT NULL,
+    stock INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS carritos (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    items TEXT NOT NULL,
+    subtotal_centavos INTEGER NOT NULL DEFAULT 0,
+    creado_en TEXT NOT NULL,
+    actualizado_en TEXT NOT NULL
+);
+-- Version del catalogo, compartida por todos los workers
+CREATE TABLE IF NOT EXISTS catalogo_version (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalogo_version (id, version) VALUES (0, 0);
+-- Un unico carrito activo por usuario, garantizado por la base entre todos los workers
+CREATE UNIQUE INDEX IF NOT EXISTS idx_carritos_user_id ON carritos (user_id);
+-- Orden temporal para expirar carritos inactivos sin recorrer la tabla
+CREATE INDEX IF NOT EXISTS idx_carritos_actualizado_en ON carritos (actualizado_en);
+-- Historial de pedidos: la secuencia es el rowid y el numero de seguimiento es unico
+CREATE TABLE IF NOT EXISTS pedidos (
+    secuencia INTEGER PRIMARY KEY,
+    numero TEXT NOT NULL UNIQUE,
+    user_id TEXT NOT NULL,
+    carrito_id TEXT NOT NULL,
+    items TEXT NOT NULL,
+    total_centavos INTEGER NOT NULL,
+    creado_ts REAL NOT NULL
+);
+-- Historial de cada usuario en orden temporal, para paginar y filtrar por fechas
+CREATE INDEX IF NOT EXISTS idx_pedidos_user_id_creado ON pedidos (user_id, creado_ts, secuencia);
+"""
+
+SQL_NUEVA_VERSION = "UPDATE catalogo_version SET version = version + 1"
+
+
+class SQLitePool:
+    """
+    Conexiones a un archivo SQLite, una por hilo del worker.
+    Los handlers son async, pero con este backend ejecutan sus operaciones sobre
+    los almacenes en hilos (app.utils.en_almacen): una espera del lock de
+    escritura no frena el event loop. Cada hilo reutiliza su propia conexion en
+    lugar de abrir una por peticion.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self.conexion()
+        conn.executescript(ESQUEMA)
+        # Bases creadas antes de que el carrito llevara su subtotal
+        columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(carritos)")}
+        if "subtotal_centavos" not in columnas:
+            conn.execute("ALTER TABLE carritos ADD COLUMN subtotal_centavos INTEGER NOT NULL DEFAULT 0")
+
+    def conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def transaccion(self):
+        return _Transaccion(self.conexion())
+
+
+class _Transaccion:
+    """
+    Transaccion de escritura: toma el lock de escritura al comenzar
+    (BEGIN IMMEDIATE) para que la lectura y la escritura sean atomicas.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, tipo_error, error, traza):
+        self.conn.execute("ROLLBACK" if tipo_error else "COMMIT")
+        return False
+
+
+class _Edicion(_Transaccion):
+    """
+    Transaccion de una lectura-modificacion-escritura de carritos. Como en
+    memoria, un error de la aplicacion (por ejemplo un 410 tras eliminar el
+    carrito expirado) no deshace lo ya escrito; un error de la base, si.
+    """
+
+    def __exit__(self, tipo_error, error, traza):
+        self.conn.execute("ROLLBACK" if tipo_error and issubclass(tipo_error, sqlite3.Error) else "COMMIT")
+        return False
+
+
+class _StockInsuficiente(Exception):
+    def __init__(self, producto):
+        self.producto = producto
+
+
+def _fila_a_producto(fila):
+    return {"id": fila["id"], "nombre": fila["nombre"], "precio": fila["precio"], "stock": fila["stock"]}
+
+
+def _fila_a_carrito(fila):
+    return CarritoCompacto(
+        fila["id"],
+        fila["user_id"],
+        creado_ts=datetime.fromisoformat(fila["creado_en"]).timestamp(),
+        actualizado_ts=datetime.fromisoformat(fila["actualizado_en"]).timestamp(),
+        items=[(item["producto_id"], item["cantidad"]) for item in json.loads(fila["items"])],
+        subtotal_centavos=fila["subtotal_centavos"],
+    )
+
+
+def _items_json(carrito):
+    return json.dumps([{"producto_id": pid, "cantidad": cantidad} for pid, cantidad in carrito.items()])
+
+
+def _fila_a_pedido(fila):
+    pedido = Pedido(
+        fila["numero"],
+        fila["user_id"],
+        fila["carrito_id"],
+        items=[(item["producto_id"], item["cantidad"], item["precio_centavos"]) for item in json.loads(fila["items"])],
+        creado_ts=fila["creado_ts"],
+    )
+    pedido.secuencia = fila["secuencia"]
+    return pedido
+
+
+def _descontar(conn, cantidades):
+    for pid, cantidad in cantidades.items():
+        # Descuento condicional: solo se aplica si queda stock suficiente
+        cursor = conn.execute(
+            "UPDATE productos SET stock = stock - ? WHERE id = ? AND stock >= ?",
+            (cantidad, pid, cantidad),
+        )
+        if cursor.rowcount == 0:
+            fila = conn.execute("SELECT * FROM productos WHERE id = ?", (pid,)).fetchone()
+            if fila is None:
+                raise KeyError(pid)
+            # La excepcion deshace los descuentos ya aplicados (transaccion o savepoint)
+            raise _StockInsuficiente(_fila_a_producto(fila))
+
+
+class SQLiteProductStore(ProductRepository):
+    """
+    Tabla de productos en SQLite. Si la tabla esta vacia se carga con los productos iniciales.
+    """
+
+    def __init__(self, pool, productos_iniciales=()):
+        self._pool = pool
+        with pool.transaccion() as conn:
+            vacia = conn.execute("SELECT 1 FROM productos LIMIT 1").fetchone() is None
+            if vacia:
+                conn.executemany(
+                    "INSERT INTO productos (id, nombre, precio, stock) VALUES (:id, :nombre, :precio, :stock)",
+                    productos_iniciales,
+                )
+
+    @property
+    def version(self):
+        return self._pool.conexion().execute("SELECT version FROM catalogo_version").fetchone()[0]
+
+    def get(self, producto_id):
+        fila = self._pool.conexion().execute("SELECT * FROM productos WHERE id = ?", (producto_id,)).fetchone()
+        return _fila_a_producto(fila) if fila else None
+
+    def append(self, producto):
+        with self._pool.transaccion() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO productos (id, nombre, precio, stock) VALUES (:id, :nombre, :precio, :stock)",
+                producto,
+            )
+            conn.execute(SQL_NUEVA_VERSION)
+
+    def descontar_stock(self, cantidades):
+        try:
+            with self._pool.transaccion() as conn:
+                _descontar(conn, cantidades)
+                conn.execute(SQL_NUEVA_VERSION)
+        except _StockInsuficiente as error:
+            return error.producto
+        return None
+
+    def descontar_stock_lote(self, lista_cantidades):
+        # Una sola transaccion (y un solo commit) para todo el lote; cada descuento
+        # va en un savepoint que se deshace si le falta stock
+        resultados = []
+        with self._pool.transaccion() as conn:
+            for cantidades in lista_cantidades:
+                conn.execute("SAVEPOINT descuento")
+                try:
+                    _descontar(conn, cantidades)
+                except _StockInsuficiente as error:
+                    conn.execute("ROLLBACK TO descuento")
+                    resultados.append(error.producto)
+                else:
+                    resultados.append(None)
+                conn.execute("RELEASE descuento")
+            if None in resultados:
+                conn.execute(SQL_NUEVA_VERSION)
+        return resultados
+
+    def clear(self):
+        with self._pool.transaccion() as conn:
+            conn.execute("DELETE FROM productos")
+            conn.execute(SQL_NUEVA_VERSION)
+
+    def __iter__(self):
+        filas = self._pool.conexion().execute("SELECT * FROM productos ORDER BY rowid").fetchall()
+        return iter([_fila_a_producto(fila) for fila in filas])
+
+    def __len__(self):
+        return self._pool.conexion().execute("SELECT COUNT(*) FROM productos").fetchone()[0]
+
+
+class SQLiteCartStore(CartRepository):
+    """
+    Tabla de carritos en SQLite, indexada por ID (clave primaria) y por user_id (indice unico).
+    Los carritos se devuelven como objetos nuevos: los cambios se guardan con save().
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def get(self, carrito_id):
+        fila = self._pool.conexion().execute("SELECT * FROM carritos WHERE id = ?", (carrito_id,)).fetchone()
+        return _fila_a_carrito(fila) if fila else None
+
+    def get_por_usuario(self, user_id):
+        fila = self._pool.conexion().execute("SELECT * FROM carritos WHERE user_id = ?", (user_id,)).fetchone()
+        return _fila_a_carrito(fila) if fila else None
+
+    def add(self, carrito):
+        try:
+            self._pool.conexion().execute(
+                "INSERT INTO carritos (id, user_id, items, subtotal_centavos, creado_en, actualizado_en) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    carrito.id,
+                    carrito.user_id,
+                    _items_json(carrito),
+                    carrito.subtotal_centavos,
+                    carrito.creado_en.isoformat(),
+                    carrito.actualizado_en.isoformat(),
+                ),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def save(self, carrito):
+        self._pool.conexion().execute(
+            "UPDATE carritos SET items = ?, subtotal_centavos = ?, actualizado_en = ? WHERE id = ?",
+            (_items_json(carrito), carrito.subtotal_centavos, carrito.actualizado_en.isoformat(), carrito.id),
+        )
+
+    def edicion(self):
+        # El lock de escritura se toma antes de leer: un PATCH o PUT simultaneo del
+        # mismo carrito, en otro hilo o worker, espera y lee lo que este guardo
+        return _Edicion(self._pool.conexion())
+
+    def remove(self, carrito):
+        cursor = self._pool.conexion().execute("DELETE FROM carritos WHERE id = ?", (carrito.id,))
+        if cursor.rowcount == 0:
+            return False
+        self._carritos_quitados((carrito,))
+        return True
+
+    def paginar(self, cursor=None, limite=100, user_id=None, actualizado_desde=None):
+        # El cursor es el rowid: la clave del arbol de la tabla, por lo que retomar es O(log n)
+        condiciones = ["rowid > ?"]
+        parametros = [-1 if cursor is None else int(cursor)]
+        if user_id is not None:
+            condiciones.append("user_id = ?")
+            parametros.append(user_id)
+        if actualizado_desde is not None:
+            condiciones.append("actualizado_en >= ?")
+            parametros.append(actualizado_desde.isoformat())
+        parametros.append(limite)
+        filas = self._pool.conexion().execute(
+            f"SELECT rowid, * FROM carritos WHERE {' AND '.join(condiciones)} ORDER BY rowid LIMIT ?",
+            parametros,
+        ).fetchall()
+        siguiente = str(filas[-1]["rowid"]) if len(filas) == limite else None
+        return [_fila_a_carrito(fila) for fila in filas], siguiente
+
+    def expirar(self, limite):
+        # Los timestamps se guardan en ISO-8601 UTC, por lo que el orden de texto es el temporal
+        filas = self._pool.conexion().execute(
+            "DELETE FROM carritos WHERE actualizado_en < ? RETURNING *", (limite.isoformat(),)
+        ).fetchall()
+        expirados = [_fila_a_carrito(fila) for fila in filas]
+        self._carritos_quitados(expirados)
+        return expirados
+
+    def clear(self):
+        filas = self._pool.conexion().execute("DELETE FROM carritos RETURNING *").fetchall()
+        self._carritos_quitados([_fila_a_carrito(fila) for fila in filas])
+
+    def __iter__(self):
+        filas = self._pool.conexion().execute("SELECT * FROM carritos ORDER BY rowid").fetchall()
+        return iter([_fila_a_carrito(fila) for fila in filas])
+
+    def __len__(self):
+        return self._pool.conexion().execute("SELECT COUNT(*) FROM carritos").fetchone()[0]
+
+
+class SQLiteOrderStore(OrderRepository):
+    """
+    Tabla de pedidos en SQLite, indexada por numero de seguimiento (indice unico)
+    y por (user_id, creado_ts, secuencia) para el historial de cada usuario.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def get(self, numero):
+        fila = self._pool.conexion().execute("SELECT * FROM pedidos WHERE numero = ?", (numero,)).fetchone()
+        return _fila_a_pedido(fila) if fila else None
+
+    def add(self, pedido):
+        items = json.dumps([
+            {"producto_id": pid, "cantidad": cantidad, "precio_centavos": precio}
+            for pid, cantidad, precio in pedido.items()
+        ])
+        try:
+            cursor = self._pool.conexion().execute(
+                "INSERT INTO pedidos (numero, user_id, carrito_id, items, total_centavos, creado_ts) VALUES (?, ?, ?, ?, ?, ?)",
+                (pedido.numero, pedido.user_id, pedido.carrito_id, items, pedido.total_centavos, pedido.creado_ts),
+            )
+        except sqlite3.IntegrityError:
+            return False
+        pedido.secuencia = cursor.lastrowid
+        return True
+
+    def por_usuario(self, user_id, cursor=None, limite=50, desde=None, hasta=None):
+        conn = self._pool.conexion()
+        condiciones = ["user_id = ?"]
+        parametros = [user_id]
+        if cursor is not None:
+            anterior = conn.execute("SELECT user_id, creado_ts, secuencia FROM pedidos WHERE numero = ?", (cursor,)).fetchone()
+            if anterior is None or anterior["user_id"] != user_id:
+                raise ValueError(cursor)
+            condiciones.append("(creado_ts, secuencia) < (?, ?)")
+            parametros += [anterior["creado_ts"], anterior["secuencia"]]
+        if desde is not None:
+            condiciones.append("creado_ts >= ?")
+            parametros.append(desde.timestamp())
+        if hasta is not None:
+            condiciones.append("creado_ts < ?")
+            parametros.append(hasta.timestamp())
+        # Una fila de mas indica si queda otra pagina; el indice resuelve el orden y el rango
+        parametros.append(limite + 1)
+        filas = conn.execute(
+            f"SELECT * FROM pedidos WHERE {' AND '.join(condiciones)} ORDER BY creado_ts DESC, secuencia DESC LIMIT ?",
+            parametros,
+        ).fetchall()
+        pedidos = [_fila_a_pedido(fila) for fila in filas[:limite]]
+        siguiente = pedidos[-1].numero if len(filas) > limite else None
+        return pedidos, siguiente
+
+    def clear(self):
+        self._pool.conexion().execute("DELETE FROM pedidos")
+
+    def __iter__(self):
+        filas = self._pool.conexion().execute("SELECT * FROM pedidos ORDER BY secuencia").fetchall()
+        return iter([_fila_a_pedido(fila) for fila in filas])
+
+    def __len__(self):
+        return self._pool.conexion().execute("SELECT COUNT(*) FROM pedidos").fetchone()[0]
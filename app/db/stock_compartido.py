@@ -0,0 +1,150 @@
+# app/db/stock_compartido.py
+# Stock de productos compartido entre procesos, para el modo shards.
+# Los carritos se reparten entre procesos, pero el stock es uno solo: vive en un
+# archivo mapeado en memoria (en /dev/shm, memoria compartida) como un array de
+# enteros de 64 bits. Cada producto se protege con un lock de hilo (dentro del
+# proceso) y un lock de rango de bytes de fcntl sobre su posicion (entre procesos),
+# asi que los pagos de productos distintos tampoco se bloquean entre si.
+import fcntl
+import mmap
+import os
+import struct
+import threading
+
+from app.db.repository import ProductRepository
+
+_ENTERO = struct.Struct("<q")
+
+
+def crear_stock_compartido(ruta, productos):
+    """
+    Crea el archivo de stock compartido: posicion 0 la version del catalogo y
+    posicion i + 1 el stock del producto i de `productos`.
+    """
+    valores = [0] + [producto["stock"] for producto in productos]
+    with open(ruta, "wb") as archivo:
+        archivo.write(struct.pack(f"<{len(valores)}q", *valores))
+
+
+class SharedProductStore(ProductRepository):
+    """
+    Catalogo fijo (los mismos productos, en el mismo orden, en todos los procesos)
+    con el stock y la version en memoria compartida.
+    Los productos se devuelven como diccionarios nuevos con el stock del momento.
+    """
+
+    def __init__(self, ruta, productos):
+        self.ruta = ruta
+        self._catalogo = {producto["id"]: (producto["nombre"], producto["precio"]) for producto in productos}
+        self._posicion = {producto["id"]: i + 1 for i, producto in enumerate(productos)}
+        # Un solo descriptor por proceso: cerrar otro descriptor del archivo liberaria los locks de fcntl
+        self._fd = os.open(ruta, os.O_RDWR)
+        self._memoria = mmap.mmap(self._fd, 0)
+        if len(self._memoria) != _ENTERO.size * (len(productos) + 1):
+            raise ValueError(f"El stock compartido {ruta} no corresponde al catalogo")
+        self._valores = memoryview(self._memoria).cast("q")
+        self._locks = {pid: threading.Lock() for pid in self._posicion}
+        self._lock_version = threading.Lock()
+
+    def _bloquear(self, lock, posicion):
+        lock.acquire()
+        try:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, _ENTERO.size, posicion * _ENTERO.size)
+        except BaseException:
+            lock.release()
+            raise
+
+    def _desbloquear(self, lock, posicion):
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, _ENTERO.size, posicion * _ENTERO.size)
+        lock.release()
+
+    @property
+    def version(self):
+        return self._valores[0]
+
+    @property
+    def version_catalogo(self):
+        # El catalogo es fijo: solo cambia el stock
+        return 0
+
+    def _nueva_version(self):
+        self._bloquear(self._lock_version, 0)
+        try:
+            self._valores[0] += 1
+        finally:
+            self._desbloquear(self._lock_version, 0)
+
+    def _producto(self, producto_id):
+        nombre, precio = self._catalogo[producto_id]
+        return {"id": producto_id, "nombre": nombre, "precio": precio, "stock": self._valores[self._posicion[producto_id]]}
+
+    def get(self, producto_id):
+        if producto_id not in self._catalogo:
+            return None
+        return self._producto(producto_id)
+
+    def append(self, producto):
+        # El catalogo es fijo: solo se puede reponer el stock de un producto existente
+        if producto["id"] not in self._catalogo:
+            raise ValueError("En modo shards el catalogo es fijo: no se pueden agregar productos")
+        posicion = self._posicion[producto["id"]]
+        self._bloquear(self._locks[producto["id"]], posicion)
+        try:
+            self._valores[posicion] = producto["stock"]
+        finally:
+            self._desbloquear(self._locks[producto["id"]], posicion)
+        self._nueva_version()
+
+    def descontar_stock(self, cantidades):
+        # Los locks se toman en orden de ID, en todos los procesos, para que dos pagos no se bloqueen mutuamente
+        pids = sorted(cantidades)
+        bloqueos = [(self._locks[pid], self._posicion[pid]) for pid in pids]
+        tomados = []
+        try:
+            for lock, posicion in bloqueos:
+                self._bloquear(lock, posicion)
+                tomados.append((lock, posicion))
+            for pid in pids:
+                if self._valores[self._posicion[pid]] < cantidades[pid]:
+                    return self._producto(pid)
+            for pid in pids:
+                self._valores[self._posicion[pid]] -= cantidades[pid]
+        finally:
+            for lock, posicion in reversed(tomados):
+                self._desbloquear(lock, posicion)
+        self._nueva_version()
+        return None
+
+    def descontar_stock_lote(self, lista_cantidades):
+        # Una sola toma de locks (de hilo y de fcntl) y un solo cambio de version para todo el lote
+        pids = sorted(set().union(*lista_cantidades))
+        bloqueos = [(self._locks[pid], self._posicion[pid]) for pid in pids]
+        tomados = []
+        resultados = []
+        try:
+            for lock, posicion in bloqueos:
+                self._bloquear(lock, posicion)
+                tomados.append((lock, posicion))
+            for cantidades in lista_cantidades:
+                sin_stock = next((pid for pid, cantidad in cantidades.items() if self._valores[self._posicion[pid]] < cantidad), None)
+                if sin_stock is None:
+                    for pid, cantidad in cantidades.items():
+                        self._valores[self._posicion[pid]] -= cantidad
+                    resultados.append(None)
+                else:
+                    resultados.append(self._producto(sin_stock))
+        finally:
+            for lock, posicion in reversed(tomados):
+                self._desbloquear(lock, posicion)
+        if None in resultados:
+            self._nueva_version()
+        return resultados
+
+    def clear(self):
+        raise ValueError("En modo shards el catalogo es fijo: no se pueden eliminar productos")
+
+    def __iter__(self):
+        return iter([self._producto(pid) for pid in self._catalogo])
+
+    def __len__(self):
+        return len(self._catalogo)
@@ -0,0 +1,273 @@
+# app/eventos.py
+# Eventos en vivo de stock y carritos, para que los clientes no tengan que
+# consultar GET /productos y GET /carritos/{id} una y otra vez.
+# - stock: stock disponible de un producto (el mismo que publica GET /productos).
+# - carrito_actualizado: contenido de un carrito tras un PATCH o PUT.
+# - carrito_eliminado / carrito_expirado: el carrito se pago, se elimino o expiro.
+# Los suscriptores esperan sobre un futuro de su propio event loop: miles de
+# conexiones inactivas no consumen CPU. Los cambios de stock de un producto se
+# agrupan durante una ventana corta y se reparten una sola vez con el ultimo
+# valor; cada suscriptor ademas reemplaza los eventos que aun no leyo por el mas
+# nuevo de la misma clave, asi que un cliente lento nunca acumula historia vieja.
+# En modo shards cada shard publica los eventos de sus carritos, y el stock lo
+# publica cada shard a sus suscriptores: el repartidor sondea la version del stock
+# compartido y, cuando cambia (un pago en cualquier shard), publica los productos
+# cuyo stock difiere del ultimo visto.
+import asyncio
+import json
+import threading
+from collections import OrderedDict
+
+from app.config import EVENTOS_MAX_PENDIENTES, EVENTOS_SONDEO_STOCK_MS, EVENTOS_VENTANA_STOCK_MS, SHARDS
+from app.db.database import productos_db
+from app.expiracion import barredor
+from app.metricas import Contador, Medidor
+from app.reservas import reservas
+from app.serializacion import carrito_a_json
+from app.utils import completar_futuro, en_almacen
+
+eventos_publicados = Contador("eventos_publicados_total", "Eventos entregados a suscriptores, por tipo.", ("tipo",))
+
+
+class Suscriptor:
+    """
+    Conexion suscrita a los eventos de ciertos productos y carritos. Guarda los
+    eventos pendientes por clave: uno nuevo con la misma clave reemplaza al anterior.
+    """
+
+    def __init__(self, productos, carritos, maximo_pendientes):
+        self.productos = productos
+        self.carritos = carritos
+        self.maximo_pendientes = maximo_pendientes
+        self.loop = asyncio.get_running_loop()
+        # Sin leer a tiempo: la conexion se corta y el cliente se vuelve a suscribir
+        self.desbordado = False
+        self.cerrado = False
+        # clave -> (tipo, datos_json)
+        self._pendientes = OrderedDict()
+        self._aviso = None
+        self._lock = threading.Lock()
+
+    def entregar(self, clave, evento):
+        with self._lock:
+            if self.cerrado:
+                return
+            if clave not in self._pendientes and len(self._pendientes) >= self.maximo_pendientes:
+                self.desbordado = self.cerrado = True
+            else:
+                self._pendientes[clave] = evento
+            aviso, self._aviso = self._aviso, None
+        if aviso is not None:
+            completar_futuro(self.loop, aviso)
+
+    def cerrar(self):
+        with self._lock:
+            self.cerrado = True
+            aviso, self._aviso = self._aviso, None
+        if aviso is not None:
+            completar_futuro(self.loop, aviso)
+
+    async def siguientes(self, espera):
+        """
+        Espera hasta `espera` segundos y devuelve los eventos pendientes
+        [(tipo, datos_json)], o una lista vacia si no llego ninguno.
+        """
+        with self._lock:
+            if not self._pendientes and not self.cerrado:
+                self._aviso = aviso = self.loop.create_future()
+            else:
+                aviso = None
+        if aviso is not None:
+            try:
+                await asyncio.wait_for(aviso, espera)
+            except asyncio.TimeoutError:
+                pass
+        with self._lock:
+            self._aviso = None
+            eventos = list(self._pendientes.values())
+            self._pendientes.clear()
+        return eventos
+
+
+class BusEventos:
+    """
+    Reparte los eventos entre los suscriptores interesados. Publicar cuesta
+    O(suscriptores del producto o carrito), y nada si no hay ninguno.
+    Los cambios de stock los reparte una tarea en el loop de los suscriptores,
+    una vez por ventana. Con `sondeo_stock_ms` (stock compartido entre shards)
+    esa tarea ademas mira la version del stock cada tanto, para publicar los
+    cambios hechos por otros procesos.
+    """
+
+    def __init__(self, productos, reservas, ventana_stock_ms=EVENTOS_VENTANA_STOCK_MS, maximo_pendientes=EVENTOS_MAX_PENDIENTES,
+                 sondeo_stock_ms=EVENTOS_SONDEO_STOCK_MS if SHARDS > 1 else 0):
+        self.productos = productos
+        self.reservas = reservas
+        self.ventana_stock = ventana_stock_ms / 1000
+        self.maximo_pendientes = maximo_pendientes
+        self.sondeo_stock = sondeo_stock_ms / 1000 if sondeo_stock_ms > 0 else None
+        # Ultima version del stock compartido revisada y el stock visto por producto
+        self._version_vista = None
+        self._stock_visto = {}
+        # Suscriptores por producto y por carrito; los de todo el catalogo aparte
+        self._por_producto = {}
+        self._por_carrito = {}
+        self._todo_el_stock = set()
+        self._cantidad = 0
+        # Productos con cambios sin repartir y la tarea que los reparte
+        self._stock_pendiente = set()
+        self._repartidor = None
+        self._aviso = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._cantidad
+
+    def suscribir(self, productos=None, carritos=()):
+        """
+        Suscribe la conexion actual (debe llamarse desde su event loop).
+        productos=None recibe el stock de todo el catalogo; () ninguno.
+        """
+        suscriptor = Suscriptor(None if productos is None else set(productos), set(carritos), self.maximo_pendientes)
+        with self._lock:
+            if productos is None:
+                self._todo_el_stock.add(suscriptor)
+            for pid in productos or ():
+                self._por_producto.setdefault(pid, set()).add(suscriptor)
+            for carrito_id in carritos:
+                self._por_carrito.setdefault(carrito_id, set()).add(suscriptor)
+            self._cantidad += 1
+            if (productos is None or productos) and not self._repartidor_vivo():
+                # El repartidor vive en el loop de los suscriptores; si ese loop ya
+                # no existe (otro hilo, otro test) se lanza uno nuevo en este
+                self._repartidor = (suscriptor.loop, suscriptor.loop.create_task(self._repartir_stock()))
+                self._aviso = None
+        return suscriptor
+
+    def _repartidor_vivo(self):
+        return self._repartidor is not None and not self._repartidor[0].is_closed() and not self._repartidor[1].done()
+
+    def desuscribir(self, suscriptor):
+        suscriptor.cerrar()
+        with self._lock:
+            self._todo_el_stock.discard(suscriptor)
+            for indice, claves in ((self._por_producto, suscriptor.productos or ()), (self._por_carrito, suscriptor.carritos)):
+                for clave in claves:
+                    suscriptores = indice.get(clave)
+                    if suscriptores is not None:
+                        suscriptores.discard(suscriptor)
+                        if not suscriptores:
+                            del indice[clave]
+            self._cantidad -= 1
+            repartidor = None
+            if not self._todo_el_stock and not self._por_producto:
+                repartidor, self._repartidor = self._repartidor, None
+        if repartidor is not None:
+            loop, tarea = repartidor
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(tarea.cancel)
+
+    # --- Publicacion (desde los puntos de cambio de app/routers/carritos.py) ---
+
+    def stock_cambiado(self, producto_ids):
+        """
+        Marca productos cuyo stock disponible cambio; se reparten al cerrar la ventana.
+        """
+        with self._lock:
+            if not self._todo_el_stock and not any(pid in self._por_producto for pid in producto_ids):
+                return
+            self._stock_pendiente.update(producto_ids)
+            aviso, self._aviso = self._aviso, None
+            repartidor = self._repartidor
+        if aviso is not None and repartidor is not None:
+            completar_futuro(repartidor[0], aviso)
+
+    def carrito_actualizado(self, carrito):
+        suscriptores = self._por_carrito.get(carrito.id)
+        if suscriptores:
+            datos = b'{"tipo":"carrito_actualizado","carrito":' + carrito_a_json(carrito) + b"}"
+            self._entregar(list(suscriptores), carrito.id, ("carrito_actualizado", datos))
+
+    def carrito_quitado(self, carrito, expirado=False):
+        """
+        El carrito se elimino (por DELETE, pago o expiracion): se avisa a sus
+        suscriptores y cambia el stock disponible de sus productos.
+        """
+        suscriptores = self._por_carrito.get(carrito.id)
+        if suscriptores:
+            tipo = "carrito_expirado" if expirado else "carrito_eliminado"
+            datos = json.dumps({"tipo": tipo, "carrito_id": carrito.id}).encode()
+            self._entregar(list(suscriptores), carrito.id, (tipo, datos))
+        self.stock_cambiado([pid for pid, _ in carrito.items()])
+
+    def carritos_expirados(self, carritos):
+        for carrito in carritos:
+            self.carrito_quitado(carrito, expirado=True)
+
+    def _entregar(self, suscriptores, clave, evento):
+        for suscriptor in suscriptores:
+            suscriptor.entregar(clave, evento)
+        eventos_publicados.inc(evento[0], cantidad=len(suscriptores))
+
+    async def _repartir_stock(self):
+        loop = asyncio.get_running_loop()
+        if self.sondeo_stock is not None:
+            self._cambios_compartidos()
+        while True:
+            with self._lock:
+                if not self._stock_pendiente:
+                    self._aviso = aviso = loop.create_future()
+                else:
+                    aviso = None
+            avisado = True
+            if aviso is not None:
+                try:
+                    # Sin sondeo se espera solo a los cambios de este proceso
+                    await asyncio.wait_for(aviso, self.sondeo_stock)
+                except asyncio.TimeoutError:
+                    avisado = False
+            if avisado:
+                # Ventana de agrupamiento: los cambios que lleguen mientras tanto salen juntos
+                await asyncio.sleep(self.ventana_stock)
+            with self._lock:
+                producto_ids, self._stock_pendiente = self._stock_pendiente, set()
+            if self.sondeo_stock is not None:
+                producto_ids |= self._cambios_compartidos()
+            if producto_ids:
+                await en_almacen(self._publicar_stocks, producto_ids)
+
+    def _cambios_compartidos(self):
+        """
+        Productos cuyo stock cambio desde la ultima revision, si cambio la version
+        del stock compartido; si no cambio no se recorre el catalogo.
+        """
+        version = self.productos.version
+        if version == self._version_vista:
+            return set()
+        self._version_vista = version
+        cambiados = set()
+        for producto in self.productos:
+            if self._stock_visto.get(producto["id"], producto["stock"]) != producto["stock"]:
+                cambiados.add(producto["id"])
+            self._stock_visto[producto["id"]] = producto["stock"]
+        return cambiados
+
+    def _publicar_stocks(self, producto_ids):
+        for pid in producto_ids:
+            self._publicar_stock(pid)
+
+    def _publicar_stock(self, pid):
+        producto = self.productos.get(pid)
+        with self._lock:
+            suscriptores = list(self._todo_el_stock | self._por_producto.get(pid, set()))
+        if producto is None or not suscriptores:
+            return
+        datos = json.dumps({"tipo": "stock", "producto_id": pid, "stock": self.reservas.disponible(producto)}).encode()
+        self._entregar(suscriptores, ("stock", pid), ("stock", datos))
+
+
+eventos = BusEventos(productos_db, reservas)
+# El barredor elimina los carritos inactivos fuera de los endpoints
+barredor.al_expirar(eventos.carritos_expirados)
+
+Medidor("eventos_suscriptores", "Conexiones suscritas a eventos (SSE y WebSocket).", funcion=lambda: [((), len(eventos))])
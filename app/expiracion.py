@@ -0,0 +1,70 @@
+# app/expiracion.py
+# Barredor en segundo plano que elimina los carritos inactivos.
+# Sin el, un carrito abandonado solo se borraba si alguien volvia a consultarlo,
+# ocupando memoria y bloqueando a su usuario para crear uno nuevo.
+import asyncio
+import time
+from datetime import timedelta
+
+from app.config import TTL_CARRITO_MINUTOS, INTERVALO_BARRIDO_SEGUNDOS
+from app.db.database import carritos_db
+from app.utils import timestamp_utc
+
+
+class CartSweeper:
+    """
+    Expira periodicamente los carritos cuyo actualizado_en supera el TTL.
+    La tabla de carritos entrega los vencidos en orden temporal (O(log n) por carrito),
+    asi que cada barrido solo toca los carritos que realmente expiran.
+    """
+
+    def __init__(self, carritos, ttl_minutos=TTL_CARRITO_MINUTOS, intervalo_segundos=INTERVALO_BARRIDO_SEGUNDOS):
+        self.carritos = carritos
+        self.ttl_minutos = ttl_minutos
+        self.intervalo_segundos = intervalo_segundos
+        # Metricas del barredor
+        self.barridos = 0
+        self.carritos_expirados = 0
+        self.duracion_ultimo_barrido = 0.0
+        self._oyentes = []
+
+    def barrer(self):
+        """
+        Ejecuta un barrido y devuelve la lista de carritos expirados.
+        """
+        inicio = time.perf_counter()
+        limite = timestamp_utc() - timedelta(minutes=self.ttl_minutos)
+        expirados = self.carritos.expirar(limite)
+        self.duracion_ultimo_barrido = time.perf_counter() - inicio
+        self.barridos += 1
+        self.carritos_expirados += len(expirados)
+        if expirados:
+            for funcion in self._oyentes:
+                funcion(expirados)
+        return expirados
+
+    def al_expirar(self, funcion):
+        """
+        Registra funcion(carritos), que se llama con los carritos de cada barrido
+        que expiro alguno (la usan los eventos en vivo).
+        """
+        self._oyentes.append(funcion)
+
+    async def ejecutar(self):
+        """
+        Bucle del barredor. Se lanza como tarea en el lifespan de la aplicacion.
+        """
+        while True:
+            await asyncio.sleep(self.intervalo_segundos)
+            # Fuera del event loop: con SQLite el barrido hace I/O bloqueante
+            await asyncio.to_thread(self.barrer)
+
+    def metricas(self):
+        return {
+            "barridos": self.barridos,
+            "carritos_expirados": self.carritos_expirados,
+            "duracion_ultimo_barrido_segundos": self.duracion_ultimo_barrido,
+        }
+
+
+barredor = CartSweeper(carritos_db)
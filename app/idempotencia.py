@@ -0,0 +1,112 @@
+# app/idempotencia.py
+# Resultados de operaciones idempotentes, indexados por la cabecera Idempotency-Key.
+# Un cliente que reintenta un pago (por ejemplo tras un timeout) recibe el mismo
+# resultado que la primera vez, sin volver a tocar el stock. La cache es local al
+# proceso: con varios workers, los reintentos deben llegar al mismo worker.
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app.config import IDEMPOTENCIA_CAPACIDAD, IDEMPOTENCIA_TTL_SEGUNDOS
+
+
+class ClaveReutilizada(Exception):
+    """
+    La clave ya se uso para una operacion distinta (otra huella).
+    """
+
+
+class ResultadosIdempotentes:
+    """
+    Cache LRU acotada, con vencimiento, de resultados ya completados.
+    Tambien registra las operaciones en curso: una peticion duplicada que llega
+    mientras la original se ejecuta espera su resultado en lugar de repetirla.
+    Es segura entre hilos y entre event loops (el futuro es de concurrent.futures).
+    """
+
+    def __init__(self, capacidad=IDEMPOTENCIA_CAPACIDAD, ttl_segundos=IDEMPOTENCIA_TTL_SEGUNDOS):
+        self.capacidad = capacidad
+        self.ttl_segundos = ttl_segundos
+        # clave -> (vence_ts, huella, resultado), en orden de uso
+        self._resultados = OrderedDict()
+        # clave -> (huella, futuro)
+        self._en_curso = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        """
+        Devuelve (huella, resultado) si la clave tiene un resultado vigente, o None. O(1).
+        """
+        with self._lock:
+            return self._obtener(clave)
+
+    def _obtener(self, clave):
+        entrada = self._resultados.get(clave)
+        if entrada is None:
+            return None
+        vence_ts, huella, resultado = entrada
+        if vence_ts <= time.time():
+            del self._resultados[clave]
+            return None
+        self._resultados.move_to_end(clave)
+        return huella, resultado
+
+    def guardar(self, clave, huella, resultado):
+        with self._lock:
+            self._guardar(clave, huella, resultado)
+
+    def _guardar(self, clave, huella, resultado):
+        self._resultados[clave] = (time.time() + self.ttl_segundos, huella, resultado)
+        self._resultados.move_to_end(clave)
+        while len(self._resultados) > self.capacidad:
+            self._resultados.popitem(last=False)
+
+    async def ejecutar(self, clave, huella, funcion):
+        """
+        Ejecuta `funcion` (una corrutina sin argumentos) una sola vez por clave.
+        Devuelve (resultado, repetido): repetido es True si el resultado ya existia
+        o lo produjo otra peticion con la misma clave. Solo se guardan los
+        resultados exitosos: si `funcion` lanza una excepcion, la reciben las
+        peticiones que esperaban y la clave puede volver a usarse.
+        La huella identifica la operacion (por ejemplo, el carrito): reutilizar la
+        clave con otra huella lanza ClaveReutilizada.
+        """
+        with self._lock:
+            existente = self._obtener(clave)
+            if existente is None:
+                existente = self._en_curso.get(clave)
+                if existente is None:
+                    futuro = Future()
+                    self._en_curso[clave] = (huella, futuro)
+        if existente is not None:
+            huella_existente, resultado = existente
+            if huella_existente != huella:
+                raise ClaveReutilizada(clave)
+            if isinstance(resultado, Future):
+                resultado = await asyncio.wrap_future(resultado)
+            return resultado, True
+
+        try:
+            resultado = await funcion()
+        except BaseException as error:
+            with self._lock:
+                del self._en_curso[clave]
+            futuro.set_exception(error)
+            raise
+        with self._lock:
+            del self._en_curso[clave]
+            self._guardar(clave, huella, resultado)
+        futuro.set_result(resultado)
+        return resultado, False
+
+    def clear(self):
+        with self._lock:
+            self._resultados.clear()
+
+    def __len__(self):
+        return len(self._resultados)
+
+
+resultados_pago = ResultadosIdempotentes()
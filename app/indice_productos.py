@@ -0,0 +1,152 @@
+# app/indice_productos.py
+# Indices del catalogo para busquedas y filtros sin recorrer todos los productos.
+# - Por ID: los almacenes ya buscan en O(1) (diccionario o clave primaria).
+# - Por precio: lista ordenada de (precio, id); un rango se resuelve con bisect.
+# - Por nombre: indice de trigramas (subcadenas de 3 caracteres) para buscar
+#   subcadenas, y lista ordenada de palabras para prefijos de 1 o 2 caracteres.
+# Los indices dependen solo de nombres y precios: se reconstruyen cuando cambia
+# el catalogo (version_catalogo), no con cada descuento de stock. El stock se lee
+# del almacen al armar la respuesta, asi que siempre es el vigente (el disponible,
+# descontadas las reservas de los carritos, si se indica un libro de reservas).
+import bisect
+import threading
+import unicodedata
+
+from app.db.database import productos_db
+from app.reservas import reservas
+
+
+def normalizar(texto):
+    """
+    Minusculas y sin acentos: "Teclado Mecánico" -> "teclado mecanico".
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceProductos:
+    """
+    Indices por precio y por nombre sobre un ProductRepository. Se construyen
+    al primer uso y se regeneran cuando cambia su version_catalogo.
+    """
+
+    def __init__(self, productos, reservas=None):
+        self.productos = productos
+        self.reservas = reservas
+        self._version = None
+        self._lock = threading.Lock()
+        self._ids = []
+        self._precios = {}
+        self._nombres = {}
+        self._por_precio = []
+        self._claves_precio = []
+        self._por_trigrama = {}
+        self._palabras = []
+
+    def _vigente(self):
+        if self._version == self.productos.version_catalogo:
+            return
+        with self._lock:
+            version = self.productos.version_catalogo
+            if self._version != version:
+                self._construir()
+                self._version = version
+
+    def _construir(self):
+        precios, nombres, por_trigrama, palabras = {}, {}, {}, []
+        for producto in self.productos:
+            pid = producto["id"]
+            nombre = normalizar(producto["nombre"])
+            precios[pid] = producto["precio"]
+            nombres[pid] = nombre
+            for trigrama in _trigramas(nombre):
+                por_trigrama.setdefault(trigrama, set()).add(pid)
+            palabras.extend((palabra, pid) for palabra in set(nombre.split()))
+        por_precio = sorted((precio, pid) for pid, precio in precios.items())
+        palabras.sort()
+        # Se publican juntos al final: una busqueda concurrente ve el indice anterior completo
+        self._ids, self._precios, self._nombres = sorted(precios), precios, nombres
+        self._por_precio, self._claves_precio = por_precio, [precio for precio, _ in por_precio]
+        self._por_trigrama, self._palabras = por_trigrama, palabras
+
+    def _buscar_nombre(self, q):
+        """
+        IDs cuyo nombre contiene `q`. Con menos de 3 caracteres se buscan
+        palabras que empiecen con `q`.
+        """
+        q = normalizar(q.strip())
+        if len(q) < 3:
+            inicio = bisect.bisect_left(self._palabras, (q,))
+            fin = bisect.bisect_left(self._palabras, (q + "\uffff",))
+            return {pid for _, pid in self._palabras[inicio:fin]}
+        listas = []
+        for trigrama in _trigramas(q):
+            lista = self._por_trigrama.get(trigrama)
+            if not lista:
+                return set()
+            listas.append(lista)
+        listas.sort(key=len)
+        # Los trigramas no garantizan el orden: se confirma la subcadena en los candidatos
+        return {pid for pid in listas[0].intersection(*listas[1:]) if q in self._nombres[pid]}
+
+    def _rango_precio(self, min_precio, max_precio):
+        # Posiciones [inicio, fin) del indice de precios dentro del rango
+        inicio = 0 if min_precio is None else bisect.bisect_left(self._claves_precio, min_precio)
+        fin = len(self._claves_precio) if max_precio is None else bisect.bisect_right(self._claves_precio, max_precio)
+        return inicio, fin
+
+    def buscar(self, ids=None, q=None, min_precio=None, max_precio=None, en_stock=False, orden=None, limite=100):
+        """
+        Productos que cumplen todos los filtros indicados, ordenados por ID o por
+        precio (orden="precio" o "-precio"), hasta `limite` resultados.
+        Empieza por el filtro mas selectivo disponible y aplica los demas a sus candidatos.
+        """
+        self._vigente()
+        precios = self._precios
+        candidatos = None
+        if ids is not None:
+            candidatos = {pid for pid in ids if pid in precios}
+        if q:
+            por_nombre = self._buscar_nombre(q)
+            candidatos = por_nombre if candidatos is None else candidatos & por_nombre
+
+        con_precio = min_precio is not None or max_precio is not None
+        if candidatos is None and (con_precio or orden):
+            # Recorrido del indice de precios (o de un rango), que ya esta ordenado por precio
+            inicio, fin = self._rango_precio(min_precio, max_precio)
+            posiciones = range(fin - 1, inicio - 1, -1) if orden == "-precio" else range(inicio, fin)
+            ordenados = (self._por_precio[i][1] for i in posiciones)
+            if orden is None:
+                ordenados = sorted(ordenados)
+        elif candidatos is None:
+            ordenados = self._ids
+        else:
+            if con_precio:
+                minimo = float("-inf") if min_precio is None else min_precio
+                maximo = float("inf") if max_precio is None else max_precio
+                candidatos = {pid for pid in candidatos if minimo <= precios[pid] <= maximo}
+            if orden:
+                ordenados = sorted(candidatos, key=lambda pid: (precios[pid], pid), reverse=orden == "-precio")
+            else:
+                ordenados = sorted(candidatos)
+
+        resultados = []
+        for pid in ordenados:
+            producto = self.productos.get(pid)
+            if producto is None:
+                continue
+            if self.reservas is not None:
+                producto = self.reservas.con_disponible(producto)
+            if en_stock and producto["stock"] <= 0:
+                continue
+            resultados.append(producto)
+            if len(resultados) == limite:
+                break
+        return resultados
+
+
+indice_productos = IndiceProductos(productos_db, reservas)
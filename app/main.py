@@ -1,17 +1,74 @@
 # app/main.py
+import gc
+from .config import ARRANQUE_RAPIDO, SHARDS
+
+# Arranque rapido: la importacion de FastAPI, Pydantic y los routers crea muchos
+# objetos que viven todo el proceso; recorrerlos con el recolector solo demora el arranque
+if ARRANQUE_RAPIDO:
+    gc.disable()
+
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routers import productos, carritos
+from .routers import productos, carritos, debug, eventos, monitoreo, pedidos
+from .db.database import persistencia
+from .expiracion import barredor
+from .admision import AdmisionMiddleware
+from .metricas import MetricasMiddleware
+from .perfilado import TrazasMiddleware
+from .shards import RuteoShardsMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El barredor de carritos inactivos corre mientras viva la aplicacion
+    tarea_barredor = asyncio.create_task(barredor.ejecutar())
+    # Snapshots periodicos del estado en memoria, si el diario esta activado
+    tarea_snapshots = asyncio.create_task(persistencia.ejecutar()) if persistencia else None
+    yield
+    tarea_barredor.cancel()
+    if tarea_snapshots:
+        tarea_snapshots.cancel()
+        persistencia.cerrar()
 
 app = FastAPI(
     title="API de Carrito de Compras",
     description="Una API para gestionar productos y carritos de compra.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Trazas por fase de las peticiones lentas (el más interno: mide el trabajo de la app)
+app.add_middleware(TrazasMiddleware)
+
+# Middleware de métricas por ruta
+app.add_middleware(MetricasMiddleware)
+
+# En modo shards, cada petición se atiende en el proceso dueño del carrito
+if SHARDS > 1:
+    app.add_middleware(RuteoShardsMiddleware)
+
+# Limite de tasa por usuario e IP y control de admision global (el más externo:
+# rechaza antes de reenviar o procesar la petición)
+app.add_middleware(AdmisionMiddleware)
+
 # Incluir los routers
 app.include_router(productos.router)
 app.include_router(carritos.router)
+app.include_router(pedidos.router)
+app.include_router(eventos.router)
+app.include_router(monitoreo.router)
+app.include_router(debug.router)
 
 @app.get("/", tags=["Home"])
-def read_root():
-    return {"mensaje": "Bienvenido a la API del Carrito de Compras. Visita 127.0.0.1/docs para ver el listado de endpoints disponible."}
\ No newline at end of file
+async def read_root():
+    return {"mensaje": "Bienvenido a la API del Carrito de Compras. Visita 127.0.0.1/docs para ver el listado de endpoints disponible."}
+
+if ARRANQUE_RAPIDO:
+    from .openapi_estatico import usar_openapi_precalculado
+
+    # Esquema generado al empaquetar, en lugar de generarlo en cada worker
+    usar_openapi_precalculado(app)
+    # Los objetos del arranque pasan a la generacion permanente: los barridos
+    # posteriores del recolector ya no los recorren
+    gc.freeze()
+    gc.enable()
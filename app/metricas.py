@@ -0,0 +1,205 @@
+# app/metricas.py
+# Metricas en formato de texto de Prometheus.
+# Los contadores son enteros simples y cada actualizacion cuesta unas pocas
+# operaciones de diccionario. Cada metrica lleva un lock: con SQLite parte del
+# trabajo (pagos, lotes, eventos de stock) corre en hilos (app.utils.en_almacen)
+# y un `+=` sin lock podria perder actualizaciones. Sin competencia el lock
+# cuesta poco frente al resto de la peticion.
+import bisect
+import threading
+import time
+from collections import defaultdict
+
+from app.db.database import carritos_db, productos_db
+from app.expiracion import barredor
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites de los buckets de latencia, en segundos
+BUCKETS_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_registro = []
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatear_etiquetas(nombres, valores, extra=""):
+    pares = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def exponer(self):
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        yield from self._muestras()
+
+
+class Contador(_Metrica):
+    """
+    Contador monotono, con un valor por combinacion de etiquetas.
+    """
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.valores = defaultdict(int)
+
+    def inc(self, *valores_etiquetas, cantidad=1):
+        with self._lock:
+            self.valores[valores_etiquetas] += cantidad
+
+    def _muestras(self):
+        with self._lock:
+            pares = list(self.valores.items())
+        for valores, valor in pares:
+            yield f"{self.nombre}{_formatear_etiquetas(self.etiquetas, valores)} {valor}"
+
+
+class Medidor(_Metrica):
+    """
+    Valor que sube y baja. Si se indica una funcion, el valor se calcula al
+    exponer las metricas: la funcion devuelve pares (valores_etiquetas, valor).
+    """
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), funcion=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.funcion = funcion
+        self.valores = defaultdict(float)
+
+    def inc(self, *valores_etiquetas, cantidad=1):
+        with self._lock:
+            self.valores[valores_etiquetas] += cantidad
+
+    def dec(self, *valores_etiquetas, cantidad=1):
+        with self._lock:
+            self.valores[valores_etiquetas] -= cantidad
+
+    def _muestras(self):
+        if self.funcion:
+            pares = self.funcion()
+        else:
+            with self._lock:
+                pares = list(self.valores.items())
+        for valores, valor in pares:
+            yield f"{self.nombre}{_formatear_etiquetas(self.etiquetas, valores)} {valor}"
+
+
+class ContadorExterno(Medidor):
+    """
+    Contador cuyo valor lleva otro componente y se lee al exponer las metricas.
+    """
+    tipo = "counter"
+
+
+class Histograma(_Metrica):
+    """
+    Histograma con buckets fijos. Cada observacion incrementa un solo bucket
+    (busqueda binaria); los acumulados se calculan al exponer.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observar(self, valor, *valores_etiquetas):
+        bucket = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self.series.get(valores_etiquetas)
+            if serie is None:
+                # [conteos por bucket (+Inf al final), suma]
+                serie = self.series[valores_etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][bucket] += 1
+            serie[1] += valor
+
+    def _muestras(self):
+        with self._lock:
+            series = [(valores, list(conteos), suma) for valores, (conteos, suma) in self.series.items()]
+        for valores, conteos, suma in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ("+Inf",), conteos):
+                acumulado += conteo
+                etiquetas = _formatear_etiquetas(self.etiquetas, valores, f'le="{limite}"')
+                yield f"{self.nombre}_bucket{etiquetas} {acumulado}"
+            etiquetas = _formatear_etiquetas(self.etiquetas, valores)
+            yield f"{self.nombre}_sum{etiquetas} {suma}"
+            yield f"{self.nombre}_count{etiquetas} {acumulado}"
+
+
+def exponer_metricas():
+    """
+    Texto de todas las metricas registradas, en formato de exposicion de Prometheus.
+    """
+    lineas = []
+    for metrica in _registro:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+
+# --- Metricas HTTP ---
+peticiones_total = Contador("http_peticiones_total", "Peticiones atendidas por ruta, metodo y codigo de estado.", ("ruta", "metodo", "status"))
+latencia_peticiones = Histograma("http_latencia_segundos", "Latencia de las peticiones por ruta y metodo.", ("ruta", "metodo"))
+peticiones_en_curso = Medidor("http_peticiones_en_curso", "Peticiones que se estan procesando.")
+
+# --- Metricas de negocio ---
+pagos_total = Contador("pagos_total", "Pagos procesados por resultado (exitoso, sin_stock, repetido).", ("resultado",))
+tamano_lotes_pago = Histograma("pagos_lote_tamano", "Pagos por micro-lote de descuento de stock.", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+Medidor("carritos_activos", "Carritos activos.", funcion=lambda: [((), len(carritos_db))])
+ContadorExterno("carritos_expirados_total", "Carritos eliminados por inactividad por el barredor.", funcion=lambda: [((), barredor.carritos_expirados)])
+Medidor("barrido_duracion_segundos", "Duracion del ultimo barrido de carritos inactivos.", funcion=lambda: [((), barredor.duracion_ultimo_barrido)])
+Medidor(
+    "producto_stock",
+    "Stock disponible por producto.",
+    ("producto_id",),
+    funcion=lambda: [((producto["id"],), producto["stock"]) for producto in productos_db],
+)
+
+
+class MetricasMiddleware:
+    """
+    Middleware ASGI que mide la latencia y cuenta las peticiones HTTP.
+    La ruta se etiqueta con su plantilla (/carritos/{carrito_id}) para no
+    crear una serie por cada ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        estado = [500]
+
+        async def send_con_estado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        peticiones_en_curso.inc()
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_con_estado)
+        finally:
+            duracion = time.perf_counter() - inicio
+            peticiones_en_curso.dec()
+            ruta = getattr(scope.get("route"), "path_format", "sin_ruta")
+            peticiones_total.inc(ruta, scope["method"], estado[0])
+            latencia_peticiones.observar(duracion, ruta, scope["method"])
@@ -0,0 +1,68 @@
+# app/openapi_estatico.py
+# Esquema OpenAPI precalculado para el modo de arranque rapido.
+# FastAPI genera el esquema recorriendo todas las rutas y modelos la primera vez
+# que se pide /openapi.json (o /docs). Con workers de vida corta ese costo se paga
+# en cada proceso; aqui se genera una sola vez al empaquetar y los workers solo
+# leen el archivo, y recien cuando alguien lo pide.
+#
+# Uso (al construir la imagen o el paquete):
+#     python -m app.openapi_estatico [--salida app/openapi.json]
+import argparse
+import json
+import logging
+import os
+
+from fastapi import FastAPI
+
+from app.config import OPENAPI_PRECALCULADO
+
+logger = logging.getLogger(__name__)
+
+
+def escribir_openapi(app, ruta=OPENAPI_PRECALCULADO):
+    """
+    Genera el esquema OpenAPI de `app` y lo guarda en `ruta`.
+    """
+    # Siempre con el generador de FastAPI, aunque la app ya use un esquema precalculado
+    app.openapi_schema = None
+    esquema = FastAPI.openapi(app)
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(esquema, archivo, ensure_ascii=False, separators=(",", ":"))
+
+
+def usar_openapi_precalculado(app, ruta=OPENAPI_PRECALCULADO):
+    """
+    Hace que `app` sirva el esquema guardado en `ruta`, leido en el primer pedido.
+    Si el archivo no existe, FastAPI lo genera como siempre.
+    """
+    if not os.path.exists(ruta):
+        logger.warning("No existe el esquema OpenAPI precalculado %s: se generara al pedirlo", ruta)
+        return
+    generar = app.openapi
+
+    def openapi():
+        if app.openapi_schema is None:
+            try:
+                with open(ruta, encoding="utf-8") as archivo:
+                    app.openapi_schema = json.load(archivo)
+            except (OSError, ValueError):
+                logger.warning("No se pudo leer el esquema OpenAPI precalculado %s: se genera", ruta)
+                return generar()
+        return app.openapi_schema
+
+    app.openapi = openapi
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el esquema OpenAPI para el modo de arranque rapido")
+    parser.add_argument("--salida", default=OPENAPI_PRECALCULADO)
+    args = parser.parse_args()
+
+    from app.main import app
+
+    escribir_openapi(app, args.salida)
+    print(f"Esquema OpenAPI guardado en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+# app/perfilado.py
+# Instrumentacion opcional para investigar picos de latencia.
+# - Trazas por fase: los handlers marcan el fin de cada fase (busqueda,
+#   validacion, mutacion) y el middleware agrega la serializacion y el envio.
+#   Las peticiones que superan un umbral quedan, con su desglose, en un buffer
+#   circular (GET /debug/slow). Desactivadas, marcar una fase es leer una
+#   ContextVar vacia, y el middleware solo consulta un atributo.
+# - Perfilador por muestreo: un hilo que cada pocos milisegundos toma las pilas
+#   de los demas hilos y cuenta cuantas veces aparece cada una. Se enciende y
+#   apaga en tiempo de ejecucion (PUT /debug/perfilador); apagado no existe.
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+
+from app.admision import RUTAS_STREAM
+from app.config import TRAZAS, TRAZAS_MAXIMO, TRAZAS_UMBRAL_MS
+from app.metricas import Histograma
+
+duracion_fases = Histograma("http_fase_duracion_segundos", "Duracion de cada fase de las peticiones trazadas, por ruta y fase.", ("ruta", "fase"))
+
+_traza_actual = contextvars.ContextVar("traza_actual", default=None)
+
+# Rutas que no se trazan: las consultas de diagnostico no ensucian el registro que
+# consultan, y un stream de eventos dura lo que la conexion y siempre pareceria lento
+RUTAS_SIN_TRAZAS = ("/debug",) + RUTAS_STREAM
+
+
+class Traza:
+    """
+    Fases de una peticion en curso: cada marca cierra la fase que empezo en la marca anterior.
+    """
+    __slots__ = ("inicio_ts", "inicio", "ultimo", "fases")
+
+    def __init__(self):
+        self.inicio_ts = time.time()
+        self.inicio = self.ultimo = time.perf_counter()
+        self.fases = []
+
+    def marcar(self, fase):
+        ahora = time.perf_counter()
+        self.fases.append((fase, ahora - self.ultimo))
+        self.ultimo = ahora
+
+    @property
+    def duracion(self):
+        return self.ultimo - self.inicio
+
+    def desglose(self):
+        """{fase: segundos}, sumando las fases que se marcaron mas de una vez."""
+        desglose = {}
+        for fase, segundos in self.fases:
+            desglose[fase] = desglose.get(fase, 0.0) + segundos
+        return desglose
+
+
+def marcar(fase):
+    """
+    Cierra la fase en curso de la peticion actual. Sin trazas activas no hace nada.
+    """
+    traza = _traza_actual.get()
+    if traza is not None:
+        traza.marcar(fase)
+
+
+class RegistroLentas:
+    """
+    Configuracion de las trazas y buffer circular con las peticiones que
+    superaron el umbral, de la mas vieja a la mas nueva.
+    """
+
+    def __init__(self, activo=TRAZAS, umbral_ms=TRAZAS_UMBRAL_MS, maximo=TRAZAS_MAXIMO):
+        self.activo = activo
+        self.umbral_ms = umbral_ms
+        self._entradas = deque(maxlen=maximo)
+        self.lentas_total = 0
+
+    def configurar(self, activo, umbral_ms=None):
+        self.activo = activo
+        if umbral_ms is not None:
+            self.umbral_ms = umbral_ms
+
+    def terminar(self, scope, status_code, traza):
+        """
+        Registra una peticion trazada: metricas por fase y, si fue lenta, su desglose.
+        """
+        ruta = getattr(scope.get("route"), "path_format", "sin_ruta")
+        desglose = traza.desglose()
+        for fase, segundos in desglose.items():
+            duracion_fases.observar(segundos, ruta, fase)
+        duracion_ms = traza.duracion * 1000
+        if duracion_ms < self.umbral_ms:
+            return
+        self.lentas_total += 1
+        # deque con maxlen: agregar es atomico y descarta la entrada mas vieja
+        self._entradas.append({
+            "ruta": ruta,
+            "path": scope["path"],
+            "metodo": scope["method"],
+            "status": status_code,
+            "inicio": datetime.fromtimestamp(traza.inicio_ts, timezone.utc),
+            "duracion_ms": round(duracion_ms, 3),
+            "fases_ms": {fase: round(segundos * 1000, 3) for fase, segundos in desglose.items()},
+        })
+
+    def ultimas(self, limite=50):
+        """Las ultimas `limite` peticiones lentas, de la mas nueva a la mas vieja."""
+        entradas = list(self._entradas)
+        return entradas[::-1][:limite]
+
+    def clear(self):
+        self._entradas.clear()
+        self.lentas_total = 0
+
+
+class TrazasMiddleware:
+    """
+    Middleware ASGI que traza las fases de cada peticion mientras las trazas estan activas.
+    """
+
+    def __init__(self, app, registro=None):
+        self.app = app
+        self.registro = registro_lentas if registro is None else registro
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registro.activo or scope["path"].startswith(RUTAS_SIN_TRAZAS):
+            await self.app(scope, receive, send)
+            return
+
+        traza = Traza()
+        token = _traza_actual.set(traza)
+        estado = [500]
+
+        async def send_trazado(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+                # Lo que va de la ultima marca hasta la respuesta: la serializacion, o
+                # todo el handler si la ruta no marca fases
+                traza.marcar("serializacion" if traza.fases else "manejador")
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_trazado)
+        finally:
+            _traza_actual.reset(token)
+            traza.marcar("envio")
+            self.registro.terminar(scope, estado[0], traza)
+
+
+# Pilas de hilos que estan esperando trabajo, no ejecutando: no se cuentan
+_ESPERAS = {("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker")}
+
+
+def _pila(frame, profundidad_maxima=64):
+    """Pila del frame como ("archivo:funcion", ...), de la raiz al frame."""
+    pila = []
+    while frame is not None and len(pila) < profundidad_maxima:
+        codigo = frame.f_code
+        pila.append(f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}")
+        frame = frame.f_back
+    pila.reverse()
+    return tuple(pila)
+
+
+class PerfiladorMuestreo:
+    """
+    Perfilador estadistico: un hilo toma las pilas de los demas hilos cada
+    `intervalo` segundos. Las pilas se agrupan, asi que la memoria depende de
+    la cantidad de pilas distintas y no de la duracion.
+    """
+
+    def __init__(self):
+        self.intervalo = 0.005
+        self.muestras = 0
+        self._pilas = Counter()
+        self._hilo = None
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self._hilo is not None
+
+    def iniciar(self, intervalo_ms=5):
+        """Empieza a muestrear desde cero. Si ya estaba activo, solo cambia el intervalo."""
+        with self._lock:
+            self.intervalo = intervalo_ms / 1000
+            if self._hilo is not None:
+                return
+            self._pilas.clear()
+            self.muestras = 0
+            self._detener = threading.Event()
+            self._hilo = threading.Thread(target=self._muestrear, args=(self._detener,), name="perfilador", daemon=True)
+            self._hilo.start()
+
+    def detener(self):
+        """Deja de muestrear; las muestras tomadas se conservan para el informe."""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+            self._detener.set()
+        if hilo is not None:
+            hilo.join()
+
+    def _muestrear(self, detener):
+        propio = threading.get_ident()
+        while not detener.wait(self.intervalo):
+            pilas = [_pila(frame) for ident, frame in sys._current_frames().items() if ident != propio]
+            with self._lock:
+                for pila in pilas:
+                    if pila and tuple(pila[-1].split(":", 1)) not in _ESPERAS:
+                        self._pilas[pila] += 1
+                        self.muestras += 1
+
+    def informe(self, limite=20):
+        """
+        Las pilas mas frecuentes (formato "colapsado" de los flame graphs:
+        funciones separadas por ";") y las funciones con mas muestras propias
+        (en la cima de la pila) y acumuladas (en cualquier parte de la pila).
+        """
+        with self._lock:
+            pilas = self._pilas.most_common()
+            muestras = self.muestras
+        propias, acumuladas = Counter(), Counter()
+        for pila, cantidad in pilas:
+            propias[pila[-1]] += cantidad
+            for funcion in set(pila):
+                acumuladas[funcion] += cantidad
+        return {
+            "activo": self.activo,
+            "intervalo_ms": self.intervalo * 1000,
+            "muestras": muestras,
+            "pilas": [{"pila": ";".join(pila), "muestras": cantidad} for pila, cantidad in pilas[:limite]],
+            "funciones": [
+                {"funcion": funcion, "propias": cantidad, "acumuladas": acumuladas[funcion]}
+                for funcion, cantidad in propias.most_common(limite)
+            ],
+        }
+
+
+registro_lentas = RegistroLentas()
+perfilador = PerfiladorMuestreo()
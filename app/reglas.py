@@ -0,0 +1,53 @@
+# app/reglas.py
+# Reglas de fraude sobre el contenido de un carrito.
+# Se evaluan contra los contadores que el carrito mantiene (unidades totales y
+# cantidad por producto), asi que validar un cambio cuesta O(items del pedido).
+from app.config import MAX_UNIDADES_CARRITO, MAX_UNIDADES_POR_PRODUCTO
+
+
+class LimiteUnidadesCarrito:
+    """
+    No puede haber más de `maximo` ítems en el carrito (sumando cantidades).
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+
+    def evaluar(self, unidades, cantidades):
+        if unidades > self.maximo:
+            return f"No puede haber más de {self.maximo} ítems en el carrito"
+        return None
+
+
+class LimiteUnidadesPorProducto:
+    """
+    No puede haber más de `maximo` unidades de un mismo producto.
+    """
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+
+    def evaluar(self, unidades, cantidades):
+        for producto_id, cantidad in cantidades.items():
+            if cantidad > self.maximo:
+                return f"No puede haber más de {self.maximo} unidades del producto {producto_id} en el carrito"
+        return None
+
+
+reglas_fraude = [
+    LimiteUnidadesCarrito(MAX_UNIDADES_CARRITO),
+    LimiteUnidadesPorProducto(MAX_UNIDADES_POR_PRODUCTO),
+]
+
+
+def validar_reglas_fraude(unidades, cantidades):
+    """
+    Evalua las reglas con las unidades totales resultantes del carrito y las
+    cantidades resultantes de los productos modificados ({producto_id: cantidad}).
+    Devuelve el mensaje de la primera regla que no se cumple, o None.
+    """
+    for regla in reglas_fraude:
+        error = regla.evaluar(unidades, cantidades)
+        if error:
+            return error
+    return None
@@ -0,0 +1,175 @@
+# app/reservas.py
+# Reservas de stock de los carritos.
+# Las unidades de un carrito quedan reservadas desde que se agregan (PATCH/PUT)
+# hasta que el carrito se paga, se elimina o expira: el stock disponible para
+# los demas es el stock menos lo reservado. Asi un carrito que se llena ya
+# tiene sus unidades, en lugar de descubrir al pagar que otro se las llevo.
+# - Los totales reservados por producto se mantienen al dia: consultar lo
+#   disponible es O(1) y no recorre los carritos.
+# - El libro es del proceso: con varios workers de SQLite o en modo shards un
+#   proceso no se entera de las bajas de los carritos de otro, asi que en esos
+#   backends se desactiva (CARRITO_RESERVAS). En todos los casos el pago sigue
+#   comprobando el stock, por lo que nunca se vende de mas.
+import itertools
+import threading
+
+from app.config import RESERVAS_STOCK
+from app.db.database import carritos_db, productos_db
+from app.metricas import Medidor
+
+
+class LibroReservas:
+    """
+    Unidades reservadas por carrito y por producto sobre un ProductRepository.
+    Es seguro entre hilos; las operaciones cuestan O(productos del carrito).
+    Desactivado (activo=False) no registra reservas: todo el stock esta disponible
+    y solo se controla que cada cantidad no supere el stock.
+    """
+
+    def __init__(self, productos, activo=True):
+        self.productos = productos
+        self.activo = activo
+        # carrito_id -> {producto_id: cantidad}
+        self._por_carrito = {}
+        # producto_id -> total reservado
+        self._reservado = {}
+        # Cambia con cada reserva o liberacion; sirve para invalidar caches
+        self._contador_version = itertools.count()
+        self.version = next(self._contador_version)
+        self._lock = threading.Lock()
+
+    def reservado(self, producto_id):
+        return self._reservado.get(producto_id, 0)
+
+    def disponible(self, producto):
+        """Stock del producto que no esta reservado por ningun carrito."""
+        return max(0, producto["stock"] - self._reservado.get(producto["id"], 0))
+
+    def con_disponible(self, producto):
+        """
+        El producto con `stock` igual a su stock disponible. Si no tiene
+        reservas se devuelve el mismo diccionario, sin copiarlo.
+        """
+        if not self._reservado.get(producto["id"]):
+            return producto
+        return dict(producto, stock=self.disponible(producto))
+
+    def reservar(self, carrito_id, cantidades, reemplazar=False):
+        """
+        Lleva la reserva del carrito a las cantidades indicadas ({producto_id: cantidad}).
+        Con reemplazar=True, los productos que no estan en `cantidades` se liberan.
+        Es todo o nada: si a algun producto no le alcanza el stock disponible no
+        se modifica ninguna reserva y se devuelve (producto, disponible_para_el_carrito).
+        Devuelve None si la reserva se aplico.
+        Desactivado no reserva nada, pero igual rechaza cantidades mayores al stock.
+        """
+        if not self.activo:
+            for pid, cantidad in cantidades.items():
+                producto = self.productos.get(pid)
+                stock = producto["stock"] if producto else 0
+                if cantidad > stock:
+                    return producto, max(0, stock)
+            return None
+        with self._lock:
+            actual = self._por_carrito.get(carrito_id, {})
+            nueva = dict(cantidades) if reemplazar else {**actual, **cantidades}
+            for pid, cantidad in nueva.items():
+                delta = cantidad - actual.get(pid, 0)
+                if delta <= 0:
+                    continue
+                producto = self.productos.get(pid)
+                stock = producto["stock"] if producto else 0
+                libre = stock - self._reservado.get(pid, 0)
+                if delta > libre:
+                    return producto, max(0, libre + actual.get(pid, 0))
+            self._sumar(actual, -1)
+            self._sumar(nueva, 1)
+            nueva = {pid: cantidad for pid, cantidad in nueva.items() if cantidad > 0}
+            if nueva:
+                self._por_carrito[carrito_id] = nueva
+            else:
+                self._por_carrito.pop(carrito_id, None)
+            self.version = next(self._contador_version)
+            return None
+
+    def tomar(self, carrito_id):
+        """
+        Separa la reserva del carrito para pagarlo y la devuelve. Las unidades
+        siguen reservadas, pero la baja del carrito ya no las libera: al terminar
+        el pago se llama a soltar() o, si fallo, a devolver().
+        """
+        with self._lock:
+            return self._por_carrito.pop(carrito_id, {})
+
+    def devolver(self, carrito_id, reserva):
+        """Vuelve a asignar al carrito una reserva separada con tomar()."""
+        if reserva:
+            with self._lock:
+                self._por_carrito[carrito_id] = reserva
+
+    def soltar(self, reserva):
+        """
+        Libera una reserva separada con tomar(): el pago ya desconto el stock
+        o el carrito dejo de existir.
+        """
+        if reserva:
+            with self._lock:
+                self._sumar(reserva, -1)
+                self.version = next(self._contador_version)
+
+    def liberar(self, carritos):
+        """Libera las reservas de los carritos que salieron de la tabla."""
+        with self._lock:
+            liberado = False
+            for carrito in carritos:
+                reserva = self._por_carrito.pop(carrito.id, None)
+                if reserva:
+                    self._sumar(reserva, -1)
+                    liberado = True
+            if liberado:
+                self.version = next(self._contador_version)
+
+    def reconstruir(self, carritos):
+        """
+        Reserva lo que ya tienen los carritos, por ejemplo los recuperados del
+        diario al arrancar. No comprueba el stock: son reservas hechas.
+        """
+        if not self.activo:
+            return
+        with self._lock:
+            for carrito in carritos:
+                reserva = dict(carrito.items())
+                if reserva and carrito.id not in self._por_carrito:
+                    self._por_carrito[carrito.id] = reserva
+                    self._sumar(reserva, 1)
+            self.version = next(self._contador_version)
+
+    def _sumar(self, reserva, signo):
+        for pid, cantidad in reserva.items():
+            total = self._reservado.get(pid, 0) + signo * cantidad
+            if total > 0:
+                self._reservado[pid] = total
+            else:
+                self._reservado.pop(pid, None)
+
+    def clear(self):
+        with self._lock:
+            self._por_carrito.clear()
+            self._reservado.clear()
+            self.version = next(self._contador_version)
+
+    def __len__(self):
+        return len(self._por_carrito)
+
+
+reservas = LibroReservas(productos_db, RESERVAS_STOCK)
+reservas.reconstruir(carritos_db)
+# Las bajas, expiraciones y vaciados de carritos liberan sus reservas
+carritos_db.al_quitar(reservas.liberar)
+
+Medidor(
+    "producto_stock_reservado",
+    "Unidades reservadas en carritos por producto.",
+    ("producto_id",),
+    funcion=lambda: [((pid,), cantidad) for pid, cantidad in list(reservas._reservado.items())],
+)
@@ -1,201 +1,417 @@
 # app/routers/carritos.py
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-import uuid
+from fastapi import APIRouter, Header, HTTPException, Query, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Literal, Optional
+from datetime import datetime, timezone
 
 # Traemos las funciones auxiliares
-from app.utils import timestamp_utc, carrito_inactivo, encontrar_carrito, encontrar_producto
+from app.utils import carrito_inactivo, en_almacen, encontrar_carrito, encontrar_producto
 
 # Importaciones locales
-from app.db.database import carritos_db
-from app.schemas.carrito import Carrito, CarritoCreate, ItemCarritoBase
+from app.db.database import carritos_db, pedidos_db
+from app.db.modelos import CarritoCompacto, Pedido, a_centavos
+from app.eventos import eventos
+from app.idempotencia import ClaveReutilizada, resultados_pago
+from app.lotes_pago import lotes_pago
+from app.metricas import pagos_total
+from app.perfilado import marcar
+from app.reglas import validar_reglas_fraude
+from app.reservas import reservas
+from app.serializacion import carrito_a_json, respuesta_carrito
+from app.shards import nuevo_id_carrito, nuevo_numero_pedido
+from app.schemas.carrito import Carrito, CarritoCreate, ItemCarritoBase, PaginaCarritos, OperacionCarrito, ResultadoOperacion
 from app.schemas.producto import ProductoEnCarrito
 
 router = APIRouter()
 
+# Cantidad máxima de operaciones aceptadas por POST /carritos/bulk
+MAX_OPERACIONES_LOTE = 1000
+
 # --- Endpoints ---
 
 @router.post("/carritos", response_model=Carrito, status_code=status.HTTP_201_CREATED, tags=["Carritos"])
-def crear_carrito(carrito_data: CarritoCreate):
+async def crear_carrito(carrito_data: CarritoCreate):
     """
     Crea un nuevo carrito de compra para un usuario.
     No permite crear más de un carrito simultáneo por usuario.
     """
-    for carrito in carritos_db:
-        if carrito["user_id"] == carrito_data.user_id:
+    marcar("validacion")
+    return respuesta_carrito(await en_almacen(_crear_carrito, carrito_data.user_id), status.HTTP_201_CREATED)
+
+def _crear_carrito(user_id: str):
+    nuevo_carrito = CarritoCompacto(nuevo_id_carrito(), user_id)
+    # El indice por usuario rechaza el alta si ya hay un carrito activo
+    if not carritos_db.add(nuevo_carrito):
+        # Un carrito inactivo que el barredor aun no elimino no bloquea al usuario
+        existente = carritos_db.get_por_usuario(user_id)
+        if not existente or not carrito_inactivo(existente):
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ya existe un carrito para este usuario")
-    nuevo_carrito = {
-        "id": str(uuid.uuid4()),
-        "user_id": carrito_data.user_id,
-        "items": [],
-        "creado_en": timestamp_utc(),
-        "actualizado_en": timestamp_utc()
-    }
-    carritos_db.append(nuevo_carrito)
+        if carritos_db.remove(existente):
+            eventos.carrito_quitado(existente, expirado=True)
+        if not carritos_db.add(nuevo_carrito):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Ya existe un carrito para este usuario")
+    marcar("mutacion")
     return nuevo_carrito
 
-@router.get("/carritos", response_model=List, tags=["Carritos"])
-def get_carritos():
+@router.get("/carritos", response_model=PaginaCarritos, tags=["Carritos"])
+async def get_carritos(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    user_id: Optional[str] = None,
+    actualizado_desde: Optional[datetime] = None,
+    formato: Literal["json", "ndjson"] = "json",
+):
     """
-    Devuelve los carritos de compra activos.
+    Devuelve los carritos de compra activos, paginados por cursor.
+    - Filtros opcionales por user_id y por fecha de última actualización.
+    - Con formato=ndjson devuelve todos los carritos (desde el cursor) como un
+      stream de líneas JSON, leyendo la tabla de a páginas de `limit` carritos.
     """
+    marcar("validacion")
+    if actualizado_desde is not None:
+        # Fechas sin zona horaria se interpretan en UTC, como los timestamps de los carritos
+        if actualizado_desde.tzinfo is None:
+            actualizado_desde = actualizado_desde.replace(tzinfo=timezone.utc)
+        actualizado_desde = actualizado_desde.astimezone(timezone.utc)
+    filtros = {"user_id": user_id, "actualizado_desde": actualizado_desde}
+
+    carritos, siguiente_cursor = await en_almacen(_paginar_carritos, cursor, limit, filtros)
+
+    if formato == "ndjson":
+        return StreamingResponse(_stream_carritos(carritos, siguiente_cursor, limit, filtros), media_type="application/x-ndjson")
+
+    return {"items": [carrito.a_dict() for carrito in carritos], "siguiente_cursor": siguiente_cursor}
+
+
+def _paginar_carritos(cursor, limit, filtros):
     if len(carritos_db) == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No hay carritos activos")
-    
-    return carritos_db
+    try:
+        pagina = carritos_db.paginar(cursor, limit, **filtros)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    marcar("busqueda")
+    return pagina
+
+
+def _stream_carritos(carritos, siguiente_cursor, limit, filtros):
+    # Generador de NDJSON: solo una página de carritos en memoria a la vez
+    while True:
+        for carrito in carritos:
+            yield carrito_a_json(carrito) + b"\n"
+        if siguiente_cursor is None:
+            return
+        carritos, siguiente_cursor = carritos_db.paginar(siguiente_cursor, limit, **filtros)
 
 
 @router.get("/carritos/{carrito_id}", response_model=Carrito, tags=["Carritos"])
-def get_carrito(carrito_id: str):
+async def get_carrito(carrito_id: str):
     """
     Devuelve un carrito de compra específico por su ID.
     Si el carrito tiene más de 1 minuto de inactividad, se elimina automáticamente.
     """
+    marcar("validacion")
+    return respuesta_carrito(await en_almacen(_obtener_carrito, carrito_id))
+
+def _obtener_carrito(carrito_id: str):
     carrito = encontrar_carrito(carrito_id)
     if not carrito:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
     
     if carrito_inactivo(carrito):
-        carritos_db.remove(carrito)
+        _expirar(carrito)
         raise HTTPException(status_code=status.HTTP_410_GONE, detail="El carrito fue eliminado por inactividad.")
-    
+    marcar("busqueda")
     return carrito
 
 @router.delete("/carritos/{carrito_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Carritos"])
-def eliminar_carrito(carrito_id: str):
+async def eliminar_carrito(carrito_id: str):
     """
     Elimina un carrito de compra por su ID.
     """
+    marcar("validacion")
+    await en_almacen(_eliminar_carrito, carrito_id)
+
+def _eliminar_carrito(carrito_id: str):
     carrito = encontrar_carrito(carrito_id)
     if not carrito:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
-    carritos_db.remove(carrito)
+    marcar("busqueda")
+    if carritos_db.remove(carrito):
+        eventos.carrito_quitado(carrito)
+    marcar("mutacion")
     return
 
+def _expirar(carrito):
+    # Carrito inactivo que el barredor aun no elimino
+    if carritos_db.remove(carrito):
+        eventos.carrito_quitado(carrito, expirado=True)
+
 @router.put("/carritos/{carrito_id}", response_model=Carrito, tags=["Carritos"])
-def sobreescribir_carrito(carrito_id: str, nuevos_items: List[ItemCarritoBase]):
+async def sobreescribir_carrito(carrito_id: str, nuevos_items: List[ItemCarritoBase]):
     """
     Sobreescribe completamente la lista de productos de un carrito.
-    Valida que no se exceda el stock disponible para ningún producto.
+    Valida que no se exceda el stock disponible para ningún producto
+    y que el nuevo contenido cumpla las reglas de fraude.
+    Las unidades del carrito quedan reservadas (las que ya no están, liberadas).
     """
-    carrito = encontrar_carrito(carrito_id)
-    if not carrito:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
+    marcar("validacion")
+    return respuesta_carrito(await en_almacen(_sobreescribir_items, carrito_id, nuevos_items))
 
-    # Validar que todos los productos existen y que no se excede el stock
-    for item in nuevos_items:
-        producto = encontrar_producto(item.producto_id)
-        if not producto:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto con ID {item.producto_id} no encontrado")
-        if item.cantidad > producto["stock"]:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Stock insuficiente para el producto: {producto['nombre']}. Stock disponible: {producto['stock']}")
+def _sobreescribir_items(carrito_id: str, nuevos_items: List[ItemCarritoBase], buscar_producto=encontrar_producto):
+    # Lectura, cambios y guardado sin que otro hilo o worker modifique el carrito en el medio
+    with carritos_db.edicion():
+        carrito = encontrar_carrito(carrito_id)
+        if not carrito:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
 
-    carrito["items"] = [item.model_dump() for item in nuevos_items]
-    return carrito
+        # Validar que todos los productos existen
+        precios = {}
+        for item in nuevos_items:
+            producto = buscar_producto(item.producto_id)
+            if not producto:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto con ID {item.producto_id} no encontrado")
+            precios[item.producto_id] = producto["precio"]
+        marcar("busqueda")
+
+        cantidades = _agrupar_cantidades(nuevos_items)
+        error = validar_reglas_fraude(sum(cantidades.values()), cantidades)
+        if error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+        marcar("validacion")
+
+        # Reservar el nuevo contenido: falla si no alcanza el stock no reservado por otros carritos
+        _reservar(carrito, cantidades, reemplazar=True)
+
+        # Productos que deja de tener, para avisar que su stock disponible cambio
+        anteriores = [pid for pid, _ in carrito.items()]
+        carrito.reemplazar_items((pid, cantidad, precios[pid]) for pid, cantidad in cantidades.items())
+        carritos_db.save(carrito)
+        eventos.carrito_actualizado(carrito)
+        eventos.stock_cambiado(set(anteriores) | set(cantidades))
+        marcar("mutacion")
+        return carrito
 
 
 @router.patch("/carritos/{carrito_id}", response_model=Carrito, tags=["Carritos"])
-def agregar_productos_al_carrito(carrito_id: str, items_a_agregar: List[ItemCarritoBase]):
+async def agregar_productos_al_carrito(carrito_id: str, items_a_agregar: List[ItemCarritoBase]):
     """
     Agrega una lista de productos a un carrito existente. Si un producto ya existe, actualiza la cantidad.
-    Fraudes:
+    Las unidades agregadas quedan reservadas; si no hay stock disponible se responde 409.
+    Fraudes (límites configurables, ver app/reglas.py):
         -No puede haber un carrito con una lista de más de 15 ítems (sumando cantidades).
         -No puede haber más de 10 unidades de un mismo producto (sumando todas las tuplas con ese producto_id).
     """
-    carrito = encontrar_carrito(carrito_id)
-    if not carrito:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
+    marcar("validacion")
+    return respuesta_carrito(await en_almacen(_agregar_items, carrito_id, items_a_agregar))
 
-    if carrito_inactivo(carrito):
-        carritos_db.remove(carrito)
-        raise HTTPException(status_code=status.HTTP_410_GONE, detail="El carrito fue eliminado por inactividad.")
+def _agregar_items(carrito_id: str, items_a_agregar: List[ItemCarritoBase], buscar_producto=encontrar_producto):
+    # Lectura, cambios y guardado sin que otro hilo o worker modifique el carrito en el medio
+    with carritos_db.edicion():
+        carrito = encontrar_carrito(carrito_id)
+        if not carrito:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
 
-    # Validar existencia de productos
-    for item_nuevo in items_a_agregar:
-        if not encontrar_producto(item_nuevo.producto_id):
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto con ID {item_nuevo.producto_id} no encontrado")
-
-    # Agrupar cantidades por producto (sumando lo que ya hay en el carrito y lo nuevo)
-    cantidades_por_producto = {}
-    for item in carrito["items"]:
-        pid = item["producto_id"]
-        cantidades_por_producto[pid] = cantidades_por_producto.get(pid, 0) + item["cantidad"]
-    for item_nuevo in items_a_agregar:
-        pid = item_nuevo.producto_id
-        cantidades_por_producto[pid] = cantidades_por_producto.get(pid, 0) + item_nuevo.cantidad
-
-    # Validar máximo 15 ítems en total
-    total_productos_en_carrito = sum(cantidades_por_producto.values())
-    if total_productos_en_carrito > 15:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No puede haber más de 15 ítems en el carrito")
-
-    # Validar máximo 10 unidades por producto
-    for pid, total in cantidades_por_producto.items():
-        if total > 10:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No puede haber más de 10 unidades del producto {pid} en el carrito")
-
-    # Actualizar el carrito agrupando por producto
-    # Primero, crear un dict de items actuales
-    items_dict = {item["producto_id"]: item for item in carrito["items"]}
-    for item_nuevo in items_a_agregar:
-        pid = item_nuevo.producto_id
-        if pid in items_dict:
-            items_dict[pid]["cantidad"] += item_nuevo.cantidad
-        else:
-            items_dict[pid] = item_nuevo.model_dump()
-    # Actualizar la lista de items del carrito
-    carrito["items"] = list(items_dict.values())
-    # Actualizar la hora de modificacion del carrito
-    carrito["actualizado_en"] = timestamp_utc()
+        if carrito_inactivo(carrito):
+            _expirar(carrito)
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="El carrito fue eliminado por inactividad.")
 
-    return carrito
+        # Validar existencia de productos
+        precios = {}
+        for item_nuevo in items_a_agregar:
+            producto = buscar_producto(item_nuevo.producto_id)
+            if not producto:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto con ID {item_nuevo.producto_id} no encontrado")
+            precios[item_nuevo.producto_id] = producto["precio"]
+        marcar("busqueda")
+
+        # Reglas de fraude sobre los contadores del carrito: solo se miran los productos del pedido
+        agregadas = _agrupar_cantidades(items_a_agregar)
+        resultantes = {pid: carrito.cantidad(pid) + cantidad for pid, cantidad in agregadas.items()}
+        error = validar_reglas_fraude(carrito.unidades + sum(agregadas.values()), resultantes)
+        if error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error)
+        marcar("validacion")
+
+        _reservar(carrito, resultantes)
+
+        # Actualizar el carrito agrupando por producto
+        for pid, cantidad in agregadas.items():
+            carrito.agregar(pid, cantidad, precios[pid])
+        # Actualizar la hora de modificacion del carrito
+        carrito.tocar()
+        carritos_db.save(carrito)
+        eventos.carrito_actualizado(carrito)
+        eventos.stock_cambiado(agregadas)
+        marcar("mutacion")
+
+        return carrito
+
+def _reservar(carrito, cantidades, reemplazar=False):
+    sin_stock = reservas.reservar(carrito.id, cantidades, reemplazar)
+    if sin_stock:
+        producto, disponible = sin_stock
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Stock insuficiente para el producto: {producto['nombre']}. Stock disponible: {disponible}")
+
+def _agrupar_cantidades(items):
+    """Suma las cantidades pedidas por producto: {producto_id: cantidad}."""
+    cantidades = {}
+    for item in items:
+        cantidades[item.producto_id] = cantidades.get(item.producto_id, 0) + item.cantidad
+    return cantidades
+
+
+@router.post("/carritos/bulk", response_model=List[ResultadoOperacion], tags=["Carritos"])
+async def operaciones_en_lote(operaciones: List[OperacionCarrito]):
+    """
+    Ejecuta una lista de operaciones sobre carritos en una sola petición.
+    - Operaciones: crear (user_id), agregar (PATCH), sobreescribir (PUT) y eliminar (carrito_id).
+    - Se aplican en orden, con las mismas reglas que los endpoints individuales.
+    - Cada producto se busca una sola vez para todo el lote.
+    - Una operación fallida no detiene el resto: se devuelve un resultado por operación.
+    """
+    marcar("validacion")
+    if len(operaciones) > MAX_OPERACIONES_LOTE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"No se pueden enviar más de {MAX_OPERACIONES_LOTE} operaciones por lote")
+    return await en_almacen(_ejecutar_lote, operaciones)
+
+def _ejecutar_lote(operaciones: List[OperacionCarrito]):
+    # Buscar los productos del lote una única vez
+    productos = {}
+    for operacion in operaciones:
+        for item in operacion.items:
+            if item.producto_id not in productos:
+                productos[item.producto_id] = encontrar_producto(item.producto_id)
+    buscar_producto = productos.get
+    marcar("busqueda")
+
+    resultados = []
+    for operacion in operaciones:
+        try:
+            resultados.append(_ejecutar_operacion(operacion, buscar_producto))
+        except HTTPException as error:
+            resultados.append({"status_code": error.status_code, "detail": error.detail})
+    return resultados
+
+def _ejecutar_operacion(operacion: OperacionCarrito, buscar_producto):
+    if operacion.operacion == "crear":
+        return {"status_code": status.HTTP_201_CREATED, "carrito": _crear_carrito(operacion.user_id).a_dict()}
+    if operacion.operacion == "agregar":
+        return {"status_code": status.HTTP_200_OK, "carrito": _agregar_items(operacion.carrito_id, operacion.items, buscar_producto).a_dict()}
+    if operacion.operacion == "sobreescribir":
+        return {"status_code": status.HTTP_200_OK, "carrito": _sobreescribir_items(operacion.carrito_id, operacion.items, buscar_producto).a_dict()}
+    _eliminar_carrito(operacion.carrito_id)
+    return {"status_code": status.HTTP_204_NO_CONTENT}
 
 
 @router.get("/pago/{carrito_id}/", tags=["Pago"])
-def pagar_carrito(carrito_id: str):
+async def pagar_carrito(carrito_id: str):
     """
     Procesa el pago de un carrito.
     - Verifica inactividad (elimina si pasó 1 minuto).
     - Verifica y resta el stock de los productos.
     - Elimina el carrito.
-    - Devuelve un número de seguimiento.
+    - Registra el pedido (consultable en GET /pedidos/{numero}) y devuelve su número de seguimiento.
+    Un reintento de este endpoint, con el carrito ya pagado, responde 404:
+    para reintentar de forma segura usar POST /pago/{carrito_id} con Idempotency-Key.
+    """
+    marcar("validacion")
+    return await _pagar(carrito_id)
+
+
+@router.post("/pago/{carrito_id}", tags=["Pago"])
+async def pagar_carrito_idempotente(carrito_id: str, idempotency_key: Optional[str] = Header(None)):
     """
+    Procesa el pago de un carrito, igual que GET /pago/{carrito_id}/.
+    Con la cabecera Idempotency-Key, los reintentos con la misma clave
+    devuelven el resultado del primer pago exitoso sin volver a descontar stock
+    (cabecera Idempotent-Replayed: true), y las peticiones simultáneas con la
+    misma clave se resuelven con una sola ejecución.
+    Reutilizar una clave para otro carrito devuelve 409.
+    """
+    marcar("validacion")
+    if not idempotency_key:
+        return await _pagar(carrito_id)
+    try:
+        resultado, repetido = await resultados_pago.ejecutar(idempotency_key, carrito_id, lambda: _pagar(carrito_id))
+    except ClaveReutilizada:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="La Idempotency-Key ya se usó para otro carrito")
+    if repetido:
+        pagos_total.inc("repetido")
+        return JSONResponse(resultado, headers={"Idempotent-Replayed": "true"})
+    return resultado
+
+
+async def _pagar(carrito_id: str):
+    carrito, reserva, items_pedido = await en_almacen(_tomar_carrito, carrito_id)
+
+    # 3. Restar stock (si la verificación fue exitosa)
+    # El descuento es todo o nada y vuelve a comprobar el stock bajo el lock de cada producto
+    # (el carrito ya agrupa las cantidades por producto). Los pagos simultaneos se
+    # agrupan en micro-lotes que se aplican en una sola pasada, en orden de llegada
+    cantidades = dict(carrito.items())
+    producto_sin_stock = await lotes_pago.descontar(cantidades)
+    if producto_sin_stock:
+        await en_almacen(_devolver_carrito, carrito, reserva)
+        pagos_total.inc("sin_stock")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Stock insuficiente para el producto: {producto_sin_stock['nombre']}. Stock disponible: {producto_sin_stock['stock']}")
+
+    pedido = await en_almacen(_registrar_pedido, carrito, reserva, items_pedido)
+    return {
+        "mensaje": "Pago procesado exitosamente",
+        "numero_seguimiento": pedido.numero
+    }
+
+def _tomar_carrito(carrito_id: str):
     carrito = encontrar_carrito(carrito_id)
     if not carrito:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
 
     if carrito_inactivo(carrito):
-        carritos_db.remove(carrito)
+        _expirar(carrito)
         raise HTTPException(status_code=status.HTTP_410_GONE, detail="El carrito fue eliminado por inactividad.")
 
-    if not carrito["items"]:
+    if not carrito.productos:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="El carrito está vacío")
 
-    # 1. Verificar stock
-    for item_carrito in carrito["items"]:
-        producto_db = encontrar_producto(item_carrito["producto_id"])
+    # 1. Verificar stock (y tomar los precios que se cobran)
+    items_pedido = []
+    for pid, cantidad in carrito.items():
+        producto_db = encontrar_producto(pid)
         if not producto_db:
-             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto con ID {item_carrito['producto_id']} no encontrado en la base de datos de productos")
-        if producto_db["stock"] < item_carrito["cantidad"]:
+             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Producto con ID {pid} no encontrado en la base de datos de productos")
+        if producto_db["stock"] < cantidad:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Stock insuficiente para el producto: {producto_db['nombre']}. Stock disponible: {producto_db['stock']}")
+        items_pedido.append((pid, cantidad, a_centavos(producto_db["precio"])))
+    marcar("busqueda")
 
-    # 2. Restar stock (si la verificación fue exitosa)
-    for item_carrito in carrito["items"]:
-        producto_db = encontrar_producto(item_carrito["producto_id"])
-        # Esta doble verificación es redundante si la lista no cambia, pero es segura
-        if producto_db:
-            producto_db["stock"] -= item_carrito["cantidad"]
-        
+    # 2. Tomar el carrito: se elimina antes de tocar el stock, asi un pago
+    # simultaneo del mismo carrito no puede descontar el stock dos veces.
+    # Su reserva se separa antes: las unidades siguen reservadas durante el pago
     # Ultima hora de modificacion antes de eliminarse
-    carrito["actualizado_en"] = timestamp_utc()
+    carrito.tocar()
+    reserva = reservas.tomar(carrito.id)
+    if not carritos_db.remove(carrito):
+        reservas.devolver(carrito.id, reserva)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Carrito no encontrado")
+    return carrito, reserva, items_pedido
 
-    # 3. Eliminar el carrito
-    carritos_db.remove(carrito)
+def _devolver_carrito(carrito, reserva):
+    # El pago no se realizo: el carrito vuelve a estar disponible, con su reserva
+    if carritos_db.add(carrito):
+        reservas.devolver(carrito.id, reserva)
+    else:
+        reservas.soltar(reserva)
 
-    # 4. Generar número de seguimiento
-    numero_seguimiento = f"PEDIDO-{str(uuid.uuid4())[:8].upper()}"
+def _registrar_pedido(carrito, reserva, items_pedido):
+    # La reserva se confirma: sus unidades ya salieron del stock
+    reservas.soltar(reserva)
+    pagos_total.inc("exitoso")
+    eventos.carrito_quitado(carrito)
 
-    return {
-        "mensaje": "Pago procesado exitosamente",
-        "numero_seguimiento": numero_seguimiento
-    }
\ No newline at end of file
+    # 4. Registrar el pedido con su número de seguimiento (uno nuevo si ya existiera)
+    pedido = Pedido(nuevo_numero_pedido(), carrito.user_id, carrito.id, items_pedido)
+    while not pedidos_db.add(pedido):
+        pedido.numero = nuevo_numero_pedido()
+    marcar("mutacion")
+    return pedido
\ No newline at end of file
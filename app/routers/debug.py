@@ -0,0 +1,67 @@
+# app/routers/debug.py
+import asyncio
+import hmac
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from typing import Optional
+
+from app.config import ADMIN_TOKEN
+from app.perfilado import perfilador, registro_lentas
+from app.schemas.debug import ConfigPerfilador, ConfigTrazas
+
+
+def verificar_admin(x_admin_token: Optional[str] = Header(None)):
+    # Sin CARRITO_ADMIN_TOKEN las rutas de diagnostico no existen: no pasan por el
+    # limite de tasa ni por el control de admision, asi que no pueden quedar abiertas
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not hmac.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Token de administración inválido")
+
+
+router = APIRouter(prefix="/debug", tags=["Debug"], dependencies=[Depends(verificar_admin)])
+
+
+def _estado_trazas():
+    return {"activo": registro_lentas.activo, "umbral_ms": registro_lentas.umbral_ms, "lentas_total": registro_lentas.lentas_total}
+
+
+@router.get("/slow")
+async def get_peticiones_lentas(limit: int = Query(50, ge=1, le=1000)):
+    """
+    Devuelve las últimas peticiones que superaron el umbral de las trazas, de la
+    más nueva a la más vieja, con el tiempo de cada fase en milisegundos:
+    validacion (lectura y validación del cuerpo, reglas), busqueda, mutacion,
+    serializacion y envio (o manejador, en rutas sin fases).
+    """
+    return {**_estado_trazas(), "peticiones": registro_lentas.ultimas(limit)}
+
+
+@router.put("/trazas")
+async def configurar_trazas(config: ConfigTrazas):
+    """
+    Activa o desactiva las trazas por fase y cambia el umbral de las peticiones lentas.
+    """
+    registro_lentas.configurar(config.activo, config.umbral_ms)
+    return _estado_trazas()
+
+
+@router.get("/perfilador")
+async def get_perfilador(limit: int = Query(20, ge=1, le=500)):
+    """
+    Informe del perfilador por muestreo: las pilas y funciones con más muestras.
+    """
+    return perfilador.informe(limit)
+
+
+@router.put("/perfilador")
+async def configurar_perfilador(config: ConfigPerfilador):
+    """
+    Enciende el perfilador por muestreo (reiniciando las muestras) o lo apaga,
+    conservando las muestras para consultarlas con GET /debug/perfilador.
+    """
+    if config.activo:
+        perfilador.iniciar(config.intervalo_ms)
+    else:
+        # Esperar al hilo del perfilador fuera del event loop
+        await asyncio.to_thread(perfilador.detener)
+    return perfilador.informe(0)
@@ -0,0 +1,106 @@
+# app/routers/eventos.py
+import asyncio
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
+
+from app.config import EVENTOS_KEEPALIVE_SEGUNDOS
+from app.eventos import eventos
+
+router = APIRouter()
+
+
+def _filtros(productos: Optional[str], carritos: Optional[str]):
+    """
+    productos y carritos separados por coma. Sin ninguno de los dos se recibe
+    el stock de todo el catalogo; con solo carritos, ningun stock.
+    """
+    try:
+        lista_productos = None if productos is None else [int(pid) for pid in productos.split(",") if pid.strip()]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="productos debe ser una lista de enteros separados por coma")
+    lista_carritos = [carrito_id.strip() for carrito_id in (carritos or "").split(",") if carrito_id.strip()]
+    if lista_productos is None and lista_carritos:
+        lista_productos = []
+    return lista_productos, lista_carritos
+
+
+@router.get("/eventos", tags=["Eventos"])
+async def eventos_sse(
+    productos: Optional[str] = Query(None, description="IDs de productos separados por coma"),
+    carritos: Optional[str] = Query(None, description="IDs de carritos separados por coma"),
+):
+    """
+    Stream de eventos (Server-Sent Events) de stock y de carritos:
+    - stock: stock disponible de un producto. Los cambios seguidos de un mismo
+      producto se agrupan y se envía solo el último valor.
+    - carrito_actualizado, carrito_eliminado y carrito_expirado.
+    Sin filtros se recibe el stock de todo el catálogo. Las conexiones sin
+    eventos reciben un comentario de keepalive periódico.
+    En modo shards el stock cambiado en cualquier shard se publica en todos
+    (se detecta por sondeo del stock compartido); los eventos de un carrito solo
+    los publica el shard dueño del carrito.
+    """
+    lista_productos, lista_carritos = _filtros(productos, carritos)
+    return StreamingResponse(
+        stream_sse(lista_productos, lista_carritos),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_sse(productos, carritos, bus=eventos, keepalive=EVENTOS_KEEPALIVE_SEGUNDOS):
+    # La suscripcion empieza con el stream: si la respuesta nunca se recorre (el
+    # cliente se fue antes del primer byte) no queda un suscriptor en el bus.
+    # Al desconectarse el cliente, Starlette cancela el generador y se desuscribe
+    suscriptor = bus.suscribir(productos, carritos)
+    try:
+        while not suscriptor.cerrado:
+            lote = await suscriptor.siguientes(keepalive)
+            if suscriptor.desbordado:
+                return
+            if not lote:
+                yield b": keepalive\n\n"
+                continue
+            yield b"".join(b"event: " + tipo.encode() + b"\ndata: " + datos + b"\n\n" for tipo, datos in lote)
+    finally:
+        bus.desuscribir(suscriptor)
+
+
+@router.websocket("/eventos/ws")
+async def eventos_websocket(websocket: WebSocket, productos: Optional[str] = None, carritos: Optional[str] = None):
+    """
+    Los mismos eventos que GET /eventos, como mensajes JSON de un WebSocket.
+    """
+    try:
+        lista_productos, lista_carritos = _filtros(productos, carritos)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    # Suscripto antes de aceptar: no se pierden los eventos posteriores a la conexion
+    suscriptor = eventos.suscribir(lista_productos, lista_carritos)
+    vigilante = None
+    try:
+        await websocket.accept()
+        # El cliente no envia mensajes: esta tarea solo detecta que se desconecto
+        vigilante = asyncio.create_task(_esperar_desconexion(websocket, suscriptor))
+        while not suscriptor.cerrado:
+            for _, datos in await suscriptor.siguientes(EVENTOS_KEEPALIVE_SEGUNDOS):
+                await websocket.send_text(datos.decode())
+        if suscriptor.desbordado:
+            # No leyo sus eventos a tiempo: que se vuelva a suscribir
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if vigilante is not None:
+            vigilante.cancel()
+        eventos.desuscribir(suscriptor)
+
+
+async def _esperar_desconexion(websocket, suscriptor):
+    try:
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+    finally:
+        suscriptor.cerrar()
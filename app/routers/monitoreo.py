@@ -0,0 +1,17 @@
+# app/routers/monitoreo.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.metricas import CONTENT_TYPE, exponer_metricas
+from app.utils import en_almacen
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse, tags=["Monitoreo"])
+async def get_metricas():
+    """
+    Devuelve las métricas del servicio en formato de texto de Prometheus:
+    latencia y cantidad de peticiones por ruta, peticiones en curso,
+    carritos activos y expirados, resultados de los pagos y stock por producto.
+    """
+    # Los medidores de carritos y stock consultan los almacenes
+    return PlainTextResponse(await en_almacen(exponer_metricas), media_type=CONTENT_TYPE)
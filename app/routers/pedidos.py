@@ -0,0 +1,55 @@
+# app/routers/pedidos.py
+from fastapi import APIRouter, HTTPException, Query, status
+from typing import Optional
+from datetime import datetime, timezone
+
+from app.db.database import pedidos_db
+from app.perfilado import marcar
+from app.utils import en_almacen
+from app.schemas.pedido import PaginaPedidos, Pedido
+
+router = APIRouter(tags=["Pedidos"])
+
+
+def _en_utc(fecha):
+    # Fechas sin zona horaria se interpretan en UTC, como los timestamps de los pedidos
+    if fecha is None:
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return fecha.astimezone(timezone.utc)
+
+
+@router.get("/pedidos/{numero}", response_model=Pedido)
+async def get_pedido(numero: str):
+    """
+    Devuelve un pedido por su número de seguimiento, con los items y precios cobrados.
+    """
+    marcar("validacion")
+    pedido = await en_almacen(pedidos_db.get, numero)
+    marcar("busqueda")
+    if pedido is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Pedido no encontrado")
+    return pedido.a_dict()
+
+
+@router.get("/usuarios/{user_id}/pedidos", response_model=PaginaPedidos)
+async def get_pedidos_usuario(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    desde: Optional[datetime] = None,
+    hasta: Optional[datetime] = None,
+):
+    """
+    Devuelve el historial de pedidos de un usuario, del más nuevo al más viejo,
+    paginado por cursor (el siguiente_cursor de la página anterior).
+    - Filtro opcional por fecha de pago: desde (inclusive) y hasta (exclusive).
+    """
+    marcar("validacion")
+    try:
+        pedidos, siguiente_cursor = await en_almacen(pedidos_db.por_usuario, user_id, cursor, limit, _en_utc(desde), _en_utc(hasta))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor inválido")
+    marcar("busqueda")
+    return {"items": [pedido.a_dict() for pedido in pedidos], "siguiente_cursor": siguiente_cursor}
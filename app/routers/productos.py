@@ -1,13 +1,61 @@
-from fastapi import APIRouter
-from typing import List
+from fastapi import APIRouter, Header, HTTPException, Query, Response, status
+from typing import List, Literal, Optional
 from app.schemas.producto import Producto
-from app.db.database import productos_db
+from app.catalogo import catalogo
+from app.indice_productos import indice_productos
+from app.perfilado import marcar
+from app.reservas import reservas
+from app.serializacion import catalogo_a_json
+from app.utils import en_almacen, encontrar_producto
 
 router = APIRouter()
 
 @router.get("/productos", response_model=List[Producto], tags=["Productos"])
-def get_productos():
+async def get_productos(
+    if_none_match: Optional[str] = Header(None),
+    ids: Optional[str] = Query(None, description="IDs separados por coma"),
+    q: Optional[str] = Query(None, description="Texto contenido en el nombre (sin distinguir mayúsculas ni acentos)"),
+    min_precio: Optional[float] = None,
+    max_precio: Optional[float] = None,
+    en_stock: bool = False,
+    orden: Optional[Literal["precio", "-precio"]] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
     """
     Devuelve la lista completa de productos disponibles.
+    El stock informado es el disponible: no incluye las unidades reservadas en carritos.
+    La respuesta se sirve desde una cache que se invalida al cambiar el stock o las reservas,
+    con un ETag fuerte: si el cliente envía If-None-Match con el ETag vigente
+    se responde 304 sin cuerpo.
+    Con filtros (ids, q, rango de precios, en_stock) u orden por precio, la
+    búsqueda usa los índices del catálogo y devuelve hasta `limit` productos.
     """
-    return productos_db
+    marcar("validacion")
+    if ids is not None or q or min_precio is not None or max_precio is not None or en_stock or orden:
+        try:
+            lista_ids = None if ids is None else [int(pid) for pid in ids.split(",") if pid.strip()]
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="ids debe ser una lista de enteros separados por coma")
+        productos = await en_almacen(indice_productos.buscar, lista_ids, q, min_precio, max_precio, en_stock, orden, limit)
+        marcar("busqueda")
+        return Response(content=catalogo_a_json(productos), media_type="application/json")
+
+    etag, cuerpo = await en_almacen(catalogo.obtener)
+    marcar("busqueda")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match and (if_none_match.strip() == "*" or etag in [e.strip() for e in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+
+@router.get("/productos/{producto_id}", response_model=Producto, tags=["Productos"])
+async def get_producto(producto_id: int):
+    """
+    Devuelve un producto por su ID, con su stock disponible.
+    """
+    marcar("validacion")
+    producto = await en_almacen(encontrar_producto, producto_id)
+    if not producto:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Producto no encontrado")
+    marcar("busqueda")
+    return reservas.con_disponible(producto)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 from .producto import ProductoEnCarrito
 from datetime import datetime, timezone
 
@@ -7,10 +7,11 @@ from datetime import datetime, timezone
 class CarritoCreate(BaseModel):
     user_id: str
 
-# Modelo base de un item en el carrito (para la entrada de datos en PATCH/PUT)
+# Modelo base de un item en el carrito (para la entrada de datos en PATCH/PUT).
+# La cantidad es positiva: una negativa liberaria unidades reservadas por otros carritos
 class ItemCarritoBase(BaseModel):
     producto_id: int
-    cantidad: int
+    cantidad: int = Field(gt=0)
 
 # Modelo completo del carrito (para devolver como respuesta)
 class Carrito(BaseModel):
@@ -18,4 +19,32 @@ class Carrito(BaseModel):
     user_id: str
     items: List[ProductoEnCarrito] = []
     creado_en: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-    actualizado_en: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
\ No newline at end of file
+    actualizado_en: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    total: float = 0.0
+
+# Pagina de carritos para el listado paginado por cursor
+class PaginaCarritos(BaseModel):
+    items: List[Carrito]
+    siguiente_cursor: Optional[str] = None
+
+
+# Operacion individual dentro de POST /carritos/bulk
+class OperacionCarrito(BaseModel):
+    operacion: Literal["crear", "agregar", "sobreescribir", "eliminar"]
+    user_id: Optional[str] = None
+    carrito_id: Optional[str] = None
+    items: List[ItemCarritoBase] = []
+
+    @model_validator(mode="after")
+    def validar_campos_requeridos(self):
+        if self.operacion == "crear" and self.user_id is None:
+            raise ValueError("La operación 'crear' requiere user_id")
+        if self.operacion != "crear" and self.carrito_id is None:
+            raise ValueError(f"La operación '{self.operacion}' requiere carrito_id")
+        return self
+
+# Resultado de cada operacion de un lote
+class ResultadoOperacion(BaseModel):
+    status_code: int
+    carrito: Optional[Carrito] = None
+    detail: Optional[str] = None
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+# Configuracion de las trazas de peticiones lentas (PUT /debug/trazas)
+class ConfigTrazas(BaseModel):
+    activo: bool
+    umbral_ms: Optional[float] = Field(None, ge=0)
+
+# Configuracion del perfilador por muestreo (PUT /debug/perfilador).
+# Con menos de 1 ms entre muestras el hilo del perfilador compite con los handlers
+class ConfigPerfilador(BaseModel):
+    activo: bool
+    intervalo_ms: float = Field(5, ge=1, le=1000)
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+
+# Item de un pedido, con el precio unitario cobrado al pagar
+class ItemPedido(BaseModel):
+    producto_id: int
+    cantidad: int
+    precio: float
+
+# Pedido registrado al pagar un carrito
+class Pedido(BaseModel):
+    numero_seguimiento: str
+    user_id: str
+    carrito_id: str
+    items: List[ItemPedido]
+    total: float
+    creado_en: datetime
+
+# Pagina del historial de pedidos de un usuario, del más nuevo al más viejo
+class PaginaPedidos(BaseModel):
+    items: List[Pedido]
+    siguiente_cursor: Optional[str] = None
@@ -0,0 +1,58 @@
+# app/serializacion.py
+# Camino rapido de serializacion para las respuestas.
+# Los carritos y productos internos ya son validos, asi que revalidarlos con
+# Pydantic en cada respuesta es trabajo repetido. En modo rapido se serializan
+# directamente a bytes con orjson; el response_model de cada endpoint se
+# mantiene, por lo que el esquema OpenAPI no cambia.
+from fastapi import Response, status
+from pydantic import TypeAdapter
+from typing import List
+
+from app import config
+from app.schemas.carrito import Carrito
+from app.schemas.producto import Producto
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin el se usa siempre el camino de Pydantic
+    orjson = None
+
+_adaptador_catalogo = TypeAdapter(List[Producto])
+
+
+def respuesta_rapida_activa():
+    return config.RESPUESTA_RAPIDA and orjson is not None
+
+
+def respuesta_carrito(carrito, status_code=status.HTTP_200_OK):
+    """
+    Respuesta de un endpoint que devuelve un Carrito.
+    En modo rapido devuelve los bytes JSON ya armados; si no, el diccionario
+    que FastAPI valida contra el response_model.
+    """
+    if not respuesta_rapida_activa():
+        return carrito.a_dict()
+    return Response(content=carrito_a_json(carrito), media_type="application/json", status_code=status_code)
+
+
+def carrito_a_json(carrito):
+    """
+    Bytes JSON de un carrito con la forma del esquema Carrito.
+    """
+    if not respuesta_rapida_activa():
+        return Carrito.model_validate(carrito.a_dict()).model_dump_json().encode()
+    # OPT_UTC_Z produce el mismo formato de fecha que Pydantic ("...Z")
+    return orjson.dumps(carrito.a_dict(), option=orjson.OPT_UTC_Z)
+
+
+def catalogo_a_json(productos):
+    """
+    JSON del catalogo. En modo rapido se arma solo con los campos del esquema
+    Producto, sin validarlos; si no, se valida y serializa con Pydantic.
+    """
+    if not respuesta_rapida_activa():
+        return _adaptador_catalogo.dump_json(_adaptador_catalogo.validate_python(list(productos)))
+    return orjson.dumps([
+        {"id": p["id"], "nombre": p["nombre"], "precio": p["precio"], "stock": p["stock"]}
+        for p in productos
+    ])
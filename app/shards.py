@@ -0,0 +1,345 @@
+# app/shards.py
+# Reparto de carritos entre procesos (modo shards).
+# Cada usuario pertenece a un shard segun un anillo de hashing consistente, y sus
+# carritos se crean en ese shard con un ID que lo indica ("s2-<uuid>"). Cualquier
+# proceso puede recibir una peticion: si el carrito es de otro shard, el middleware
+# la reenvia al puerto interno del dueño. Los listados y las operaciones en lote,
+# que abarcan varios shards, se reparten y se combinan. Los pedidos quedan en el
+# shard del carrito pagado, es decir en el del usuario.
+import asyncio
+import bisect
+import hashlib
+import json
+import re
+import uuid
+from urllib.parse import parse_qs, urlencode
+
+from app.config import SHARD, SHARD_PUERTO_BASE, SHARDS
+
+# Las peticiones reenviadas entre shards llevan esta cabecera y se atienden localmente.
+# Solo se respeta en el puerto interno del shard: un cliente podria enviarla al
+# puerto publico para saltear el ruteo (y los limites de admision).
+CABECERA_LOCAL = b"x-carrito-shard-local"
+HOST_INTERNO = "127.0.0.1"
+
+_ID_CON_SHARD = re.compile(r"^s(\d+)-")
+_NUMERO_CON_SHARD = re.compile(r"^PEDIDO-S(\d+)-")
+_CABECERAS_NO_REENVIABLES = {b"host", b"content-length", b"connection", b"transfer-encoding"}
+
+
+def es_reenvio_interno(scope, shard=SHARD, shards=SHARDS, puerto_base=SHARD_PUERTO_BASE, host_interno=HOST_INTERNO):
+    """
+    La peticion la reenvio otro shard: trae la cabecera local y llego por el
+    puerto interno de este shard (el listener, no un dato que elige el cliente).
+    """
+    return (shards > 1 and (CABECERA_LOCAL, b"1") in scope["headers"]
+            and tuple(scope.get("server") or ()) == (host_interno, puerto_base + shard))
+
+
+def sin_cabecera_local(scope):
+    """El scope sin la cabecera local, para las peticiones que no son reenvios internos."""
+    return dict(scope, headers=[(k, v) for k, v in scope["headers"] if k != CABECERA_LOCAL])
+
+
+def _hash(clave):
+    return int.from_bytes(hashlib.blake2b(clave.encode(), digest_size=8).digest(), "big")
+
+
+class AnilloConsistente:
+    """
+    Anillo de hashing consistente con nodos virtuales: cada nodo ocupa `replicas`
+    puntos del anillo y una clave pertenece al primer punto siguiente a su hash.
+    Al cambiar la cantidad de nodos solo se mueve la fraccion de claves que
+    corresponde al nodo agregado o quitado.
+    """
+
+    def __init__(self, nodos, replicas=128):
+        puntos = sorted((_hash(f"{nodo}#{replica}"), nodo) for nodo in nodos for replica in range(replicas))
+        self._hashes = [h for h, _ in puntos]
+        self._nodos = [nodo for _, nodo in puntos]
+
+    def nodo(self, clave):
+        i = bisect.bisect(self._hashes, _hash(clave))
+        return self._nodos[i % len(self._nodos)]
+
+
+anillo = AnilloConsistente(range(SHARDS))
+
+
+def shard_de_usuario(user_id):
+    return anillo.nodo(user_id)
+
+
+def shard_de_carrito(carrito_id):
+    """
+    Shard dueño de un carrito: el indicado en su ID o, si el ID no lo indica,
+    el que le asigna el anillo.
+    """
+    coincidencia = _ID_CON_SHARD.match(carrito_id)
+    if coincidencia and int(coincidencia.group(1)) < SHARDS:
+        return int(coincidencia.group(1))
+    return anillo.nodo(carrito_id)
+
+
+def nuevo_id_carrito():
+    """
+    ID para un carrito nuevo. En modo shards incluye el shard que lo crea.
+    """
+    if SHARDS > 1:
+        return f"s{SHARD}-{uuid.uuid4()}"
+    return str(uuid.uuid4())
+
+
+def nuevo_numero_pedido():
+    """
+    Numero de seguimiento para un pedido nuevo. En modo shards incluye el shard
+    que lo registra, para que GET /pedidos/{numero} llegue a ese shard.
+    """
+    sufijo = uuid.uuid4().hex[:12].upper()
+    if SHARDS > 1:
+        return f"PEDIDO-S{SHARD}-{sufijo}"
+    return f"PEDIDO-{sufijo}"
+
+
+def shard_de_pedido(numero):
+    coincidencia = _NUMERO_CON_SHARD.match(numero)
+    if coincidencia and int(coincidencia.group(1)) < SHARDS:
+        return int(coincidencia.group(1))
+    return anillo.nodo(numero)
+
+
+async def leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body"):
+            return b"".join(partes)
+
+
+def receive_con_cuerpo(cuerpo, receive):
+    # Entrega el cuerpo ya leido a la aplicacion y luego delega en el receive original
+    pendiente = [cuerpo]
+
+    async def receive_repetido():
+        if pendiente:
+            return {"type": "http.request", "body": pendiente.pop(), "more_body": False}
+        return await receive()
+
+    return receive_repetido
+
+
+async def _responder(send, status_code, cuerpo, headers=((b"content-type", b"application/json"),)):
+    headers = list(headers) + [(b"content-length", str(len(cuerpo)).encode())]
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def _responder_error(send, status_code, detalle):
+    await _responder(send, status_code, json.dumps({"detail": detalle}).encode())
+
+
+class RuteoShardsMiddleware:
+    """
+    Middleware ASGI del modo shards: atiende localmente lo que es de este shard
+    y reenvia el resto al shard dueño.
+    """
+
+    def __init__(self, app, shard=SHARD, shards=SHARDS, puerto_base=SHARD_PUERTO_BASE, host_interno=HOST_INTERNO):
+        self.app = app
+        self.shard = shard
+        self.shards = shards
+        self.puerto_base = puerto_base
+        self.host_interno = host_interno
+        self._cliente = None
+
+    @property
+    def cliente(self):
+        # Se crea en el event loop del worker, con conexiones reutilizables hacia los demas shards.
+        # httpx se importa recien aqui: sin shards no hace falta y demora el arranque
+        if self._cliente is None:
+            import httpx
+
+            self._cliente = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=None, max_keepalive_connections=256))
+        return self._cliente
+
+    def _url(self, shard, ruta, query=""):
+        url = f"http://{self.host_interno}:{self.puerto_base + shard}{ruta}"
+        return f"{url}?{query}" if query else url
+
+    async def _pedir(self, shard, metodo, ruta, query="", headers=(), cuerpo=b""):
+        cabeceras = [(k, v) for k, v in headers if k not in _CABECERAS_NO_REENVIABLES and k != CABECERA_LOCAL]
+        cabeceras.append((CABECERA_LOCAL, b"1"))
+        return await self.cliente.request(metodo, self._url(shard, ruta, query), headers=cabeceras, content=cuerpo)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if es_reenvio_interno(scope, self.shard, self.shards, self.puerto_base, self.host_interno):
+            await self.app(scope, receive, send)
+            return
+        if any(k == CABECERA_LOCAL for k, _ in scope["headers"]):
+            scope = sin_cabecera_local(scope)
+
+        metodo = scope["method"]
+        partes = scope["path"].strip("/").split("/")
+        query = scope.get("query_string", b"").decode()
+        destino = self.shard
+        cuerpo = None
+
+        if partes[0] == "carritos" and len(partes) == 1 and metodo == "POST":
+            cuerpo = await leer_cuerpo(receive)
+            try:
+                user_id = json.loads(cuerpo).get("user_id")
+            except (ValueError, AttributeError):
+                user_id = None
+            if isinstance(user_id, str):
+                destino = shard_de_usuario(user_id)
+        elif partes[0] == "carritos" and len(partes) == 1 and metodo == "GET":
+            user_id = parse_qs(query).get("user_id")
+            if user_id:
+                destino = shard_de_usuario(user_id[0])
+            else:
+                await self._listar(scope, query, receive, send)
+                return
+        elif partes[0] == "carritos" and partes[1:] == ["bulk"] and metodo == "POST":
+            cuerpo = await leer_cuerpo(receive)
+            if await self._lote(scope, cuerpo, send):
+                return
+        elif partes[0] in ("carritos", "pago") and len(partes) >= 2:
+            destino = shard_de_carrito(partes[1])
+        elif partes[0] == "pedidos" and len(partes) == 2:
+            destino = shard_de_pedido(partes[1])
+        elif partes[0] == "usuarios" and partes[2:] == ["pedidos"]:
+            # Los pedidos de un usuario estan en el shard de sus carritos
+            destino = shard_de_usuario(partes[1])
+
+        if destino == self.shard:
+            if cuerpo is not None:
+                receive = receive_con_cuerpo(cuerpo, receive)
+            await self.app(scope, receive, send)
+            return
+
+        if cuerpo is None:
+            cuerpo = await leer_cuerpo(receive)
+        respuesta = await self._pedir(destino, metodo, scope["path"], query, scope["headers"], cuerpo)
+        headers = [(k, v) for k, v in respuesta.headers.raw if k.lower() not in _CABECERAS_NO_REENVIABLES]
+        await _responder(send, respuesta.status_code, respuesta.content, headers)
+
+    async def _listar(self, scope, query, receive, send):
+        """
+        GET /carritos sin user_id: recorre los shards en orden. El cursor combina
+        el shard y el cursor local ("2:135").
+        """
+        parametros = {clave: valores[-1] for clave, valores in parse_qs(query).items()}
+        cursor = parametros.pop("cursor", None)
+        try:
+            limite = int(parametros.get("limit", 100))
+        except ValueError:
+            # Un limite que no es un numero lo rechaza la validacion de la aplicacion
+            await self.app(scope, receive, send)
+            return
+        try:
+            shard, cursor_local = (0, "") if cursor is None else cursor.split(":", 1)
+            shard = int(shard)
+            if not 0 <= shard < self.shards:
+                raise ValueError(cursor)
+        except ValueError:
+            await _responder_error(send, 400, "Cursor inválido")
+            return
+        cursor_local = cursor_local or None
+
+        if parametros.get("formato") == "ndjson":
+            await self._listar_ndjson(scope, parametros, shard, cursor_local, send)
+            return
+
+        items, siguiente, con_carritos = [], None, False
+        while shard < self.shards:
+            pedido = dict(parametros, limit=limite - len(items))
+            if cursor_local is not None:
+                pedido["cursor"] = cursor_local
+            respuesta = await self._pedir(shard, "GET", "/carritos", urlencode(pedido), scope["headers"])
+            if respuesta.status_code == 200:
+                con_carritos = True
+                pagina = respuesta.json()
+                items.extend(pagina["items"])
+                if pagina["siguiente_cursor"] is not None:
+                    siguiente = f"{shard}:{pagina['siguiente_cursor']}"
+                    break
+            elif respuesta.status_code != 404:
+                await _responder(send, respuesta.status_code, respuesta.content)
+                return
+            shard, cursor_local = shard + 1, None
+            if len(items) == limite and shard < self.shards:
+                siguiente = f"{shard}:"
+                break
+
+        if not con_carritos:
+            await _responder_error(send, 404, "No hay carritos activos")
+            return
+        await _responder(send, 200, json.dumps({"items": items, "siguiente_cursor": siguiente}).encode())
+
+    async def _listar_ndjson(self, scope, parametros, shard, cursor_local, send):
+        iniciado = False
+        for numero in range(shard, self.shards):
+            pedido = dict(parametros)
+            if numero == shard and cursor_local is not None:
+                pedido["cursor"] = cursor_local
+            respuesta = await self._pedir(numero, "GET", "/carritos", urlencode(pedido), scope["headers"])
+            if respuesta.status_code == 404:
+                continue
+            if respuesta.status_code != 200:
+                if not iniciado:
+                    await _responder(send, respuesta.status_code, respuesta.content)
+                    return
+                break
+            if not iniciado:
+                await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/x-ndjson")]})
+                iniciado = True
+            await send({"type": "http.response.body", "body": respuesta.content, "more_body": True})
+        if not iniciado:
+            await _responder_error(send, 404, "No hay carritos activos")
+            return
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _lote(self, scope, cuerpo, send):
+        """
+        POST /carritos/bulk: agrupa las operaciones por shard dueño, las envia en
+        paralelo y devuelve los resultados en el orden original. Devuelve False si
+        el lote no puede repartirse (lo valida y rechaza el shard local).
+        """
+        from app.routers.carritos import MAX_OPERACIONES_LOTE
+
+        try:
+            operaciones = json.loads(cuerpo)
+            if len(operaciones) > MAX_OPERACIONES_LOTE:
+                return False
+            destinos = []
+            for operacion in operaciones:
+                if operacion.get("operacion") == "crear":
+                    destinos.append(shard_de_usuario(operacion["user_id"]))
+                else:
+                    destinos.append(shard_de_carrito(operacion["carrito_id"]))
+        except (ValueError, AttributeError, KeyError, TypeError):
+            return False
+
+        grupos = {}
+        for indice, destino in enumerate(destinos):
+            grupos.setdefault(destino, []).append(indice)
+        if list(grupos) in ([], [self.shard]):
+            return False
+
+        async def enviar(destino, indices):
+            contenido = json.dumps([operaciones[i] for i in indices]).encode()
+            return indices, await self._pedir(destino, "POST", "/carritos/bulk", "", scope["headers"], contenido)
+
+        resultados = [None] * len(operaciones)
+        for indices, respuesta in await asyncio.gather(*(enviar(d, i) for d, i in grupos.items())):
+            if respuesta.status_code != 200:
+                await _responder(send, respuesta.status_code, respuesta.content)
+                return True
+            for indice, resultado in zip(indices, respuesta.json()):
+                resultados[indice] = resultado
+        await _responder(send, 200, json.dumps(resultados).encode())
+        return True
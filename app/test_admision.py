@@ -0,0 +1,143 @@
+# Pruebas del limite de tasa y del control de admision
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.admision import AdmisionMiddleware, ControlAdmision, CubetasTokens, usuario_de_peticion
+from app.db.database import carritos_db
+from app.db.modelos import CarritoCompacto
+
+
+def crear_app(por_usuario=CubetasTokens(0, 1), por_ip=CubetasTokens(0, 1), control=ControlAdmision(max_concurrentes=0)):
+    """
+    App mínima con el middleware de admisión: /eco responde al instante y
+    /lento espera hasta que se libere el evento `liberar`.
+    """
+    app = FastAPI()
+    liberar = threading.Event()
+
+    @app.get("/eco")
+    async def eco():
+        return {"ok": True}
+
+    @app.post("/carritos")
+    async def crear(datos: dict):
+        return datos
+
+    @app.get("/lento")
+    async def lento():
+        while not liberar.is_set():
+            await asyncio.sleep(0.005)
+        return {"ok": True}
+
+    app.add_middleware(AdmisionMiddleware, por_usuario=por_usuario, por_ip=por_ip, control=control)
+    return TestClient(app), liberar
+
+def setup_function():
+    carritos_db.clear()
+
+def test_cubeta_de_tokens_rafaga_recarga_y_descarte():
+    """
+    La cubeta admite una ráfaga, luego indica cuánto falta para el próximo
+    token, se recarga con el tiempo y se descarta tras quedar inactiva.
+    """
+    cubetas = CubetasTokens(tasa=2, rafaga=3)
+    assert [cubetas.consumir("u1", ahora=0.0) for _ in range(3)] == [0, 0, 0]
+    assert cubetas.consumir("u1", ahora=0.0) == 0.5
+    assert cubetas.consumir("u1", ahora=0.5) == 0
+    assert cubetas.consumir("u2", ahora=0.5) == 0
+    assert len(cubetas) == 2
+
+    # A los 1.5 s sin uso (rafaga / tasa) "u1" está llena y se descarta; "u2" sigue
+    cubetas.consumir("u2", ahora=1.9)
+    assert len(cubetas) == 2
+    cubetas.consumir("u3", ahora=2.0)
+    assert len(cubetas) == 2
+
+def test_limite_de_tasa_por_ip_y_por_usuario():
+    """
+    Al agotar su ráfaga, una IP o un usuario reciben 429 con Retry-After,
+    sin afectar a los demás usuarios.
+    """
+    client, _ = crear_app(por_usuario=CubetasTokens(tasa=0.01, rafaga=2))
+    assert client.get("/eco", params={"user_id": "ana"}).status_code == 200
+    assert client.get("/eco", params={"user_id": "ana"}).status_code == 200
+    rechazada = client.get("/eco", params={"user_id": "ana"})
+    assert rechazada.status_code == 429
+    assert int(rechazada.headers["retry-after"]) >= 1
+    assert client.get("/eco", params={"user_id": "beto"}).status_code == 200
+
+    client, _ = crear_app(por_ip=CubetasTokens(tasa=0.01, rafaga=2))
+    assert [client.get("/eco").status_code for _ in range(3)] == [200, 200, 429]
+    # La cabecera de reenvio entre shards no saltea el limite fuera del puerto interno
+    assert client.get("/eco", headers={"x-carrito-shard-local": "1"}).status_code == 429
+    assert client.get("/metrics").status_code == 404  # las rutas exentas no se limitan: llega a la app
+
+def test_usuario_de_la_peticion_por_carrito():
+    """
+    En las rutas de un carrito, el usuario es el dueño del carrito; al crearlo,
+    el user_id del cuerpo.
+    """
+    carritos_db.add(CarritoCompacto("c-1", "ana"))
+    assert asyncio.run(usuario_de_peticion({"path": "/carritos/c-1", "query_string": b""})) == "ana"
+    assert asyncio.run(usuario_de_peticion({"path": "/pago/c-1/", "query_string": b""})) == "ana"
+    assert asyncio.run(usuario_de_peticion({"path": "/carritos", "query_string": b"user_id=beto"})) == "beto"
+    assert asyncio.run(usuario_de_peticion({"path": "/carritos", "query_string": b""}, b'{"user_id": "caro"}')) == "caro"
+    assert asyncio.run(usuario_de_peticion({"path": "/carritos", "query_string": b""}, b"no es json")) is None
+    assert asyncio.run(usuario_de_peticion({"path": "/carritos", "query_string": b""})) is None
+
+def test_limite_por_usuario_al_crear_carritos():
+    """
+    POST /carritos se limita por el user_id del cuerpo, y el cuerpo leído por
+    el middleware llega intacto a la aplicación.
+    """
+    client, _ = crear_app(por_usuario=CubetasTokens(tasa=0.01, rafaga=2))
+    for _ in range(2):
+        respuesta = client.post("/carritos", json={"user_id": "ana"})
+        assert respuesta.status_code == 200 and respuesta.json() == {"user_id": "ana"}
+    assert client.post("/carritos", json={"user_id": "ana"}).status_code == 429
+    assert client.post("/carritos", json={"user_id": "beto"}).json() == {"user_id": "beto"}
+
+def test_control_de_admision_encola_y_rechaza_con_503():
+    """
+    Con el máximo de peticiones en curso, las siguientes esperan en la cola;
+    con la cola llena se rechazan con 503, y las encoladas se atienden al
+    liberarse un lugar.
+    """
+    control = ControlAdmision(max_concurrentes=2, max_cola=1, espera_maxima=5, espera_objetivo=10)
+    client, liberar = crear_app(control=control)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        lentas = [executor.submit(client.get, "/lento") for _ in range(2)]
+        while control.en_curso < 2:
+            time.sleep(0.005)
+        encolada = executor.submit(client.get, "/eco")
+        while control.en_cola < 1:
+            time.sleep(0.005)
+
+        rechazada = client.get("/eco")
+        assert rechazada.status_code == 503
+        assert rechazada.headers["retry-after"] == "1"
+
+        liberar.set()
+        assert [f.result().status_code for f in lentas] == [200, 200]
+        assert encolada.result().status_code == 200
+    assert control.en_curso == 0 and control.en_cola == 0
+
+def test_control_de_admision_rechaza_si_la_espera_es_excesiva():
+    """
+    Una petición que espera en la cola más que el máximo se rechaza con 503
+    y deja su lugar en la cola.
+    """
+    control = ControlAdmision(max_concurrentes=1, max_cola=10, espera_maxima=0.05, espera_objetivo=10)
+    client, liberar = crear_app(control=control)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        lenta = executor.submit(client.get, "/lento")
+        while control.en_curso < 1:
+            time.sleep(0.005)
+        assert client.get("/eco").status_code == 503
+        assert control.en_cola == 0
+        liberar.set()
+        assert lenta.result().status_code == 200
+    assert client.get("/eco").status_code == 200
@@ -0,0 +1,38 @@
+# Pruebas del modo de arranque rapido
+import json
+import subprocess
+import sys
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.main import app
+from app.openapi_estatico import escribir_openapi, usar_openapi_precalculado
+
+
+def test_openapi_precalculado(tmp_path):
+    """
+    El esquema se genera una vez a un archivo y una app configurada con
+    ese archivo lo sirve tal cual en /openapi.json, sin generarlo.
+    """
+    ruta = tmp_path / "openapi.json"
+    escribir_openapi(app, ruta)
+    esquema = json.loads(ruta.read_text(encoding="utf-8"))
+    assert esquema == app.openapi()
+    assert "/carritos/{carrito_id}" in esquema["paths"]
+
+    otra_app = FastAPI()
+    usar_openapi_precalculado(otra_app, ruta)
+    assert TestClient(otra_app).get("/openapi.json").json() == esquema
+
+    # Sin archivo, FastAPI lo genera como siempre
+    sin_archivo = FastAPI(title="Sin archivo")
+    usar_openapi_precalculado(sin_archivo, tmp_path / "no_existe.json")
+    assert TestClient(sin_archivo).get("/openapi.json").json()["info"]["title"] == "Sin archivo"
+
+def test_importar_la_app_no_carga_modulos_diferidos():
+    """
+    Importar la app no carga los módulos que solo se usan en otros modos
+    (cliente HTTP de los shards, SQLite, diario de eventos).
+    """
+    codigo = "import sys, app.main; print(sorted(m for m in ('httpx', 'sqlite3', 'app.db.diario', 'app.db.sqlite') if m in sys.modules))"
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True).stdout
+    assert salida.strip() == "[]"
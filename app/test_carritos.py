@@ -1,8 +1,15 @@
 # Importaciones necesarias para las pruebas
+import json
+import os
+import subprocess
+import sys
+import time
 from fastapi.testclient import TestClient
 from app.main import app  # La instancia de la aplicación FastAPI
 from app.db.database import carritos_db, productos_db # Simulación de la base de datos en memoria
 from app.utils import carrito_inactivo, timestamp_utc, timedelta # Utilidades para pruebas de inactividad
+from app.expiracion import CartSweeper
+from app.db.modelos import CarritoCompacto
 
 # Creación de un cliente de prueba que interactuará con la API
 client = TestClient(app)
@@ -84,6 +91,57 @@ def test_crear_otro_carrito_tras_eliminar_o_pagar():
     assert carrito3["id"] != carrito2["id"]
 
 
+# --- Tests para LISTAR carritos (GET /carritos) ---
+
+def test_listar_carritos_paginados_por_cursor():
+    """
+    Verifica la paginación por cursor: recorriendo las páginas con
+    'siguiente_cursor' se obtienen todos los carritos una sola vez, aunque
+    se eliminen carritos entre una página y la siguiente.
+    """
+    ids = [client.post("/carritos", json={"user_id": f"TestPagina{i}"}).json()["id"] for i in range(7)]
+
+    pagina1 = client.get("/carritos", params={"limit": 3}).json()
+    assert [c["id"] for c in pagina1["items"]] == ids[:3]
+
+    client.delete(f"/carritos/{ids[3]}")
+    pagina2 = client.get("/carritos", params={"limit": 3, "cursor": pagina1["siguiente_cursor"]}).json()
+    assert [c["id"] for c in pagina2["items"]] == ids[4:7]
+
+    pagina3 = client.get("/carritos", params={"limit": 3, "cursor": pagina2["siguiente_cursor"]}).json()
+    assert pagina3 == {"items": [], "siguiente_cursor": None}
+
+    assert client.get("/carritos", params={"cursor": "no-es-un-cursor"}).status_code == 400
+
+def test_listar_carritos_con_filtros():
+    """
+    Verifica los filtros por user_id y por fecha de última actualización.
+    """
+    viejo = client.post("/carritos", json={"user_id": "TestFiltroViejo"}).json()
+    nuevo = client.post("/carritos", json={"user_id": "TestFiltroNuevo"}).json()
+    carritos_db.get(viejo["id"]).actualizado_ts -= 30
+
+    por_usuario = client.get("/carritos", params={"user_id": "TestFiltroViejo"}).json()
+    assert [c["id"] for c in por_usuario["items"]] == [viejo["id"]]
+
+    desde = (timestamp_utc() - timedelta(seconds=10)).isoformat()
+    recientes = client.get("/carritos", params={"actualizado_desde": desde}).json()
+    assert [c["id"] for c in recientes["items"]] == [nuevo["id"]]
+
+def test_listar_carritos_en_streaming_ndjson():
+    """
+    Verifica el modo streaming: todos los carritos se devuelven como
+    líneas JSON, aunque ocupen varias páginas internas.
+    """
+    ids = [client.post("/carritos", json={"user_id": f"TestStream{i}"}).json()["id"] for i in range(5)]
+
+    response = client.get("/carritos", params={"formato": "ndjson", "limit": 2})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lineas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [c["id"] for c in lineas] == ids
+
+
 # --- Tests para OBTENER carritos (GET /carritos/{carrito_id}) ---
 
 def test_get_carrito_existente():
@@ -188,6 +246,92 @@ def test_no_se_puede_superar_limite_de_cantidad_por_producto():
     assert "No puede haber más de 10 unidades" in patch_response2.json()["detail"]
 
 
+def test_total_del_carrito_se_actualiza_con_patch_y_put():
+    """
+    El carrito lleva su total (precio por cantidad) al día con cada PATCH y PUT,
+    y el PUT también respeta las reglas de fraude.
+    """
+    productos_db.clear()
+    productos_db.append({"id": 1, "nombre": "ProdTotal1", "precio": 10.10, "stock": 100})
+    productos_db.append({"id": 2, "nombre": "ProdTotal2", "precio": 0.2, "stock": 100})
+
+    carrito_id = client.post("/carritos", json={"user_id": "user_total"}).json()["id"]
+    assert client.get(f"/carritos/{carrito_id}").json()["total"] == 0
+
+    response = client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 2}, {"producto_id": 2, "cantidad": 3}])
+    assert response.json()["total"] == 20.80
+    response = client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 2, "cantidad": 1}])
+    assert response.json()["total"] == 21.00
+
+    response = client.put(f"/carritos/{carrito_id}", json=[{"producto_id": 2, "cantidad": 5}])
+    assert response.json()["total"] == 1.00
+
+    response = client.put(f"/carritos/{carrito_id}", json=[{"producto_id": 2, "cantidad": 6}, {"producto_id": 2, "cantidad": 5}])
+    assert response.status_code == 400
+    assert client.get(f"/carritos/{carrito_id}").json()["total"] == 1.00
+
+
+def test_reglas_de_fraude_configurables(monkeypatch):
+    """
+    Los límites de fraude son reglas configurables que se evalúan contra los
+    contadores del carrito.
+    """
+    from app import reglas
+
+    monkeypatch.setattr(reglas, "reglas_fraude", [reglas.LimiteUnidadesCarrito(3), reglas.LimiteUnidadesPorProducto(2)])
+    productos_db.clear()
+    productos_db.append({"id": 1, "nombre": "ProdRegla1", "precio": 1.0, "stock": 100})
+    productos_db.append({"id": 2, "nombre": "ProdRegla2", "precio": 1.0, "stock": 100})
+
+    carrito_id = client.post("/carritos", json={"user_id": "user_reglas"}).json()["id"]
+    response = client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 3}])
+    assert response.json()["detail"] == "No puede haber más de 2 unidades del producto 1 en el carrito"
+
+    assert client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 2}]).status_code == 200
+    response = client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 2, "cantidad": 2}])
+    assert response.json()["detail"] == "No puede haber más de 3 ítems en el carrito"
+
+
+# --- Tests para OPERACIONES EN LOTE (POST /carritos/bulk) ---
+
+def test_operaciones_en_lote():
+    """
+    Valida el endpoint de operaciones en lote:
+    1. Crea carritos, agrega y sobreescribe productos en una sola petición.
+    2. Las operaciones inválidas (límite de 10 unidades, carrito inexistente,
+       usuario con carrito) fallan de forma individual sin detener el lote.
+    """
+    productos_db.clear()
+    productos_db.append({"id": 1, "nombre": "ProdLote1", "precio": 10.0, "stock": 20})
+    productos_db.append({"id": 2, "nombre": "ProdLote2", "precio": 15.0, "stock": 30})
+    existente = client.post("/carritos", json={"user_id": "user_lote"}).json()
+
+    response = client.post("/carritos/bulk", json=[
+        {"operacion": "agregar", "carrito_id": existente["id"], "items": [{"producto_id": 1, "cantidad": 2}]},
+        {"operacion": "agregar", "carrito_id": existente["id"], "items": [{"producto_id": 1, "cantidad": 3}]},
+        {"operacion": "agregar", "carrito_id": existente["id"], "items": [{"producto_id": 1, "cantidad": 6}]},
+        {"operacion": "crear", "user_id": "user_lote"},
+        {"operacion": "crear", "user_id": "user_lote_2"},
+        {"operacion": "sobreescribir", "carrito_id": "no_existe", "items": [{"producto_id": 2, "cantidad": 1}]},
+        {"operacion": "eliminar", "carrito_id": existente["id"]},
+    ])
+    assert response.status_code == 200
+    resultados = response.json()
+
+    assert [r["status_code"] for r in resultados] == [200, 200, 400, 409, 201, 404, 204]
+    assert resultados[1]["carrito"]["items"] == [{"producto_id": 1, "cantidad": 5}]
+    assert "No puede haber más de 10 unidades" in resultados[2]["detail"]
+    assert carritos_db.get(existente["id"]) is None
+    assert carritos_db.get(resultados[4]["carrito"]["id"]).user_id == "user_lote_2"
+
+def test_operaciones_en_lote_valida_campos_requeridos():
+    """
+    Una operación sin los campos que necesita invalida toda la petición (422).
+    """
+    response = client.post("/carritos/bulk", json=[{"operacion": "agregar", "items": []}])
+    assert response.status_code == 422
+
+
 # --- Tests para el PAGO de carritos (GET /pago/{carrito_id}) ---
 
 def test_stock_decrementa_correctamente_tras_pago():
@@ -259,6 +403,28 @@ def test_sobreescribir_items_con_mas_unidades_que_stock():
     assert put_response.status_code == 409
     assert "stock" in put_response.json()["detail"].lower()
 
+def test_sobreescribir_items_con_mas_unidades_que_stock_sin_reservas():
+    """
+    Con las reservas desactivadas (CARRITO_RESERVAS=0, SQLite o shards), PUT y
+    PATCH siguen rechazando con 409 una cantidad mayor al stock.
+    """
+    codigo = """
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import productos_db
+from app.reservas import reservas
+client = TestClient(app)
+productos_db.append({"id": 30, "nombre": "ProdStockPUT", "precio": 50.0, "stock": 5})
+carrito_id = client.post("/carritos", json={"user_id": "user_put_stock"}).json()["id"]
+print(reservas.activo,
+      client.put(f"/carritos/{carrito_id}", json=[{"producto_id": 30, "cantidad": 8}]).status_code,
+      client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 30, "cantidad": 6}]).status_code,
+      client.put(f"/carritos/{carrito_id}", json=[{"producto_id": 30, "cantidad": 5}]).status_code)
+"""
+    entorno = {**os.environ, "CARRITO_RESERVAS": "0"}
+    salida = subprocess.run([sys.executable, "-c", codigo], capture_output=True, text=True, check=True, env=entorno).stdout
+    assert salida.split() == ["False", "409", "409", "200"]
+
 
 # --- Tests Unitarios para la lógica de INACTIVIDAD ---
 
@@ -286,3 +452,66 @@ def test_carrito_expirado():
     }
     assert carrito_inactivo(carrito_viejo, limite_minutos=1)
 
+
+
+# --- Tests Unitarios para los índices de la tabla de carritos ---
+
+def test_indices_de_carritos_por_id_y_usuario():
+    """
+    Prueba unitaria para 'CartStore'.
+    Verifica que un carrito se encuentra por su ID y por su user_id,
+    que no se puede dar de alta un segundo carrito para el mismo usuario
+    y que al eliminarlo se liberan ambos índices.
+    """
+    carrito = CarritoCompacto("c1", "u1")
+    assert carritos_db.add(carrito)
+    assert carritos_db.get("c1") is carrito
+    assert carritos_db.get_por_usuario("u1") is carrito
+
+    assert not carritos_db.add(CarritoCompacto("c2", "u1"))
+    assert carritos_db.get("c2") is None
+
+    assert carritos_db.remove(carrito)
+    assert not carritos_db.remove(carrito)
+    assert carritos_db.get("c1") is None
+    assert carritos_db.get_por_usuario("u1") is None
+
+
+# --- Tests para el BARREDOR de carritos inactivos ---
+
+def test_barredor_elimina_solo_carritos_inactivos():
+    """
+    Verifica que el barredor elimina los carritos inactivos sin que nadie
+    los consulte, respeta los carritos modificados recientemente y
+    actualiza sus métricas.
+    """
+    hace_5_minutos = time.time() - 300
+    viejo = CarritoCompacto("viejo", "u_viejo", creado_ts=hace_5_minutos)
+    reactivado = CarritoCompacto("reactivado", "u_reactivado", creado_ts=hace_5_minutos)
+    carritos_db.add(viejo)
+    carritos_db.add(reactivado)
+    # El carrito se modifica después de su alta: su entrada vieja en el índice queda obsoleta
+    reactivado.tocar()
+    carritos_db.save(reactivado)
+
+    barredor = CartSweeper(carritos_db, ttl_minutos=1)
+    expirados = barredor.barrer()
+
+    assert [c.id for c in expirados] == ["viejo"]
+    assert carritos_db.get("viejo") is None
+    assert carritos_db.get("reactivado") is reactivado
+    assert barredor.metricas()["carritos_expirados"] == 1
+    assert barredor.metricas()["barridos"] == 1
+
+def test_carrito_inactivo_no_bloquea_nuevo_carrito():
+    """
+    Verifica que un carrito inactivo que todavía no fue barrido
+    no impide al usuario crear un carrito nuevo.
+    """
+    response1 = client.post("/carritos", json={"user_id": "TestAbandonado"})
+    carrito1 = carritos_db.get(response1.json()["id"])
+    carrito1.actualizado_ts -= 300
+
+    response2 = client.post("/carritos", json={"user_id": "TestAbandonado"})
+    assert response2.status_code == 201
+    assert carritos_db.get(carrito1.id) is None
@@ -0,0 +1,97 @@
+# Pruebas del diario de eventos y los snapshots del backend en memoria
+import os
+from app.db.diario import recuperar, ruta_diario
+from app.db.modelos import CarritoCompacto
+
+PRODUCTOS = [{"id": 1, "nombre": "ProdDiario", "precio": 10.0, "stock": 50}]
+
+
+def abrir(tmp_path):
+    return recuperar(str(tmp_path), PRODUCTOS, intervalo_fsync=0.01, intervalo_snapshot=3600)
+
+
+def estado(persistencia):
+    """
+    Estado comparable de ambos almacenes.
+    """
+    productos = sorted((p["id"], p["nombre"], p["precio"], p["stock"]) for p in persistencia.productos)
+    carritos = sorted(
+        (c.id, c.user_id, list(c.items()), c.subtotal_centavos, c.unidades, c.creado_ts, c.actualizado_ts)
+        for c in persistencia.carritos
+    )
+    return productos, carritos
+
+
+def modificar(persistencia, desde, hasta):
+    """
+    Crea carritos, modifica algunos, elimina otros y descuenta stock.
+    """
+    for i in range(desde, hasta):
+        carrito = CarritoCompacto(f"c{i}", f"u{i}")
+        assert persistencia.carritos.add(carrito)
+        carrito.agregar(1, 1 + i % 3, 10.0)
+        persistencia.carritos.save(carrito)
+        if i % 4 == 0:
+            persistencia.carritos.remove(carrito)
+        elif i % 4 == 1:
+            assert persistencia.productos.descontar_stock(dict(carrito.items())) is None
+
+
+def test_estado_se_recupera_desde_el_diario(tmp_path):
+    """
+    Los cambios registrados en el diario se reaplican al reiniciar; los
+    productos iniciales solo se cargan la primera vez.
+    """
+    persistencia = abrir(tmp_path)
+    modificar(persistencia, 0, 20)
+    esperado = estado(persistencia)
+    persistencia.cerrar()
+
+    recuperada = abrir(tmp_path)
+    assert estado(recuperada) == esperado
+    assert len(recuperada.productos) == 1
+    assert recuperada.carritos.get_por_usuario("u1").id == "c1"
+    recuperada.cerrar()
+
+
+def test_snapshot_mas_cola_del_diario(tmp_path):
+    """
+    Tras un snapshot se descartan los diarios viejos y la recuperación
+    combina el snapshot con los eventos posteriores.
+    """
+    persistencia = abrir(tmp_path)
+    modificar(persistencia, 0, 20)
+    segmento = persistencia.tomar_snapshot()
+    assert not os.path.exists(ruta_diario(str(tmp_path), segmento - 1))
+    modificar(persistencia, 20, 40)
+    persistencia.carritos.remove(persistencia.carritos.get("c2"))
+    esperado = estado(persistencia)
+    persistencia.cerrar()
+
+    recuperada = abrir(tmp_path)
+    assert estado(recuperada) == esperado
+    assert recuperada.eventos_reaplicados > 0
+    recuperada.cerrar()
+
+
+def test_registro_cortado_al_final_se_descarta(tmp_path):
+    """
+    Un registro incompleto al final del diario (caída durante la escritura)
+    se ignora y se recorta, sin perder los eventos anteriores ni los nuevos.
+    """
+    persistencia = abrir(tmp_path)
+    modificar(persistencia, 0, 8)
+    esperado = estado(persistencia)
+    persistencia.cerrar()
+    with open(ruta_diario(str(tmp_path), persistencia.diario.segmento), "ab") as archivo:
+        archivo.write(b"\x01\xff\x00\x00")
+
+    recuperada = abrir(tmp_path)
+    assert estado(recuperada) == esperado
+    modificar(recuperada, 8, 10)
+    esperado = estado(recuperada)
+    recuperada.cerrar()
+
+    final = abrir(tmp_path)
+    assert estado(final) == esperado
+    final.cerrar()
@@ -0,0 +1,142 @@
+# Pruebas de los eventos en vivo (SSE y WebSocket)
+import asyncio
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import CartStore, ProductStore, carritos_db, productos_db
+from app.db.modelos import CarritoCompacto
+from app.db.stock_compartido import SharedProductStore, crear_stock_compartido
+from app.eventos import BusEventos, eventos
+from app.expiracion import CartSweeper
+from app.reservas import LibroReservas
+from app.routers.eventos import eventos_sse, stream_sse
+
+client = TestClient(app)
+
+def setup_function():
+    """
+    Limpia carritos y productos antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+
+def recibir_hasta(ws, tipo):
+    """Mensajes recibidos por el WebSocket hasta el primero del tipo indicado, inclusive."""
+    mensajes = []
+    while not mensajes or mensajes[-1]["tipo"] != tipo:
+        mensajes.append(ws.receive_json())
+    return mensajes
+
+def test_websocket_recibe_eventos_de_carrito_y_stock_agrupado(monkeypatch):
+    """
+    Un suscriptor de un producto y un carrito recibe cada actualización del
+    carrito, un único evento de stock para varios cambios seguidos (con el
+    último valor disponible) y el aviso de que el carrito se eliminó.
+    """
+    monkeypatch.setattr(eventos, "ventana_stock", 0.3)
+    productos_db.append({"id": 1, "nombre": "ProdEventos", "precio": 10.0, "stock": 10})
+    carrito_id = client.post("/carritos", json={"user_id": "ana"}).json()["id"]
+
+    with client.websocket_connect(f"/eventos/ws?productos=1&carritos={carrito_id}") as ws:
+        for _ in range(3):
+            assert client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 1}]).status_code == 200
+
+        mensajes = recibir_hasta(ws, "stock")
+        assert mensajes[-1] == {"tipo": "stock", "producto_id": 1, "stock": 7}
+        actualizaciones = mensajes[:-1]
+        assert actualizaciones and all(m["tipo"] == "carrito_actualizado" for m in actualizaciones)
+        assert actualizaciones[-1]["carrito"]["items"] == [{"producto_id": 1, "cantidad": 3}]
+
+        assert client.delete(f"/carritos/{carrito_id}").status_code == 204
+        assert recibir_hasta(ws, "stock")[-2:] == [
+            {"tipo": "carrito_eliminado", "carrito_id": carrito_id},
+            {"tipo": "stock", "producto_id": 1, "stock": 10},
+        ]
+    assert len(eventos) == 0
+
+def test_miles_de_suscriptores_sse_en_un_loop():
+    """
+    Miles de suscriptores inactivos en un mismo loop: un cambio de stock se
+    reparte una vez a cada uno con formato SSE, un carrito expirado solo le
+    llega a quien lo sigue, y un suscriptor que no lee se corta al desbordarse.
+    """
+    productos = ProductStore([{"id": 1, "nombre": "ProdA", "precio": 1.0, "stock": 5}])
+    reservas = LibroReservas(productos)
+    bus = BusEventos(productos, reservas, ventana_stock_ms=10, maximo_pendientes=2)
+
+    async def probar():
+        streams = [stream_sse([1], (), bus, keepalive=60) for _ in range(2000)]
+        primeros = [asyncio.ensure_future(anext(stream)) for stream in streams]
+        await asyncio.sleep(0.01)
+        assert len(bus) == 2000 and not any(f.done() for f in primeros)
+
+        assert reservas.reservar("c1", {1: 2}) is None
+        for _ in range(50):
+            bus.stock_cambiado([1])
+        chunks = await asyncio.gather(*primeros)
+        assert set(chunks) == {b'event: stock\ndata: {"tipo": "stock", "producto_id": 1, "stock": 3}\n\n'}
+
+        # Un carrito que expira en el barredor avisa solo a su suscriptor
+        carritos = CartStore()
+        barredor = CartSweeper(carritos, ttl_minutos=-1)
+        barredor.al_expirar(bus.carritos_expirados)
+        carritos.add(CarritoCompacto("c-exp", "beto"))
+        seguidor = bus.suscribir((), ["c-exp"])
+        barredor.barrer()
+        assert [tipo for tipo, _ in await seguidor.siguientes(1)] == ["carrito_expirado"]
+
+        # Sin leer, los eventos de claves distintas desbordan al suscriptor
+        lento = bus.suscribir((), ["x", "y", "z"])
+        for carrito_id in ("x", "y", "z"):
+            bus.carrito_quitado(CarritoCompacto(carrito_id, "u"))
+        assert lento.desbordado
+
+        for stream in streams:
+            await stream.aclose()
+        bus.desuscribir(seguidor)
+        bus.desuscribir(lento)
+        assert len(bus) == 0
+
+    asyncio.run(probar())
+
+def test_eventos_sse_valida_los_filtros():
+    """
+    Un filtro de productos con IDs no numéricos responde 400 sin suscribir.
+    """
+    assert client.get("/eventos", params={"productos": "1,a"}).status_code == 400
+    assert len(eventos) == 0
+
+def test_respuesta_sse_sin_recorrer_no_deja_suscripciones():
+    """
+    Si el cliente se va antes de que la respuesta empiece a enviarse, el
+    stream nunca se recorre y no queda ningún suscriptor en el bus.
+    """
+    async def probar():
+        respuesta = await eventos_sse(productos="1", carritos=None)
+        assert len(eventos) == 0
+        await respuesta.body_iterator.aclose()
+        assert len(eventos) == 0
+
+    asyncio.run(probar())
+
+def test_stock_de_otro_shard_llega_a_los_suscriptores(tmp_path):
+    """
+    En modo shards, un pago en otro proceso cambia el stock compartido: el
+    repartidor lo detecta por la versión y publica solo los productos que cambiaron.
+    """
+    catalogo = [{"id": 1, "nombre": "ProdA", "precio": 1.0, "stock": 10}, {"id": 2, "nombre": "ProdB", "precio": 1.0, "stock": 5}]
+    ruta = str(tmp_path / "stock")
+    crear_stock_compartido(ruta, catalogo)
+    shard_0, shard_1 = SharedProductStore(ruta, catalogo), SharedProductStore(ruta, catalogo)
+    bus = BusEventos(shard_0, LibroReservas(shard_0), ventana_stock_ms=10, sondeo_stock_ms=10)
+
+    async def probar():
+        suscriptor = bus.suscribir()
+        await asyncio.sleep(0.05)
+        assert await suscriptor.siguientes(0.05) == []
+
+        assert shard_1.descontar_stock({1: 3}) is None
+        eventos_recibidos = await suscriptor.siguientes(1)
+        assert eventos_recibidos == [("stock", b'{"tipo": "stock", "producto_id": 1, "stock": 7}')]
+        bus.desuscribir(suscriptor)
+
+    asyncio.run(probar())
@@ -0,0 +1,48 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import carritos_db, productos_db
+
+client = TestClient(app)
+
+def setup_function():
+    """
+    Limpia carritos y productos antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+
+def valor_metrica(texto, serie):
+    """
+    Devuelve el valor de una serie (nombre + etiquetas) en el texto de /metrics.
+    """
+    for linea in texto.splitlines():
+        if linea.startswith(serie + " "):
+            return float(linea.rsplit(" ", 1)[1])
+    return None
+
+def test_metricas_http_y_de_negocio():
+    """
+    Verifica que /metrics expone las peticiones por ruta (con la plantilla
+    de la ruta, no el ID), el histograma de latencia, los carritos activos,
+    los pagos y el stock por producto.
+    """
+    productos_db.append({"id": 7, "nombre": "ProdMetricas", "precio": 10.0, "stock": 3})
+    antes = client.get("/metrics").text
+    pagos_antes = valor_metrica(antes, 'pagos_total{resultado="exitoso"}') or 0
+    gets_antes = valor_metrica(antes, 'http_peticiones_total{ruta="/carritos/{carrito_id}",metodo="GET",status="200"}') or 0
+
+    carrito_id = client.post("/carritos", json={"user_id": "user_metricas"}).json()["id"]
+    client.get(f"/carritos/{carrito_id}")
+    client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 7, "cantidad": 2}])
+    assert valor_metrica(client.get("/metrics").text, "carritos_activos") == 1
+    client.get(f"/pago/{carrito_id}/")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    texto = response.text
+    assert valor_metrica(texto, 'http_peticiones_total{ruta="/carritos/{carrito_id}",metodo="GET",status="200"}') == gets_antes + 1
+    assert valor_metrica(texto, 'http_latencia_segundos_bucket{ruta="/carritos",metodo="POST",le="+Inf"}') >= 1
+    assert valor_metrica(texto, 'pagos_total{resultado="exitoso"}') == pagos_antes + 1
+    assert valor_metrica(texto, "carritos_activos") == 0
+    assert valor_metrica(texto, 'producto_stock{producto_id="7"}') == 1
@@ -0,0 +1,174 @@
+# Pruebas de estrés para el PAGO concurrente de carritos
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import ProductStore, carritos_db, productos_db
+from app.idempotencia import ResultadosIdempotentes, resultados_pago
+from app.lotes_pago import LotesDescuento
+
+client = TestClient(app)
+
+def setup_function():
+    """
+    Limpia carritos y productos antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+    resultados_pago.clear()
+
+def crear_carrito_con_items(user_id, items):
+    carrito_id = client.post("/carritos", json={"user_id": user_id}).json()["id"]
+    assert client.patch(f"/carritos/{carrito_id}", json=items).status_code == 200
+    return carrito_id
+
+def pagar_en_paralelo(carrito_ids, hilos=50):
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        return list(executor.map(lambda carrito_id: client.get(f"/pago/{carrito_id}/").status_code, carrito_ids))
+
+def test_pagos_concurrentes_no_dejan_stock_negativo():
+    """
+    Lanza cientos de pagos en paralelo que compiten por las últimas unidades.
+    Verifica que se venden exactamente las unidades disponibles, que el
+    resto de los pagos falla con 409 y que el stock nunca queda negativo.
+    Las reservas evitan esta competencia, así que el stock se corrige a la
+    baja después de llenar los carritos (por ejemplo, mercadería dañada).
+    """
+    productos_db.append({"id": 1, "nombre": "ProdEscaso", "precio": 10.0, "stock": 300})
+    carrito_ids = [crear_carrito_con_items(f"comprador_{i}", [{"producto_id": 1, "cantidad": 1}]) for i in range(300)]
+    productos_db.append({"id": 1, "nombre": "ProdEscaso", "precio": 10.0, "stock": 50})
+
+    resultados = pagar_en_paralelo(carrito_ids)
+
+    assert resultados.count(200) == 50
+    assert resultados.count(409) == 250
+    assert productos_db.get(1)["stock"] == 0
+
+def test_pago_multiproducto_es_todo_o_nada():
+    """
+    Carritos con dos productos, uno de ellos escaso. Si el pago falla por
+    el producto escaso, el otro producto no debe descontarse.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdAbundante", "precio": 5.0, "stock": 1000})
+    productos_db.append({"id": 2, "nombre": "ProdEscaso", "precio": 10.0, "stock": 200})
+    items = [{"producto_id": 1, "cantidad": 2}, {"producto_id": 2, "cantidad": 1}]
+    carrito_ids = [crear_carrito_con_items(f"comprador_{i}", items) for i in range(200)]
+    productos_db.append({"id": 2, "nombre": "ProdEscaso", "precio": 10.0, "stock": 20})
+
+    resultados = pagar_en_paralelo(carrito_ids)
+
+    assert resultados.count(200) == 20
+    assert productos_db.get(2)["stock"] == 0
+    assert productos_db.get(1)["stock"] == 1000 - 2 * 20
+
+def test_mismo_carrito_se_paga_una_sola_vez():
+    """
+    Muchos pagos simultáneos del MISMO carrito: solo uno debe procesarse.
+    """
+    productos_db.append({"id": 1, "nombre": "Prod", "precio": 10.0, "stock": 100})
+    carrito_id = crear_carrito_con_items("comprador", [{"producto_id": 1, "cantidad": 3}])
+
+    resultados = pagar_en_paralelo([carrito_id] * 100)
+
+    assert resultados.count(200) == 1
+    assert productos_db.get(1)["stock"] == 97
+
+def test_pago_idempotente_repite_el_resultado_sin_tocar_stock():
+    """
+    Un reintento con la misma Idempotency-Key devuelve el mismo número de
+    seguimiento aunque el carrito ya no exista, sin descontar stock otra vez.
+    La clave no puede reutilizarse para otro carrito.
+    """
+    productos_db.append({"id": 1, "nombre": "Prod", "precio": 10.0, "stock": 100})
+    carrito_id = crear_carrito_con_items("comprador", [{"producto_id": 1, "cantidad": 3}])
+    headers = {"Idempotency-Key": "clave-1"}
+
+    primera = client.post(f"/pago/{carrito_id}", headers=headers)
+    reintento = client.post(f"/pago/{carrito_id}", headers=headers)
+
+    assert primera.status_code == reintento.status_code == 200
+    assert reintento.json() == primera.json()
+    assert reintento.headers["Idempotent-Replayed"] == "true"
+    assert productos_db.get(1)["stock"] == 97
+
+    otro_carrito = crear_carrito_con_items("otro_comprador", [{"producto_id": 1, "cantidad": 1}])
+    assert client.post(f"/pago/{otro_carrito}", headers=headers).status_code == 409
+
+def test_pagos_duplicados_simultaneos_se_ejecutan_una_vez():
+    """
+    Muchas peticiones simultáneas con la misma Idempotency-Key: todas reciben
+    el mismo resultado exitoso y el stock se descuenta una sola vez.
+    """
+    productos_db.append({"id": 1, "nombre": "Prod", "precio": 10.0, "stock": 100})
+    carrito_id = crear_carrito_con_items("comprador", [{"producto_id": 1, "cantidad": 3}])
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        respuestas = list(executor.map(
+            lambda _: client.post(f"/pago/{carrito_id}", headers={"Idempotency-Key": "clave-dup"}),
+            range(100),
+        ))
+
+    assert all(r.status_code == 200 for r in respuestas)
+    assert len({r.json()["numero_seguimiento"] for r in respuestas}) == 1
+    assert productos_db.get(1)["stock"] == 97
+
+def test_resultados_idempotentes_lru_y_vencimiento():
+    """
+    La cache descarta el resultado usado hace más tiempo al superar su
+    capacidad y no devuelve resultados vencidos.
+    """
+    cache = ResultadosIdempotentes(capacidad=2, ttl_segundos=60)
+    cache.guardar("a", "c1", 1)
+    cache.guardar("b", "c2", 2)
+    assert cache.obtener("a") == ("c1", 1)  # "a" pasa a ser la más reciente
+    cache.guardar("c", "c3", 3)
+    assert cache.obtener("b") is None
+    assert len(cache) == 2
+
+    vencida = ResultadosIdempotentes(capacidad=2, ttl_segundos=0)
+    vencida.guardar("a", "c1", 1)
+    assert vencida.obtener("a") is None
+
+def test_lotes_de_descuento_respetan_orden_de_llegada():
+    """
+    Los descuentos simultáneos se aplican en un mismo lote y en orden de
+    llegada: el primero que pide stock lo obtiene, y un carrito al que le
+    falta un producto no descuenta ninguno.
+    """
+    lotes = []
+
+    class ProductStoreRegistrado(ProductStore):
+        def descontar_stock_lote(self, lista_cantidades):
+            lotes.append(len(lista_cantidades))
+            return super().descontar_stock_lote(lista_cantidades)
+
+    productos = ProductStoreRegistrado([
+        {"id": 1, "nombre": "ProdOferta", "precio": 1.0, "stock": 6},
+        {"id": 2, "nombre": "ProdAgotado", "precio": 1.0, "stock": 0},
+    ])
+    pipeline = LotesDescuento(productos, ventana_ms=50, maximo=100)
+
+    async def pagar_todos():
+        return await asyncio.gather(*(pipeline.descontar(c) for c in [{1: 1}, {1: 3}, {1: 3}, {1: 1, 2: 1}, {1: 2}]))
+
+    resultados = asyncio.run(pagar_todos())
+    # El primer pago no tiene competencia y se aplica solo; el resto forma un lote
+    assert lotes == [1, 4]
+    assert [r and r["id"] for r in resultados] == [None, None, 1, 2, None]
+    assert productos.get(1)["stock"] == 0
+
+def test_lote_completo_se_aplica_sin_esperar_la_ventana():
+    """
+    Al reunir el máximo de pagos el lote se aplica sin esperar la ventana.
+    """
+    productos = ProductStore([{"id": 1, "nombre": "ProdOferta", "precio": 1.0, "stock": 10}])
+    pipeline = LotesDescuento(productos, ventana_ms=60_000, maximo=3)
+
+    async def pagar_todos():
+        return await asyncio.gather(*(pipeline.descontar({1: 1}) for _ in range(7)))
+
+    assert asyncio.run(asyncio.wait_for(pagar_todos(), timeout=5)) == [None] * 7
+    assert productos.get(1)["stock"] == 3
+
+    # Sin ventana configurada, el backend en memoria descuenta sin agrupar
+    assert LotesDescuento(ProductStore(), ventana_ms=None).ventana == 0
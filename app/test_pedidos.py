@@ -0,0 +1,100 @@
+# Pruebas del historial de pedidos
+from datetime import datetime, timezone
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import OrderStore, carritos_db, pedidos_db, productos_db
+from app.db.diario import recuperar
+from app.db.modelos import Pedido
+from app.db.sqlite import SQLiteOrderStore, SQLitePool
+
+client = TestClient(app)
+
+def setup_function():
+    """
+    Limpia carritos, productos y pedidos antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+    pedidos_db.clear()
+
+def pagar(user_id, items):
+    carrito_id = client.post("/carritos", json={"user_id": user_id}).json()["id"]
+    assert client.patch(f"/carritos/{carrito_id}", json=items).status_code == 200
+    respuesta = client.get(f"/pago/{carrito_id}/")
+    assert respuesta.status_code == 200
+    return carrito_id, respuesta.json()["numero_seguimiento"]
+
+def test_pago_registra_el_pedido_y_el_historial_se_pagina():
+    """
+    Cada pago queda registrado con sus items, precios y total; el historial del
+    usuario se recorre del más nuevo al más viejo con el cursor.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdPedido", "precio": 10.5, "stock": 20})
+    productos_db.append({"id": 2, "nombre": "OtroPedido", "precio": 3.0, "stock": 20})
+    carrito_id, numero = pagar("ana", [{"producto_id": 1, "cantidad": 2}, {"producto_id": 2, "cantidad": 1}])
+
+    pedido = client.get(f"/pedidos/{numero}").json()
+    assert pedido["carrito_id"] == carrito_id and pedido["user_id"] == "ana"
+    assert pedido["items"] == [
+        {"producto_id": 1, "cantidad": 2, "precio": 10.5},
+        {"producto_id": 2, "cantidad": 1, "precio": 3.0},
+    ]
+    assert pedido["total"] == 24.0
+    assert client.get("/pedidos/PEDIDO-NOEXISTE").status_code == 404
+
+    numeros = [numero] + [pagar("ana", [{"producto_id": 2, "cantidad": 1}])[1] for _ in range(2)]
+    pagar("beto", [{"producto_id": 2, "cantidad": 1}])
+    primera = client.get("/usuarios/ana/pedidos", params={"limit": 2}).json()
+    assert [p["numero_seguimiento"] for p in primera["items"]] == numeros[:0:-1]
+    segunda = client.get("/usuarios/ana/pedidos", params={"limit": 2, "cursor": primera["siguiente_cursor"]}).json()
+    assert [p["numero_seguimiento"] for p in segunda["items"]] == [numeros[0]]
+    assert segunda["siguiente_cursor"] is None
+
+    # Un cursor que no es un pedido del usuario no es válido
+    assert client.get("/usuarios/beto/pedidos", params={"cursor": numero}).status_code == 400
+    assert client.get("/usuarios/nadie/pedidos").json() == {"items": [], "siguiente_cursor": None}
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def almacen(request, tmp_path):
+    if request.param == "memoria":
+        return OrderStore()
+    return SQLiteOrderStore(SQLitePool(str(tmp_path / "pedidos.db")))
+
+def test_historial_por_rango_de_fechas(almacen):
+    """
+    Ambos backends filtran por fecha de pago (desde inclusive, hasta exclusive),
+    paginan dentro del rango y ordenan bien un pedido que llega con fecha anterior.
+    """
+    for dia in (1, 2, 3, 5, 6):
+        creado = datetime(2024, 1, dia, tzinfo=timezone.utc).timestamp()
+        assert almacen.add(Pedido(f"PEDIDO-{dia}", "ana", f"c{dia}", [(1, dia, 100)], creado_ts=creado))
+    # Llega despues pero se pago antes que el ultimo
+    assert almacen.add(Pedido("PEDIDO-4", "ana", "c4", [(1, 4, 100)], creado_ts=datetime(2024, 1, 4, tzinfo=timezone.utc).timestamp()))
+    assert not almacen.add(Pedido("PEDIDO-4", "beto", "c9"))
+    assert almacen.get("PEDIDO-4").total_centavos == 400 and len(almacen) == 6
+
+    desde, hasta = datetime(2024, 1, 2, tzinfo=timezone.utc), datetime(2024, 1, 6, tzinfo=timezone.utc)
+    pagina, cursor = almacen.por_usuario("ana", limite=2, desde=desde, hasta=hasta)
+    assert [p.numero for p in pagina] == ["PEDIDO-5", "PEDIDO-4"] and cursor == "PEDIDO-4"
+    pagina, cursor = almacen.por_usuario("ana", cursor, limite=2, desde=desde, hasta=hasta)
+    assert [p.numero for p in pagina] == ["PEDIDO-3", "PEDIDO-2"] and cursor is None
+    assert [p.numero for p in almacen.por_usuario("ana", limite=10)[0]] == [f"PEDIDO-{dia}" for dia in range(6, 0, -1)]
+    with pytest.raises(ValueError):
+        almacen.por_usuario("beto", "PEDIDO-4")
+
+def test_pedidos_se_recuperan_desde_el_diario_y_el_snapshot(tmp_path):
+    """
+    Los pedidos registrados antes y después de un snapshot se recuperan al reiniciar.
+    """
+    persistencia = recuperar(str(tmp_path), intervalo_fsync=0.01, intervalo_snapshot=3600)
+    persistencia.pedidos.add(Pedido("PEDIDO-A", "ana", "c1", [(1, 2, 1050), (3, 1, 99)]))
+    persistencia.tomar_snapshot()
+    persistencia.pedidos.add(Pedido("PEDIDO-B", "ana", "c2", [(2, 1, 300)]))
+    esperado = [p.a_dict() for p in persistencia.pedidos.por_usuario("ana")[0]]
+    persistencia.cerrar()
+
+    recuperada = recuperar(str(tmp_path), intervalo_fsync=0.01, intervalo_snapshot=3600)
+    assert [p.a_dict() for p in recuperada.pedidos.por_usuario("ana")[0]] == esperado
+    assert recuperada.pedidos.get("PEDIDO-A").total_centavos == 2199
+    recuperada.cerrar()
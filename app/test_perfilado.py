@@ -0,0 +1,114 @@
+# Pruebas de las trazas por fase y del perfilador por muestreo
+import asyncio
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import carritos_db, productos_db
+from app.perfilado import RegistroLentas, Traza, TrazasMiddleware, marcar, registro_lentas
+
+TOKEN = "token-de-prueba"
+client = TestClient(app, headers={"X-Admin-Token": TOKEN})
+
+@pytest.fixture(autouse=True)
+def token_admin(monkeypatch):
+    monkeypatch.setattr("app.routers.debug.ADMIN_TOKEN", TOKEN)
+
+def setup_function():
+    """
+    Limpia carritos, productos y el registro de peticiones lentas antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+    registro_lentas.clear()
+
+def teardown_function():
+    registro_lentas.configurar(False)
+
+def test_peticiones_lentas_con_desglose_por_fase():
+    """
+    Con las trazas activas y umbral 0, cada petición queda en /debug/slow
+    con el tiempo de cada fase; con un umbral alto no se registra ninguna.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdTraza", "precio": 10.0, "stock": 10})
+    carrito_id = client.post("/carritos", json={"user_id": "ana"}).json()["id"]
+    assert client.get("/debug/slow").json()["peticiones"] == []
+
+    assert client.put("/debug/trazas", json={"activo": True, "umbral_ms": 0}).json()["activo"] is True
+    assert client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 2}]).status_code == 200
+
+    lentas = client.get("/debug/slow", params={"limit": 5}).json()
+    peticion = lentas["peticiones"][0]
+    assert (peticion["ruta"], peticion["metodo"], peticion["status"]) == ("/carritos/{carrito_id}", "PATCH", 200)
+    assert list(peticion["fases_ms"]) == ["validacion", "busqueda", "mutacion", "serializacion", "envio"]
+    assert abs(sum(peticion["fases_ms"].values()) - peticion["duracion_ms"]) < 0.1
+
+    client.put("/debug/trazas", json={"activo": True, "umbral_ms": 60_000})
+    client.get(f"/carritos/{carrito_id}")
+    assert client.get("/debug/slow").json()["lentas_total"] == lentas["lentas_total"]
+
+def test_marcar_sin_trazas_no_hace_nada():
+    """
+    Fuera de una petición trazada, marcar una fase no registra nada; una
+    traza suma las fases que se marcan más de una vez.
+    """
+    marcar("busqueda")
+    traza = Traza()
+    traza.marcar("busqueda")
+    traza.marcar("mutacion")
+    traza.marcar("busqueda")
+    assert list(traza.desglose()) == ["busqueda", "mutacion"]
+
+def test_streams_de_eventos_no_se_trazan():
+    """
+    Un stream SSE dura lo que la conexión: no se traza, para que no llene el
+    registro de peticiones lentas y desplace a las que sí lo son.
+    """
+    registro = RegistroLentas(activo=True, umbral_ms=0)
+
+    async def aplicacion(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def enviar(mensaje):
+        pass
+
+    middleware = TrazasMiddleware(aplicacion, registro)
+    for path in ("/eventos", "/carritos", "/debug/slow"):
+        asyncio.run(middleware({"type": "http", "path": path, "method": "GET"}, None, enviar))
+    assert [peticion["path"] for peticion in registro.ultimas()] == ["/carritos"]
+
+def test_rutas_de_debug_exigen_el_token(monkeypatch):
+    """
+    /debug responde 403 sin la cabecera X-Admin-Token correcta, y 404 si no se
+    configuró CARRITO_ADMIN_TOKEN, aunque se envíe una cabecera.
+    """
+    sin_token = TestClient(app)
+    assert sin_token.get("/debug/slow").status_code == 403
+    assert sin_token.get("/debug/slow", headers={"X-Admin-Token": "otro"}).status_code == 403
+    assert sin_token.get("/debug/slow", headers={"X-Admin-Token": TOKEN}).status_code == 200
+
+    monkeypatch.setattr("app.routers.debug.ADMIN_TOKEN", "")
+    assert sin_token.get("/debug/slow", headers={"X-Admin-Token": ""}).status_code == 404
+    assert sin_token.put("/debug/perfilador", json={"activo": True}).status_code == 404
+
+def trabajo_pesado(hasta):
+    while time.perf_counter() < hasta:
+        sum(range(1000))
+
+def test_perfilador_por_muestreo_se_enciende_en_tiempo_de_ejecucion():
+    """
+    El perfilador se enciende y apaga desde /debug/perfilador (con al menos 1 ms
+    entre muestras), y sus muestras muestran la función que ocupó la CPU.
+    """
+    assert client.put("/debug/perfilador", json={"activo": True, "intervalo_ms": 0.1}).status_code == 422
+    assert client.put("/debug/perfilador", json={"activo": True, "intervalo_ms": 1}).json()["activo"] is True
+    hilo = threading.Thread(target=trabajo_pesado, args=(time.perf_counter() + 0.3,))
+    hilo.start()
+    hilo.join()
+    assert client.put("/debug/perfilador", json={"activo": False}).json()["activo"] is False
+
+    informe = client.get("/debug/perfilador").json()
+    assert informe["muestras"] > 0
+    assert any(p["pila"].endswith("test_perfilado.py:trabajo_pesado") for p in informe["pilas"])
@@ -1,6 +1,6 @@
 from fastapi.testclient import TestClient
 from app.main import app
-from app.db.database import productos_db
+from app.db.database import carritos_db, productos_db
 
 
 client = TestClient(app)
@@ -11,7 +11,9 @@ def setup_function():
     Se ejecuta antes de cada función de test en este archivo.
     Limpia la base de datos de productos para asegurar que cada test 
     comience en un estado limpio y no interfiera con otros.
+    También elimina los carritos, que reservan stock de los productos.
     """
+    carritos_db.clear()
     productos_db.clear()
 
 #GET
@@ -21,4 +23,64 @@ def test_get_productos():
     """
     response = client.get("/productos")
     assert response.status_code == 200
-    assert len(response.json()) == len(productos_db)
\ No newline at end of file
+    assert len(response.json()) == len(productos_db)
+
+def test_get_productos_etag_y_304():
+    """
+    Verifica que el catálogo se devuelve con un ETag, que un If-None-Match
+    con ese ETag responde 304 sin cuerpo y que el ETag cambia cuando
+    cambia el stock.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdCache", "precio": 10.0, "stock": 5})
+    response = client.get("/productos")
+    etag = response.headers["etag"]
+    assert response.json() == [{"id": 1, "nombre": "ProdCache", "precio": 10.0, "stock": 5}]
+
+    no_modificado = client.get("/productos", headers={"If-None-Match": etag})
+    assert no_modificado.status_code == 304
+    assert no_modificado.content == b""
+
+    productos_db.descontar_stock({1: 2})
+    actualizado = client.get("/productos", headers={"If-None-Match": etag})
+    assert actualizado.status_code == 200
+    assert actualizado.headers["etag"] != etag
+    assert actualizado.json()[0]["stock"] == 3
+
+def test_get_producto_por_id():
+    """
+    Verifica GET /productos/{id}: devuelve el producto o 404 si no existe.
+    """
+    productos_db.append({"id": 7, "nombre": "ProdUno", "precio": 3.5, "stock": 2})
+    assert client.get("/productos/7").json() == {"id": 7, "nombre": "ProdUno", "precio": 3.5, "stock": 2}
+    assert client.get("/productos/8").status_code == 404
+
+def test_buscar_productos_con_filtros():
+    """
+    Verifica la búsqueda por IDs, por texto del nombre (subcadena o prefijo
+    corto, sin distinguir mayúsculas ni acentos), por rango de precios y
+    stock, y el orden por precio.
+    """
+    productos_db.append({"id": 1, "nombre": "Teclado Mecánico RGB", "precio": 89.99, "stock": 30})
+    productos_db.append({"id": 2, "nombre": "Mouse Inalámbrico", "precio": 25.00, "stock": 0})
+    productos_db.append({"id": 3, "nombre": "Monitor 4K 27\"", "precio": 350.00, "stock": 20})
+    productos_db.append({"id": 4, "nombre": "Mousepad XL", "precio": 15.00, "stock": 5})
+
+    def ids(**params):
+        response = client.get("/productos", params=params)
+        assert response.status_code == 200
+        return [p["id"] for p in response.json()]
+
+    assert ids(ids="3,1,99") == [1, 3]
+    assert ids(q="MECANICO") == [1]
+    assert ids(q="ouse") == [2, 4]
+    assert ids(q="4k") == [3]
+    assert ids(min_precio=20, max_precio=100) == [1, 2]
+    assert ids(q="mouse", en_stock="true") == [4]
+    assert ids(orden="precio") == [4, 2, 1, 3]
+    assert ids(orden="-precio", limit=2) == [3, 1]
+    assert ids(max_precio=30, orden="-precio") == [2, 4]
+    assert client.get("/productos", params={"ids": "a,b"}).status_code == 400
+
+    # El stock se lee en cada búsqueda: un pago se refleja sin reconstruir los índices
+    productos_db.descontar_stock({4: 5})
+    assert ids(q="mouse", en_stock="true") == []
@@ -0,0 +1,160 @@
+# Pruebas de las reservas de stock de los carritos
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from app.main import app
+from app.db.database import ProductStore, carritos_db, productos_db
+from app.expiracion import CartSweeper
+from app.reservas import LibroReservas, reservas
+
+client = TestClient(app)
+
+def setup_function():
+    """
+    Limpia carritos y productos antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+
+def crear_carrito(user_id):
+    return client.post("/carritos", json={"user_id": user_id}).json()["id"]
+
+def stock_publicado(producto_id):
+    return next(p["stock"] for p in client.get("/productos").json() if p["id"] == producto_id)
+
+def test_patch_y_put_reservan_y_el_catalogo_muestra_lo_disponible():
+    """
+    Las unidades agregadas con PATCH o PUT se descuentan del stock disponible
+    que publica GET /productos (con un ETag nuevo), sin tocar el stock real.
+    Sin stock disponible, PATCH y PUT responden 409.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdReserva", "precio": 10.0, "stock": 10})
+    etag = client.get("/productos").headers["etag"]
+    carrito_a, carrito_b = crear_carrito("ana"), crear_carrito("beto")
+
+    assert client.patch(f"/carritos/{carrito_a}", json=[{"producto_id": 1, "cantidad": 6}]).status_code == 200
+    respuesta = client.get("/productos")
+    assert respuesta.headers["etag"] != etag
+    assert stock_publicado(1) == 4
+    assert client.get("/productos/1").json()["stock"] == 4
+    assert client.get("/productos", params={"q": "reserva"}).json()[0]["stock"] == 4
+    assert productos_db.get(1)["stock"] == 10
+
+    rechazada = client.patch(f"/carritos/{carrito_b}", json=[{"producto_id": 1, "cantidad": 5}])
+    assert rechazada.status_code == 409
+    assert "Stock disponible: 4" in rechazada.json()["detail"]
+    assert client.put(f"/carritos/{carrito_b}", json=[{"producto_id": 1, "cantidad": 4}]).status_code == 200
+    assert client.get("/productos", params={"en_stock": True}).json() == []
+
+    # PUT reemplaza la reserva del carrito: bajar la cantidad libera unidades
+    assert client.put(f"/carritos/{carrito_a}", json=[{"producto_id": 1, "cantidad": 2}]).status_code == 200
+    assert stock_publicado(1) == 4
+
+def test_eliminar_expirar_y_pagar_liberan_la_reserva():
+    """
+    La reserva se libera al eliminar el carrito o al expirar, y al pagar se
+    confirma: el stock real baja y lo reservado vuelve a cero.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdReserva", "precio": 10.0, "stock": 10})
+    carritos = [crear_carrito(f"usuario_{i}") for i in range(3)]
+    for carrito_id in carritos:
+        assert client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 3}]).status_code == 200
+    assert reservas.reservado(1) == 9
+
+    assert client.delete(f"/carritos/{carritos[0]}").status_code == 204
+    assert reservas.reservado(1) == 6
+
+    inactivo = carritos_db.get(carritos[1])
+    inactivo.actualizado_ts = time.time() - 300
+    carritos_db.save(inactivo)
+    assert CartSweeper(carritos_db, ttl_minutos=1).barrer() == [inactivo]
+    assert reservas.reservado(1) == 3
+
+    assert client.get(f"/pago/{carritos[2]}/").status_code == 200
+    assert reservas.reservado(1) == 0
+    assert stock_publicado(1) == productos_db.get(1)["stock"] == 7
+
+def test_reservas_concurrentes_no_superan_el_stock():
+    """
+    Cientos de carritos agregan la última unidad a la vez: solo tantos como
+    unidades hay la reservan, y todos ellos pueden pagar.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdEscaso", "precio": 10.0, "stock": 50})
+    carritos = [crear_carrito(f"comprador_{i}") for i in range(300)]
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        codigos = list(executor.map(
+            lambda carrito_id: client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 1}]).status_code,
+            carritos,
+        ))
+    assert codigos.count(200) == 50
+    assert codigos.count(409) == 250
+
+    con_reserva = [carrito_id for carrito_id, codigo in zip(carritos, codigos) if codigo == 200]
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        pagos = list(executor.map(lambda carrito_id: client.get(f"/pago/{carrito_id}/").status_code, con_reserva))
+    assert pagos == [200] * 50
+    assert productos_db.get(1)["stock"] == 0
+
+def test_libro_de_reservas_todo_o_nada():
+    """
+    Una reserva que no alcanza para algún producto no modifica ninguna, y la
+    reserva separada para un pago fallido vuelve al carrito.
+    """
+    productos = ProductStore([
+        {"id": 1, "nombre": "ProdA", "precio": 1.0, "stock": 5},
+        {"id": 2, "nombre": "ProdB", "precio": 1.0, "stock": 1},
+    ])
+    libro = LibroReservas(productos)
+    assert libro.reservar("c1", {1: 2, 2: 1}) is None
+    producto, disponible = libro.reservar("c2", {1: 1, 2: 1})
+    assert (producto["id"], disponible) == (2, 0)
+    assert (libro.reservado(1), libro.reservado(2)) == (2, 1)
+
+    reserva = libro.tomar("c1")
+    assert libro.reservado(1) == 2
+    libro.devolver("c1", reserva)
+    assert libro.reservar("c1", {1: 5}, reemplazar=True) is None
+    assert (libro.reservado(1), libro.reservado(2)) == (5, 0)
+
+def test_con_sqlite_las_reservas_se_desactivan(tmp_path):
+    """
+    Con SQLite varios workers comparten los carritos: un carrito que elimina otro
+    worker no deja unidades reservadas en este, porque las reservas no se llevan.
+    """
+    codigo = """
+import sqlite3, sys
+from fastapi.testclient import TestClient
+from app.main import app
+from app.reservas import reservas
+client = TestClient(app)
+carrito_id = client.post("/carritos", json={"user_id": "ana"}).json()["id"]
+assert client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 10}]).status_code == 200
+# Otro worker elimina el carrito directamente en la base
+sqlite3.connect(sys.argv[1]).execute("DELETE FROM carritos WHERE id = ?", (carrito_id,)).connection.commit()
+otro_id = client.post("/carritos", json={"user_id": "beto"}).json()["id"]
+print(reservas.activo, client.get("/productos/1").json()["stock"],
+      client.patch(f"/carritos/{otro_id}", json=[{"producto_id": 1, "cantidad": 10}]).status_code)
+"""
+    ruta = str(tmp_path / "s.db")
+    entorno = {**os.environ, "CARRITO_BACKEND": "sqlite", "CARRITO_SQLITE_PATH": ruta}
+    salida = subprocess.run([sys.executable, "-c", codigo, ruta], capture_output=True, text=True, check=True, env=entorno).stdout
+    assert salida.split() == ["False", "15", "200"]
+
+def test_cantidades_no_positivas_se_rechazan():
+    """
+    Un PATCH o PUT con cantidad negativa o cero responde 422 y no toca las
+    reservas: no puede descontar unidades reservadas por otro carrito.
+    """
+    productos_db.append({"id": 1, "nombre": "ProdNegativo", "precio": 10.0, "stock": 15})
+    carrito_a, carrito_b = crear_carrito("ana"), crear_carrito("beto")
+    assert client.patch(f"/carritos/{carrito_a}", json=[{"producto_id": 1, "cantidad": 10}]).status_code == 200
+
+    assert client.patch(f"/carritos/{carrito_b}", json=[{"producto_id": 1, "cantidad": -10}]).status_code == 422
+    assert client.put(f"/carritos/{carrito_b}", json=[{"producto_id": 1, "cantidad": 0}]).status_code == 422
+    assert reservas.reservado(1) == 10
+    assert stock_publicado(1) == 5
+    assert client.patch(f"/carritos/{carrito_b}", json=[{"producto_id": 1, "cantidad": 10}]).status_code == 409
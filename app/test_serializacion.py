@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+from app import config
+from app.main import app
+from app.db.database import carritos_db, productos_db
+from app.serializacion import catalogo_a_json
+
+client = TestClient(app)
+
+def setup_function():
+    """
+    Limpia carritos y productos antes de cada test.
+    """
+    carritos_db.clear()
+    productos_db.clear()
+
+def test_respuesta_rapida_identica_a_pydantic(monkeypatch):
+    """
+    Verifica que el modo de respuesta rápida devuelve exactamente el mismo
+    JSON que el camino con validación de Pydantic, para un carrito y para
+    el catálogo de productos.
+    """
+    productos_db.append({"id": 1, "nombre": "Prod \"rápido\"", "precio": 10.5, "stock": 20})
+    productos_db.append({"id": 2, "nombre": "Prod2", "precio": 3.0, "stock": 7})
+    carrito_id = client.post("/carritos", json={"user_id": "user_rapido"}).json()["id"]
+    client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 2}, {"producto_id": 2, "cantidad": 1}])
+
+    monkeypatch.setattr(config, "RESPUESTA_RAPIDA", False)
+    carrito_pydantic = client.get(f"/carritos/{carrito_id}").content
+    catalogo_pydantic = catalogo_a_json(productos_db)
+
+    monkeypatch.setattr(config, "RESPUESTA_RAPIDA", True)
+    response = client.get(f"/carritos/{carrito_id}")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == carrito_pydantic
+    assert catalogo_a_json(productos_db) == catalogo_pydantic
+
+    creado = client.post("/carritos", json={"user_id": "user_rapido_2"})
+    assert creado.status_code == 201
@@ -0,0 +1,123 @@
+# Pruebas del modo shards: anillo de hashing, stock compartido entre procesos y
+# la aplicación repartida en varios procesos (python -m app.cluster)
+import multiprocessing
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from app.db.stock_compartido import SharedProductStore, crear_stock_compartido
+from app.shards import AnilloConsistente
+
+PRODUCTOS = [{"id": 1, "nombre": "ProdShard", "precio": 10.0, "stock": 150}, {"id": 2, "nombre": "Otro", "precio": 1.0, "stock": 5}]
+
+
+def test_anillo_reparte_y_mueve_pocas_claves():
+    """
+    Las claves se reparten de forma pareja y, al agregar un nodo, solo se
+    mueven las que pasan a ser del nodo nuevo (alrededor de 1/N).
+    """
+    claves = [f"usuario_{i}" for i in range(20000)]
+    antes = AnilloConsistente(range(4))
+    despues = AnilloConsistente(range(5))
+    por_nodo = [0] * 4
+    for clave in claves:
+        por_nodo[antes.nodo(clave)] += 1
+    assert min(por_nodo) > 0.7 * len(claves) / 4
+
+    movidas = [clave for clave in claves if antes.nodo(clave) != despues.nodo(clave)]
+    assert all(despues.nodo(clave) == 4 for clave in movidas)
+    assert len(movidas) < 0.3 * len(claves)
+
+
+def _pagar_muchas_veces(ruta, resultados):
+    productos = SharedProductStore(ruta, PRODUCTOS)
+    exitosos = 0
+    for _ in range(100):
+        if productos.descontar_stock({1: 1, 2: 0}) is None:
+            exitosos += 1
+    resultados.put(exitosos)
+
+
+def test_stock_compartido_entre_procesos(tmp_path):
+    """
+    Cuatro procesos descuentan el mismo stock a la vez: se venden exactamente
+    las unidades disponibles y todos ven el mismo stock y la misma versión.
+    """
+    ruta = str(tmp_path / "stock")
+    crear_stock_compartido(ruta, PRODUCTOS)
+    contexto = multiprocessing.get_context("fork")
+    resultados = contexto.Queue()
+    procesos = [contexto.Process(target=_pagar_muchas_veces, args=(ruta, resultados)) for _ in range(4)]
+    for proceso in procesos:
+        proceso.start()
+    for proceso in procesos:
+        proceso.join()
+
+    assert sum(resultados.get() for _ in procesos) == 150
+    productos = SharedProductStore(ruta, PRODUCTOS)
+    assert productos.get(1)["stock"] == 0
+    assert productos.version == 150
+    assert productos.descontar_stock({1: 1})["nombre"] == "ProdShard"
+
+
+def _puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_cluster_de_shards_enruta_al_dueno():
+    """
+    Levanta tres shards: los carritos se crean en el shard de su usuario, se
+    pueden consultar, modificar y pagar desde cualquier proceso (igual que sus
+    pedidos), el listado reúne todos los shards y el stock es único. Solo los
+    puertos internos aceptan la cabecera de reenvío.
+    """
+    puerto, puerto_interno = _puerto_libre(), _puerto_libre()
+    cluster = subprocess.Popen(
+        [sys.executable, "-m", "app.cluster", "--shards", "3", "--puerto", str(puerto), "--puerto-interno", str(puerto_interno)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        http = httpx.Client(base_url=f"http://127.0.0.1:{puerto}")
+        for _ in range(100):
+            try:
+                # Esperar a que los tres shards (y sus puertos internos) estén listos
+                if all(httpx.get(f"http://127.0.0.1:{puerto_interno + i}/").status_code == 200 for i in range(3)):
+                    break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        carrito_ids = [http.post("/carritos", json={"user_id": f"usuario_{i}"}).json()["id"] for i in range(12)]
+        assert {carrito_id[:2] for carrito_id in carrito_ids} == {"s0", "s1", "s2"}
+        assert http.post("/carritos", json={"user_id": "usuario_3"}).status_code == 409
+        for carrito_id in carrito_ids:
+            assert http.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 1}]).status_code == 200
+        # La cabecera de los reenvios internos no vale en el puerto publico: se rutea igual
+        falsa = {"x-carrito-shard-local": "1"}
+        assert [http.get(f"/carritos/{carrito_id}", headers=falsa).status_code for carrito_id in carrito_ids] == [200] * 12
+
+        vistos, cursor = [], None
+        while True:
+            pagina = http.get("/carritos", params={"limit": 5, **({"cursor": cursor} if cursor else {})}).json()
+            vistos += [carrito["id"] for carrito in pagina["items"]]
+            cursor = pagina["siguiente_cursor"]
+            if cursor is None:
+                break
+        assert sorted(vistos) == sorted(carrito_ids)
+
+        pagos = [http.get(f"/pago/{carrito_id}/") for carrito_id in carrito_ids[:5]]
+        assert [pago.status_code for pago in pagos] == [200] * 5
+        assert http.get("/productos").json()[0]["stock"] == 15 - 5
+        # Los pedidos quedan en el shard de cada usuario y se consultan desde cualquiera
+        for i, pago in enumerate(pagos):
+            numero = pago.json()["numero_seguimiento"]
+            assert http.get(f"/pedidos/{numero}").json()["carrito_id"] == carrito_ids[i]
+            assert [p["numero_seguimiento"] for p in http.get(f"/usuarios/usuario_{i}/pedidos").json()["items"]] == [numero]
+        resultados = http.post("/carritos/bulk", json=[{"operacion": "eliminar", "carrito_id": c} for c in carrito_ids[5:]]).json()
+        assert [r["status_code"] for r in resultados] == [204] * 7
+        assert http.get("/carritos").status_code == 404
+    finally:
+        cluster.terminate()
+        cluster.wait(timeout=10)
@@ -0,0 +1,186 @@
+# Pruebas del backend persistente SQLite
+import os
+import subprocess
+import sys
+from datetime import timedelta
+from app.db.modelos import CarritoCompacto
+from app.db.sqlite import SQLitePool, SQLiteCartStore, SQLiteProductStore
+from app.utils import timestamp_utc
+
+
+def crear_almacenes(tmp_path):
+    """
+    Crea un pool y ambos almacenes sobre un archivo SQLite temporal.
+    """
+    pool = SQLitePool(str(tmp_path / "carritos.db"))
+    productos = SQLiteProductStore(pool, [{"id": 1, "nombre": "ProdSQL", "precio": 10.0, "stock": 5}])
+    carritos = SQLiteCartStore(pool)
+    return pool, productos, carritos
+
+
+def nuevo_carrito(carrito_id, user_id):
+    return CarritoCompacto(carrito_id, user_id)
+
+
+def test_modo_wal_y_productos_iniciales(tmp_path):
+    """
+    Verifica que la base se abre en modo WAL y que los productos
+    iniciales se cargan una única vez, aunque se reabra la base.
+    """
+    pool, productos, _ = crear_almacenes(tmp_path)
+    assert pool.conexion().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert len(productos) == 1
+
+    productos_reabiertos = SQLiteProductStore(SQLitePool(pool.path), [{"id": 2, "nombre": "Otro", "precio": 1.0, "stock": 1}])
+    assert [p["id"] for p in productos_reabiertos] == [1]
+
+
+def test_carritos_persisten_y_son_unicos_por_usuario(tmp_path):
+    """
+    Verifica el alta, la búsqueda por ID y por usuario, la persistencia de
+    los cambios con save() y la restricción de un carrito por usuario.
+    """
+    pool, _, carritos = crear_almacenes(tmp_path)
+    carrito = nuevo_carrito("c1", "u1")
+    assert carritos.add(carrito)
+    assert not carritos.add(nuevo_carrito("c2", "u1"))
+
+    carrito.agregar(1, 2)
+    carrito.actualizado_ts += 1
+    carritos.save(carrito)
+
+    # Otra instancia sobre el mismo archivo (como otro worker) ve los cambios
+    otro_worker = SQLiteCartStore(SQLitePool(pool.path))
+    guardado = otro_worker.get_por_usuario("u1")
+    assert guardado.id == "c1"
+    assert list(guardado.items()) == [(1, 2)]
+    assert guardado.actualizado_en == carrito.actualizado_en
+
+    assert otro_worker.remove(guardado)
+    assert carritos.get("c1") is None
+    assert carritos.add(nuevo_carrito("c3", "u1"))
+
+
+def test_descuento_de_stock_todo_o_nada(tmp_path):
+    """
+    Verifica que el descuento de stock se aplica completo o no se aplica:
+    si un producto no alcanza, el resto tampoco se descuenta.
+    """
+    _, productos, _ = crear_almacenes(tmp_path)
+    productos.append({"id": 2, "nombre": "ProdEscaso", "precio": 3.0, "stock": 1})
+
+    version = productos.version
+    sin_stock = productos.descontar_stock({1: 3, 2: 2})
+    assert sin_stock["id"] == 2
+    assert productos.get(1)["stock"] == 5
+    assert productos.version == version
+
+    assert productos.descontar_stock({1: 3, 2: 1}) is None
+    assert productos.version != version
+    assert productos.get(1)["stock"] == 2
+    assert productos.get(2)["stock"] == 0
+
+
+def test_expirar_carritos_inactivos(tmp_path):
+    """
+    Verifica que expirar() elimina y devuelve solo los carritos
+    actualizados antes del límite.
+    """
+    _, _, carritos = crear_almacenes(tmp_path)
+    viejo = nuevo_carrito("viejo", "u1")
+    viejo.actualizado_ts -= 300
+    carritos.add(viejo)
+    carritos.add(nuevo_carrito("nuevo", "u2"))
+
+    expirados = carritos.expirar(timestamp_utc() - timedelta(minutes=1))
+    assert [c.id for c in expirados] == ["viejo"]
+    assert [c.id for c in carritos] == ["nuevo"]
+
+
+def test_paginar_carritos_por_cursor(tmp_path):
+    """
+    Verifica la paginación por rowid y el filtro por usuario en SQLite.
+    """
+    _, _, carritos = crear_almacenes(tmp_path)
+    for i in range(5):
+        carritos.add(nuevo_carrito(f"c{i}", f"u{i}"))
+
+    pagina1, cursor = carritos.paginar(limite=3)
+    pagina2, fin = carritos.paginar(cursor, limite=3)
+    assert [c.id for c in pagina1 + pagina2] == [f"c{i}" for i in range(5)]
+    assert fin is None
+
+    por_usuario, _ = carritos.paginar(user_id="u3")
+    assert [c.id for c in por_usuario] == ["c3"]
+
+def test_descuento_de_stock_en_lote(tmp_path):
+    """
+    Verifica que un lote de descuentos se aplica en orden en una sola
+    transacción, y que cada descuento sigue siendo todo o nada.
+    """
+    _, productos, _ = crear_almacenes(tmp_path)
+    productos.append({"id": 2, "nombre": "ProdEscaso", "precio": 3.0, "stock": 1})
+
+    resultados = productos.descontar_stock_lote([{1: 3}, {1: 1, 2: 2}, {1: 1, 2: 1}, {1: 3}])
+    assert [r and r["id"] for r in resultados] == [None, 2, None, 1]
+    assert productos.get(1)["stock"] == 1
+    assert productos.get(2)["stock"] == 0
+
+
+def test_espera_del_lock_no_frena_el_event_loop(tmp_path):
+    """
+    Con SQLite, un PATCH que espera el lock de escritura de otro worker corre en
+    un hilo: mientras tanto el mismo event loop sigue atendiendo otras peticiones.
+    El pago y su pedido también pasan por los hilos.
+    """
+    codigo = """
+import sqlite3, sys, threading, time
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as client:
+    carrito_id = client.post("/carritos", json={"user_id": "ana"}).json()["id"]
+    # Otro worker toma el lock de escritura de la base
+    bloqueo = sqlite3.connect(sys.argv[1], isolation_level=None)
+    bloqueo.execute("BEGIN IMMEDIATE")
+    resultado = {}
+    hilo = threading.Thread(target=lambda: resultado.update(patch=client.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 1}]).status_code))
+    hilo.start()
+    time.sleep(0.3)
+    inicio = time.perf_counter()
+    estado = client.get("/productos/1").status_code
+    demora = time.perf_counter() - inicio
+    esperando = hilo.is_alive()
+    bloqueo.execute("COMMIT")
+    hilo.join()
+    numero = client.get(f"/pago/{carrito_id}/").json()["numero_seguimiento"]
+    print(esperando, estado, demora < 1, resultado["patch"], client.get(f"/pedidos/{numero}").json()["items"][0]["cantidad"])
+"""
+    ruta = str(tmp_path / "s.db")
+    entorno = {**os.environ, "CARRITO_BACKEND": "sqlite", "CARRITO_SQLITE_PATH": ruta}
+    salida = subprocess.run([sys.executable, "-c", codigo, ruta], capture_output=True, text=True, check=True, env=entorno, timeout=60).stdout
+    assert salida.split() == ["True", "200", "True", "200", "1"]
+
+
+def test_patch_simultaneos_no_pierden_cambios(tmp_path):
+    """
+    Dos workers SQLite agregan unidades al mismo carrito a la vez, cada uno
+    desde varios hilos: ningún PATCH pisa lo que guardó otro.
+    """
+    codigo = """
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.testclient import TestClient
+from app.main import app
+with TestClient(app) as client, ThreadPoolExecutor(max_workers=10) as executor:
+    patch = lambda _: client.patch(f"/carritos/{sys.argv[1]}", json=[{"producto_id": 2, "cantidad": 1}]).status_code
+    print(*executor.map(patch, range(20)))
+"""
+    ruta = str(tmp_path / "s.db")
+    carritos = SQLiteCartStore(SQLitePool(ruta))
+    carritos.add(nuevo_carrito("c-compartido", "ana"))
+    entorno = {**os.environ, "CARRITO_BACKEND": "sqlite", "CARRITO_SQLITE_PATH": ruta,
+               "CARRITO_MAX_UNIDADES": "100", "CARRITO_MAX_UNIDADES_POR_PRODUCTO": "100"}
+    workers = [subprocess.Popen([sys.executable, "-c", codigo, "c-compartido"], stdout=subprocess.PIPE, text=True, env=entorno) for _ in range(2)]
+    salidas = [worker.communicate(timeout=60)[0].split() for worker in workers]
+    assert salidas == [["200"] * 20] * 2
+    assert carritos.get("c-compartido").cantidad(2) == 40
@@ -1,26 +1,62 @@
+import asyncio
+import time
 from datetime import datetime, timezone, timedelta
+from app.config import BACKEND_DB, TTL_CARRITO_MINUTOS
 from app.db.database import carritos_db, productos_db
 
+# Con SQLite una operacion del almacen puede esperar el lock de escritura de otro
+# worker (hasta el timeout de la conexion); en memoria nunca espera
+ALMACEN_BLOQUEANTE = BACKEND_DB == "sqlite"
+
 # Funcion para setear el timestamp en un carrito
 def timestamp_utc():
     return datetime.now(timezone.utc)
 
-# Funcion para saber si un carrito estuvo inactivo por mas de 3 minutos
-def carrito_inactivo(carrito, limite_minutos=1):
-    hora_actual = timestamp_utc()
-    duracion_inactividad = hora_actual - carrito["actualizado_en"]
-    return duracion_inactividad.total_seconds() > limite_minutos * 60
+# Funcion para saber si un carrito estuvo inactivo por mas del TTL configurado
+# Acepta un CarritoCompacto o un diccionario con "actualizado_en" (datetime)
+def carrito_inactivo(carrito, limite_minutos=TTL_CARRITO_MINUTOS):
+    if isinstance(carrito, dict):
+        actualizado_ts = carrito["actualizado_en"].timestamp()
+    else:
+        actualizado_ts = carrito.actualizado_ts
+    duracion_inactividad = time.time() - actualizado_ts
+    return duracion_inactividad > limite_minutos * 60
 
-# Funcion para comprobar un carrito existente
+# Funcion para comprobar un carrito existente (busqueda O(1) por indice)
 def encontrar_carrito(carrito_id: str):
-    for carrito in carritos_db:
-        if carrito["id"] == carrito_id:
-            return carrito
-    return None
+    return carritos_db.get(carrito_id)
 
-# Funcion para comprobar un producto existente
+# Funcion para comprobar un producto existente (busqueda O(1) por indice)
 def encontrar_producto(producto_id: str):
-    for producto in productos_db:
-        if producto["id"] == producto_id:
-            return producto
-    return None
\ No newline at end of file
+    return productos_db.get(producto_id)
+
+# Funcion para ejecutar trabajo sobre los almacenes desde un handler async.
+# En memoria se ejecuta en el lugar: sin awaits intermedios cada operacion es
+# atomica en el event loop. Con un almacen bloqueante se ejecuta en un hilo, asi
+# una espera del lock de SQLite no frena las demas conexiones del worker.
+# asyncio.to_thread copia el contexto: las fases de las trazas se siguen marcando.
+async def en_almacen(funcion, *args):
+    if ALMACEN_BLOQUEANTE:
+        return await asyncio.to_thread(funcion, *args)
+    return funcion(*args)
+
+# Funcion para completar un futuro de asyncio desde cualquier hilo o event loop
+# (con TestClient o varios hilos, quien espera puede estar en otro loop).
+# Si el futuro ya se completo o se cancelo mientras esperaba, no hace nada.
+def completar_futuro(loop, futuro, resultado=None, error=None):
+    try:
+        mismo_loop = asyncio.get_running_loop() is loop
+    except RuntimeError:
+        mismo_loop = False
+    if mismo_loop:
+        _completar(futuro, resultado, error)
+    elif not loop.is_closed():
+        loop.call_soon_threadsafe(_completar, futuro, resultado, error)
+
+def _completar(futuro, resultado, error):
+    if futuro.done():
+        return
+    if error is None:
+        futuro.set_result(resultado)
+    else:
+        futuro.set_exception(error)
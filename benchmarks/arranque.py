@@ -0,0 +1,114 @@
+# benchmarks/arranque.py
+# Perfil del arranque de un worker: tiempo de importacion por modulo (python -X
+# importtime) y tiempo desde que se lanza el proceso de uvicorn hasta que responde
+# la primera peticion y el primer /openapi.json. Compara el arranque normal con el
+# modo de arranque rapido (CARRITO_ARRANQUE_RAPIDO=1 con el esquema precalculado).
+#
+# Uso:
+#     python -m benchmarks.arranque [--repeticiones 5] [--modulos 15]
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def _puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def perfil_importacion(entorno):
+    """
+    Importa app.main en un proceso nuevo con -X importtime y devuelve una lista
+    de (modulo, propio_us, acumulado_us) en el orden en que terminaron de importarse.
+    """
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=entorno, capture_output=True, text=True, check=True,
+    ).stderr
+    modulos = []
+    for linea in salida.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, modulo = linea[len("import time:"):].split("|")
+        modulos.append((modulo.strip(), int(propio), int(acumulado)))
+    return modulos
+
+
+def primera_peticion(entorno):
+    """
+    Lanza uvicorn y devuelve los segundos hasta la primera respuesta de
+    GET /productos y, a continuacion, de GET /openapi.json.
+    """
+    puerto = _puerto_libre()
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{puerto}") as http:
+            while True:
+                try:
+                    if http.get("/productos").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.002)
+            primera = time.perf_counter() - inicio
+            inicio_openapi = time.perf_counter()
+            http.get("/openapi.json").raise_for_status()
+            return primera, time.perf_counter() - inicio_openapi
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def informe_importacion(nombre, modulos, cantidad):
+    total = sum(propio for _, propio, _ in modulos) / 1000
+    print(f"\n== Importacion de app.main ({nombre}): {total:.0f} ms")
+    print(f"{'modulo':<48}{'propio ms':>11}{'acumulado ms':>14}")
+    for modulo, propio, acumulado in sorted(modulos, key=lambda m: m[1], reverse=True)[:cantidad]:
+        print(f"{modulo:<48}{propio / 1000:>11.1f}{acumulado / 1000:>14.1f}")
+    propios = [m for m in modulos if m[0].startswith("app")]
+    print(f"{'(modulos de app)':<48}{sum(m[1] for m in propios) / 1000:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfil de importacion y tiempo hasta la primera peticion")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--modulos", type=int, default=15, help="modulos mas lentos a listar")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        esquema = os.path.join(directorio, "openapi.json")
+        subprocess.run([sys.executable, "-m", "app.openapi_estatico", "--salida", esquema], check=True, capture_output=True)
+        base = dict(os.environ, PYTHONPATH=os.getcwd())
+        modos = {
+            "normal": dict(base, CARRITO_ARRANQUE_RAPIDO="0"),
+            "arranque rapido": dict(base, CARRITO_ARRANQUE_RAPIDO="1", CARRITO_OPENAPI=esquema),
+        }
+
+        resultados = {}
+        for nombre, entorno in modos.items():
+            informe_importacion(nombre, perfil_importacion(entorno), args.modulos)
+            mediciones = [primera_peticion(entorno) for _ in range(args.repeticiones)]
+            resultados[nombre] = (
+                statistics.median(primera for primera, _ in mediciones),
+                statistics.median(openapi for _, openapi in mediciones),
+            )
+
+    print(f"\n== Mediana de {args.repeticiones} arranques de uvicorn")
+    print(f"{'modo':<18}{'1a peticion ms':>16}{'1er openapi ms':>16}")
+    for nombre, (primera, openapi) in resultados.items():
+        print(f"{nombre:<18}{primera * 1000:>16.0f}{openapi * 1000:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
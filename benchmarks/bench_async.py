@@ -0,0 +1,123 @@
+# benchmarks/bench_async.py
+# Compara los endpoints async contra el despacho sincronico (threadpool) que
+# usaba la API antes, con 1000 clientes concurrentes contra la app ASGI en proceso.
+#
+# Uso:
+#     python -m benchmarks.bench_async [--clientes 1000] [--peticiones 20] [--salida resultados.json]
+import argparse
+import asyncio
+import inspect
+import json
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+
+from app.main import app
+from app.db.database import carritos_db, productos_db
+from app.routers import carritos, productos
+
+
+def como_sync(endpoint):
+    """
+    Version sincronica de un endpoint async que no suspende su ejecucion.
+    FastAPI la despacha al threadpool, igual que los handlers `def` originales.
+    """
+    def sync(*args, **kwargs):
+        corutina = endpoint(*args, **kwargs)
+        try:
+            corutina.send(None)
+        except StopIteration as fin:
+            return fin.value
+        corutina.close()
+        raise RuntimeError(f"{endpoint.__name__} suspendio su ejecucion")
+
+    # Se copia la firma sin __wrapped__ para que FastAPI no la detecte como corutina
+    sync.__signature__ = inspect.signature(endpoint)
+    sync.__name__ = endpoint.__name__
+    return sync
+
+
+def app_sincronica():
+    """
+    Copia de la app con los mismos endpoints pero despachados al threadpool.
+    """
+    app_sync = FastAPI()
+    for ruta in carritos.router.routes + productos.router.routes:
+        if isinstance(ruta, APIRoute):
+            app_sync.add_api_route(
+                ruta.path,
+                como_sync(ruta.endpoint),
+                methods=list(ruta.methods),
+                response_model=ruta.response_model,
+                status_code=ruta.status_code,
+            )
+    return app_sync
+
+
+def preparar_datos():
+    productos_db.clear()
+    productos_db.append({"id": 1, "nombre": "ProdBench", "precio": 10.0, "stock": 10**9})
+    carritos_db.clear()
+
+
+def percentil(latencias, p):
+    ordenadas = sorted(latencias)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))]
+
+
+async def medir(app_asgi, clientes, peticiones):
+    """
+    Cada cliente crea su carrito y luego alterna GET del carrito, PATCH y GET /productos.
+    Devuelve peticiones por segundo y percentiles de latencia en milisegundos.
+    """
+    latencias = []
+    transporte = httpx.ASGITransport(app=app_asgi)
+
+    async def cliente(numero, http):
+        carrito_id = (await http.post("/carritos", json={"user_id": f"bench_{numero}"})).json()["id"]
+        for i in range(peticiones):
+            inicio = time.perf_counter()
+            if i % 3 == 0:
+                await http.get(f"/carritos/{carrito_id}")
+            elif i % 3 == 1:
+                await http.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 1, "cantidad": 1}] if i < 10 else [])
+            else:
+                await http.get("/productos")
+            latencias.append(time.perf_counter() - inicio)
+
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(n, http) for n in range(clientes)))
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "peticiones": len(latencias),
+        "peticiones_por_segundo": len(latencias) / duracion,
+        "p50_ms": percentil(latencias, 0.50) * 1000,
+        "p99_ms": percentil(latencias, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clientes", type=int, default=1000)
+    parser.add_argument("--peticiones", type=int, default=20)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    resultados = {}
+    for nombre, app_asgi in (("sync_threadpool", app_sincronica()), ("async", app)):
+        preparar_datos()
+        resultados[nombre] = asyncio.run(medir(app_asgi, args.clientes, args.peticiones))
+        print(f"{nombre:>16}: {resultados[nombre]['peticiones_por_segundo']:10.0f} req/s   "
+              f"p50 {resultados[nombre]['p50_ms']:8.2f} ms   p99 {resultados[nombre]['p99_ms']:8.2f} ms")
+
+    if args.salida:
+        with open(args.salida, "w") as archivo:
+            json.dump(resultados, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
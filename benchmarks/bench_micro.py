@@ -0,0 +1,81 @@
+# benchmarks/bench_micro.py
+# Micro-benchmarks (pytest-benchmark) de las busquedas y validaciones de carritos
+# con tablas de 10, 10 mil y 1 millon de carritos.
+#
+# Uso:
+#     pytest benchmarks/bench_micro.py --benchmark-json=bench_micro.json
+#     pytest benchmarks/bench_micro.py --benchmark-compare  # contra la ultima corrida guardada
+# Los tamaños se pueden limitar con BENCH_TAMANIOS=10,10000
+import os
+
+import pytest
+
+from app.db.database import carritos_db, productos_db
+from app.db.modelos import CarritoCompacto
+from app.indice_productos import indice_productos
+from app.routers.carritos import _agregar_items
+from app.schemas.carrito import ItemCarritoBase
+from app.utils import carrito_inactivo, encontrar_carrito, encontrar_producto
+
+TAMANIOS = [int(t) for t in os.environ.get("BENCH_TAMANIOS", "10,10000,1000000").split(",")]
+
+
+@pytest.fixture(scope="module", params=TAMANIOS, ids=lambda t: f"{t}_carritos")
+def tamanio(request):
+    """
+    Llena las tablas de carritos y productos con `tamanio` registros.
+    """
+    cantidad = request.param
+    carritos_db.clear()
+    productos_db.clear()
+    for i in range(cantidad):
+        carritos_db.add(CarritoCompacto(f"carrito-{i}", f"user-{i}"))
+        productos_db.append({"id": i, "nombre": f"Producto {i}", "precio": 10.0 + i % 1000, "stock": 1000})
+    yield cantidad
+    carritos_db.clear()
+    productos_db.clear()
+
+
+def test_encontrar_carrito(benchmark, tamanio):
+    # El ultimo carrito dado de alta: el peor caso de la antigua busqueda lineal
+    carrito_id = f"carrito-{tamanio - 1}"
+    assert benchmark(encontrar_carrito, carrito_id).id == carrito_id
+
+
+def test_encontrar_producto(benchmark, tamanio):
+    assert benchmark(encontrar_producto, tamanio - 1)["id"] == tamanio - 1
+
+
+def test_carrito_inactivo(benchmark, tamanio):
+    carrito = encontrar_carrito("carrito-0")
+    assert benchmark(carrito_inactivo, carrito, 1) is False
+
+
+def test_agregar_items(benchmark, tamanio):
+    """
+    Agrupacion de cantidades y reglas de fraude de PATCH /carritos/{id}
+    sobre un carrito con varios productos.
+    """
+    carrito = encontrar_carrito("carrito-0")
+    items = [ItemCarritoBase(producto_id=i % min(tamanio, 5), cantidad=1) for i in range(5)]
+
+    def vaciar_carrito():
+        carrito.reemplazar_items([(0, 2, 0.0)])
+        carrito.tocar()
+
+    resultado = benchmark.pedantic(_agregar_items, args=("carrito-0", items), setup=vaciar_carrito, rounds=2000)
+    assert sum(resultado.cantidades) == 7
+
+
+def test_buscar_productos_por_nombre(benchmark, tamanio):
+    # Subcadena del nombre: interseccion de listas de trigramas
+    indice_productos.buscar(q="x")  # construye los indices fuera de la medicion
+    resultado = benchmark(indice_productos.buscar, q=f"cto {tamanio - 1}")
+    assert resultado[-1]["id"] == tamanio - 1
+
+
+def test_buscar_productos_por_precio(benchmark, tamanio):
+    # Rango de precios con bisect, ordenado por precio y cortado en el limite
+    indice_productos.buscar(q="x")
+    resultado = benchmark(indice_productos.buscar, min_precio=500, max_precio=510, orden="precio", limite=20)
+    assert all(500 <= p["precio"] <= 510 for p in resultado)
@@ -0,0 +1,70 @@
+# benchmarks/bench_serializacion.py
+# Compara la serializacion con validacion de Pydantic contra el modo de
+# respuesta rapida (orjson) en GET /carritos/{id} y GET /productos.
+# Para GET /productos se descuenta stock antes de cada peticion, de modo que
+# cada respuesta regenera el catalogo (el peor caso de la cache).
+#
+# Uso:
+#     python -m benchmarks.bench_serializacion [--peticiones 2000] [--productos 1000]
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app import config
+from app.main import app
+from app.db.database import carritos_db, productos_db
+from app.serializacion import carrito_a_json
+
+
+def preparar_datos(cantidad_productos):
+    carritos_db.clear()
+    productos_db.clear()
+    for pid in range(1, cantidad_productos + 1):
+        productos_db.append({"id": pid, "nombre": f"Producto {pid}", "precio": 9.99 + pid, "stock": 10**9})
+
+
+async def medir(peticiones):
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as http:
+        carrito_id = (await http.post("/carritos", json={"user_id": f"bench_{time.time()}"})).json()["id"]
+        await http.patch(f"/carritos/{carrito_id}", json=[{"producto_id": pid, "cantidad": 1} for pid in range(1, 6)])
+
+        inicio = time.perf_counter()
+        for _ in range(peticiones):
+            await http.get(f"/carritos/{carrito_id}")
+        carrito_us = (time.perf_counter() - inicio) / peticiones * 1e6
+
+        inicio = time.perf_counter()
+        for _ in range(peticiones // 10):
+            productos_db.descontar_stock({1: 1})
+            await http.get("/productos")
+        productos_us = (time.perf_counter() - inicio) / (peticiones // 10) * 1e6
+
+    # Solo la serializacion del carrito (validacion + JSON), sin el resto del ciclo HTTP
+    carrito = carritos_db.get(carrito_id)
+    inicio = time.perf_counter()
+    for _ in range(peticiones):
+        carrito_a_json(carrito)
+    serializacion_us = (time.perf_counter() - inicio) / peticiones * 1e6
+
+    return carrito_us, productos_us, serializacion_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pydantic vs respuesta rapida (orjson)")
+    parser.add_argument("--peticiones", type=int, default=2000)
+    parser.add_argument("--productos", type=int, default=1000)
+    args = parser.parse_args()
+
+    for nombre, rapida in (("pydantic", False), ("rapida", True)):
+        config.RESPUESTA_RAPIDA = rapida
+        preparar_datos(args.productos)
+        carrito_us, productos_us, serializacion_us = asyncio.run(medir(args.peticiones))
+        print(f"{nombre:>9}: GET /carritos/{{id}} {carrito_us:7.1f} us (serializacion {serializacion_us:5.1f} us)   "
+              f"GET /productos ({args.productos} productos, sin cache) {productos_us:7.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# benchmarks/carga.py
+# Generador de carga en proceso: clientes concurrentes que crean carritos,
+# agregan productos, los consultan y los pagan o eliminan, contra la app ASGI
+# (sin red ni servidor). Informa throughput y percentiles de latencia.
+#
+# Uso:
+#     python -m benchmarks.carga --clientes 200 --sesiones 20 --salida carga.json
+#     python -m benchmarks.carga --comparar carga.json   # falla si hay regresion
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+
+import httpx
+
+from app.main import app
+from app.db.database import carritos_db, productos_db
+from benchmarks.bench_async import percentil
+
+PRODUCTOS = 20
+
+
+def preparar_datos():
+    carritos_db.clear()
+    productos_db.clear()
+    for pid in range(1, PRODUCTOS + 1):
+        productos_db.append({"id": pid, "nombre": f"ProdCarga{pid}", "precio": 10.0 + pid, "stock": 10**9})
+
+
+async def ejecutar_carga(clientes, sesiones, proporcion_pago, semilla):
+    """
+    Cada sesion: POST /carritos, 1 a 3 PATCH, GET del carrito y luego
+    GET /pago (con probabilidad proporcion_pago) o DELETE.
+    """
+    latencias = defaultdict(list)
+    estados = Counter()
+    azar = random.Random(semilla)
+
+    async def medir(operacion, peticion):
+        inicio = time.perf_counter()
+        respuesta = await peticion
+        latencias[operacion].append(time.perf_counter() - inicio)
+        estados[f"{operacion} {respuesta.status_code}"] += 1
+        return respuesta
+
+    async def cliente(numero, http):
+        for sesion in range(sesiones):
+            creado = await medir("crear", http.post("/carritos", json={"user_id": f"carga_{numero}_{sesion}"}))
+            carrito_id = creado.json()["id"]
+            for _ in range(azar.randint(1, 3)):
+                items = [{"producto_id": azar.randint(1, PRODUCTOS), "cantidad": azar.randint(1, 2)}]
+                await medir("agregar", http.patch(f"/carritos/{carrito_id}", json=items))
+            await medir("consultar", http.get(f"/carritos/{carrito_id}"))
+            if azar.random() < proporcion_pago:
+                await medir("pagar", http.get(f"/pago/{carrito_id}/"))
+            else:
+                await medir("eliminar", http.delete(f"/carritos/{carrito_id}"))
+
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://carga") as http:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(n, http) for n in range(clientes)))
+        duracion = time.perf_counter() - inicio
+
+    todas = [latencia for lista in latencias.values() for latencia in lista]
+    return {
+        "clientes": clientes,
+        "peticiones": len(todas),
+        "duracion_segundos": duracion,
+        "peticiones_por_segundo": len(todas) / duracion,
+        "latencia_ms": _percentiles(todas),
+        "por_operacion": {operacion: _percentiles(lista) for operacion, lista in latencias.items()},
+        "estados": dict(estados),
+    }
+
+
+def _percentiles(latencias):
+    return {f"p{int(p * 100)}": percentil(latencias, p) * 1000 for p in (0.5, 0.9, 0.99)}
+
+
+def comparar(actual, base, tolerancia):
+    """
+    Devuelve la lista de regresiones respecto de una corrida anterior.
+    """
+    regresiones = []
+    if actual["peticiones_por_segundo"] < base["peticiones_por_segundo"] * (1 - tolerancia):
+        regresiones.append(f"throughput {actual['peticiones_por_segundo']:.0f} < {base['peticiones_por_segundo']:.0f} req/s")
+    if actual["latencia_ms"]["p99"] > base["latencia_ms"]["p99"] * (1 + tolerancia):
+        regresiones.append(f"p99 {actual['latencia_ms']['p99']:.2f} > {base['latencia_ms']['p99']:.2f} ms")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga en proceso para la API de carritos")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--sesiones", type=int, default=20)
+    parser.add_argument("--proporcion-pago", type=float, default=0.5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", help="Resultados JSON de referencia para detectar regresiones")
+    parser.add_argument("--tolerancia", type=float, default=0.2)
+    args = parser.parse_args()
+
+    preparar_datos()
+    resultado = asyncio.run(ejecutar_carga(args.clientes, args.sesiones, args.proporcion_pago, args.semilla))
+    print(json.dumps(resultado, indent=2))
+
+    if args.salida:
+        with open(args.salida, "w") as archivo:
+            json.dump(resultado, archivo, indent=2)
+
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            regresiones = comparar(resultado, json.load(archivo), args.tolerancia)
+        for regresion in regresiones:
+            print(f"REGRESION: {regresion}", file=sys.stderr)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# benchmarks/escalado_shards.py
+# Mide como escala el throughput del modo shards con la cantidad de procesos.
+# Para cada cantidad de shards levanta `python -m app.cluster` y lo carga desde
+# varios procesos cliente (crear carrito, agregar, consultar, eliminar) por
+# red local durante unos segundos.
+#
+# Uso:
+#     python -m benchmarks.escalado_shards [--shards 1 2 4] [--clientes 4] [--concurrencia 32] [--segundos 10]
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def _puerto_libre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _cargar(url, proceso, concurrencia, segundos):
+    peticiones = 0
+    fin = time.perf_counter() + segundos
+
+    async def sesiones(numero, http):
+        nonlocal peticiones
+        sesion = 0
+        while time.perf_counter() < fin:
+            user_id = f"escala_{proceso}_{numero}_{sesion}"
+            carrito_id = (await http.post("/carritos", json={"user_id": user_id})).json()["id"]
+            await http.patch(f"/carritos/{carrito_id}", json=[{"producto_id": 2, "cantidad": 1}])
+            await http.get(f"/carritos/{carrito_id}")
+            await http.delete(f"/carritos/{carrito_id}")
+            peticiones += 4
+            sesion += 1
+
+    limites = httpx.Limits(max_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=30) as http:
+        await asyncio.gather(*(sesiones(n, http) for n in range(concurrencia)))
+    return peticiones
+
+
+def _cliente(args):
+    return asyncio.run(_cargar(*args))
+
+
+def medir(shards, clientes, concurrencia, segundos):
+    puerto, puerto_interno = _puerto_libre(), _puerto_libre()
+    cluster = subprocess.Popen(
+        [sys.executable, "-m", "app.cluster", "--shards", str(shards), "--puerto", str(puerto), "--puerto-interno", str(puerto_interno)],
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(200):
+            try:
+                if all(httpx.get(f"http://127.0.0.1:{puerto_interno + i}/").status_code == 200 for i in range(shards)):
+                    break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        url = f"http://127.0.0.1:{puerto}"
+        with multiprocessing.get_context("spawn").Pool(clientes) as pool:
+            inicio = time.perf_counter()
+            peticiones = sum(pool.map(_cliente, [(url, p, concurrencia, segundos) for p in range(clientes)]))
+            duracion = time.perf_counter() - inicio
+        return peticiones / duracion
+    finally:
+        cluster.terminate()
+        cluster.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput del modo shards segun la cantidad de procesos")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clientes", type=int, default=4, help="procesos que generan carga")
+    parser.add_argument("--concurrencia", type=int, default=32, help="sesiones simultaneas por proceso cliente")
+    parser.add_argument("--segundos", type=float, default=10)
+    args = parser.parse_args()
+
+    base = None
+    for shards in args.shards:
+        throughput = medir(shards, args.clientes, args.concurrencia, args.segundos)
+        base = base or throughput
+        print(f"{shards:3d} shards: {throughput:9.0f} req/s  ({throughput / base:.2f}x)", flush=True)
+
+
+if __name__ == "__main__":
+    main()
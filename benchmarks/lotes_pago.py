@@ -0,0 +1,90 @@
+# benchmarks/lotes_pago.py
+# Compara el descuento de stock de los pagos uno por uno contra los micro-lotes,
+# con muchos pagos simultaneos que compiten por unos pocos productos (venta
+# flash). Cada cliente es una corrutina que paga en bucle; con --hilos > 1 los
+# clientes se reparten en varios hilos con su propio event loop, como los
+# workers del threadpool. Se mide para cada backend: memoria, memoria con
+# diario de eventos, stock compartido del modo shards y SQLite.
+#
+# Uso:
+#     python -m benchmarks.lotes_pago [--pagos 20000] [--clientes 1000] [--productos 4] [--hilos 1] [--ventana-ms 2]
+import argparse
+import asyncio
+import tempfile
+import threading
+import time
+
+from app.db.database import ProductStore
+from app.db.diario import Diario, ProductStoreDiario
+from app.db.sqlite import SQLitePool, SQLiteProductStore
+from app.db.stock_compartido import SharedProductStore, crear_stock_compartido
+from app.lotes_pago import LotesDescuento
+
+
+def catalogo(productos):
+    return [{"id": pid, "nombre": f"Oferta {pid}", "precio": 10.0, "stock": 10**9} for pid in range(1, productos + 1)]
+
+
+async def _clientes(pipeline, clientes, pagos, productos):
+    pendientes = [pagos]
+
+    async def cliente(numero):
+        pid = 1 + numero % productos
+        while pendientes[0] > 0:
+            pendientes[0] -= 1
+            # Carritos de uno o dos productos calientes
+            cantidades = {pid: 1} if numero % 2 else {pid: 1, 1 + (pid % productos): 1}
+            assert await pipeline.descontar(cantidades) is None
+
+    await asyncio.gather(*(cliente(numero) for numero in range(clientes)))
+
+
+def stock_compartido(ruta, productos):
+    crear_stock_compartido(ruta, productos)
+    return SharedProductStore(ruta, productos)
+
+
+def medir(almacen, ventana_ms, args):
+    pipeline = LotesDescuento(almacen, ventana_ms=ventana_ms, maximo=args.maximo)
+    por_hilo = args.pagos // args.hilos
+    hilos = [
+        threading.Thread(target=asyncio.run, args=(_clientes(pipeline, args.clientes // args.hilos, por_hilo, args.productos),))
+        for _ in range(args.hilos)
+    ]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return por_hilo * args.hilos / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de pagos con y sin micro-lotes de descuento de stock")
+    parser.add_argument("--pagos", type=int, default=20_000)
+    parser.add_argument("--clientes", type=int, default=1000, help="pagos simultaneos")
+    parser.add_argument("--productos", type=int, default=4, help="productos calientes")
+    parser.add_argument("--hilos", type=int, default=1)
+    parser.add_argument("--ventana-ms", type=float, default=2)
+    parser.add_argument("--maximo", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        diario = Diario(directorio, 0)
+        backends = {
+            "memoria": lambda: ProductStore(catalogo(args.productos)),
+            "memoria+diario": lambda: ProductStoreDiario(catalogo(args.productos), diario),
+            "compartido": lambda: stock_compartido(f"{directorio}/stock-{time.monotonic_ns()}", catalogo(args.productos)),
+            "sqlite": lambda: SQLiteProductStore(SQLitePool(f"{directorio}/bench-{time.monotonic_ns()}.db"), catalogo(args.productos)),
+        }
+        print(f"{args.pagos} pagos, {args.clientes} clientes, {args.productos} productos, {args.hilos} hilo(s)")
+        print(f"{'backend':<16}{'uno por uno':>14}{'en lotes':>14}{'mejora':>9}")
+        for nombre, crear in backends.items():
+            individual = medir(crear(), 0, args)
+            en_lotes = medir(crear(), args.ventana_ms, args)
+            print(f"{nombre:<16}{individual:>10.0f} p/s{en_lotes:>10.0f} p/s{en_lotes / individual:>8.2f}x")
+        diario.cerrar()
+
+
+if __name__ == "__main__":
+    main()
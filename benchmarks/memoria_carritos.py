@@ -0,0 +1,53 @@
+# benchmarks/memoria_carritos.py
+# Mide la memoria por carrito de la representacion como diccionario (la original:
+# dict con lista de dicts por item y dos datetime) contra CarritoCompacto.
+#
+# Uso:
+#     python -m benchmarks.memoria_carritos [--carritos 100000] [--items 3]
+import argparse
+import gc
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from app.db.modelos import CarritoCompacto
+
+
+def carrito_dict(items):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "items": [{"producto_id": pid, "cantidad": 2} for pid in range(items)],
+        "creado_en": datetime.now(timezone.utc),
+        "actualizado_en": datetime.now(timezone.utc),
+    }
+
+
+def carrito_compacto(items):
+    return CarritoCompacto(str(uuid.uuid4()), str(uuid.uuid4()), items=[(pid, 2) for pid in range(items)])
+
+
+def bytes_por_carrito(fabrica, carritos, items):
+    gc.collect()
+    tracemalloc.start()
+    creados = [fabrica(items) for _ in range(carritos)]
+    usados, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del creados
+    return usados / carritos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por carrito: dict vs CarritoCompacto")
+    parser.add_argument("--carritos", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=3)
+    args = parser.parse_args()
+
+    antes = bytes_por_carrito(carrito_dict, args.carritos, args.items)
+    despues = bytes_por_carrito(carrito_compacto, args.carritos, args.items)
+    print(f"dict:            {antes:8.0f} bytes/carrito")
+    print(f"CarritoCompacto: {despues:8.0f} bytes/carrito  ({antes / despues:.1f}x menos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+# benchmarks/recuperacion_diario.py
+# Mide cuanto tarda en recuperarse el backend en memoria con diario de eventos:
+# un snapshot con N carritos mas una cola de eventos del diario.
+#
+# Uso:
+#     python -m benchmarks.recuperacion_diario [--carritos 1000000] [--eventos 100000]
+import argparse
+import tempfile
+import time
+
+from app.db.database import PRODUCTOS_INICIALES
+from app.db.diario import recuperar
+from app.db.modelos import CarritoCompacto
+
+
+def poblar(persistencia, desde, hasta):
+    for i in range(desde, hasta):
+        carrito = CarritoCompacto(f"carrito-{i}", f"usuario-{i}", items=[(1 + i % 4, 1), (1 + (i + 1) % 4, 2)])
+        persistencia.carritos.add(carrito)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de recuperacion: snapshot + cola del diario")
+    parser.add_argument("--carritos", type=int, default=1_000_000, help="carritos en el snapshot")
+    parser.add_argument("--eventos", type=int, default=100_000, help="carritos creados despues del snapshot")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        persistencia = recuperar(directorio, PRODUCTOS_INICIALES)
+        poblar(persistencia, 0, args.carritos)
+        inicio = time.perf_counter()
+        persistencia.tomar_snapshot()
+        print(f"snapshot de {args.carritos} carritos: {time.perf_counter() - inicio:.2f} s")
+        poblar(persistencia, args.carritos, args.carritos + args.eventos)
+        persistencia.cerrar()
+
+        recuperada = recuperar(directorio, PRODUCTOS_INICIALES)
+        print(
+            f"recuperacion de {len(recuperada.carritos)} carritos "
+            f"({recuperada.eventos_reaplicados} eventos del diario): {recuperada.duracion_recuperacion:.2f} s"
+        )
+        recuperada.cerrar()
+
+
+if __name__ == "__main__":
+    main()